@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import random
+from io import BytesIO
+
+import aiohttp
+from telebot.async_telebot import AsyncTeleBot
+
+import config
+import conversation
+import database
+import diary
+import flood_control
+import image_cache
+import messages
+import metrics
+import reminders
+import render_cache
+import user_writer
+import webhook
+from router import Router
+
+# asyncio runtime (config.RUNTIME = "asyncio"). Handlers mirror main.py; the
+# blocking sqlite and disk calls run in the default thread pool so they never
+# stall the event loop, and images are fetched with aiohttp.
+
+bot = AsyncTeleBot(config.TOKEN)
+router = Router(flood_control.limiter, conversation.sessions)
+_http = None
+_fetching = set()
+# Reminders go out through main.broadcaster in both runtimes; main.run() sets
+# it, so a chat that unblocks the bot here is delivered to again
+broadcaster = None
+
+async def db(func, *args):
+    """Run a blocking database (or disk) call off the event loop."""
+    return await asyncio.to_thread(func, *args)
+
+async def fetch_image(url):
+    cache = image_cache.get_cache()
+    if url in _fetching:
+        return False
+    _fetching.add(url)
+    try:
+        with metrics.timer(metrics.IMAGE_FETCH_SECONDS):
+            async with _http.get(url, headers=cache.request_headers(url)) as response:
+                content = await response.read()
+        return await db(cache.store, url, response.status, content, response.headers)
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке изображения {url}: {str(e)}")
+        return False
+    finally:
+        _fetching.discard(url)
+
+async def prefetch_images():
+    semaphore = asyncio.Semaphore(config.IMAGE_PREFETCH_WORKERS)
+    await asyncio.sleep(config.IMAGE_PREFETCH_DELAY)
+
+    async def fetch(url):
+        async with semaphore:
+            return await fetch_image(url)
+
+    while True:
+        try:
+            urls = await db(database.get_recipe_image_urls)
+            results = await asyncio.gather(*[fetch(url) for url in urls])
+            logging.info(f"Кэш изображений прогрет: {sum(results)} из {len(results)} доступны локально")
+        except Exception as e:
+            logging.error(f"Ошибка при прогреве кэша изображений: {str(e)}")
+        await asyncio.sleep(config.IMAGE_REVALIDATE_INTERVAL)
+
+@router.command('start')
+async def start(message):
+    user_id = message.from_user.id
+    first_name = message.from_user.first_name
+    chat_id = message.chat.id
+    user_writer.writer.unblock(chat_id)
+    if broadcaster is not None:
+        broadcaster.unblock(chat_id)
+
+    if await db(user_writer.writer.register, user_id, message.from_user.username, first_name,
+                message.from_user.last_name, chat_id):
+        await bot.reply_to(message, messages.welcome(first_name))
+    else:
+        await bot.reply_to(message, messages.welcome_back(first_name))
+
+@router.command('reg')
+async def reg(message):
+    user_id = message.from_user.id
+
+    if await db(user_writer.writer.register, user_id, message.from_user.username, message.from_user.first_name,
+                message.from_user.last_name, message.chat.id):
+        await bot.reply_to(message, messages.REGISTERED)
+    else:
+        await bot.reply_to(message, messages.ALREADY_REGISTERED)
+
+@router.command('plan')
+async def plan(message):
+    await bot.reply_to(message, messages.CHOOSE_GOAL, reply_markup=render_cache.goal_keyboard())
+
+@router.text(*messages.GOAL_BUTTONS)
+async def create_plan(message):
+    goal = message.text.split(' ')[0]
+    plan_text = await db(render_cache.plan_text, goal)
+
+    await bot.reply_to(message, plan_text, reply_markup=render_cache.remove_keyboard())
+    await bot.send_message(message.chat.id, messages.PLAN_FOLLOWUP)
+
+@router.command('targets')
+async def targets(message):
+    import meal_planner
+
+    args = message.text.split()[1:]
+    if not args:
+        current = await db(database.get_user_targets, message.from_user.id)
+        await bot.reply_to(message, messages.targets_text(current) if current else messages.TARGETS_USAGE)
+        return
+    parsed = meal_planner.parse_targets(args)
+    if parsed is None:
+        await bot.reply_to(message, messages.TARGETS_USAGE)
+        return
+    await db(database.set_user_targets, message.from_user.id, *parsed)
+    await bot.reply_to(message, messages.targets_text(parsed))
+
+@router.command('myplan')
+async def my_plan(message):
+    import meal_planner
+
+    user_targets = await db(database.get_user_targets, message.from_user.id)
+    default = user_targets is None
+    week = tuple(diary.today().isocalendar())[:2]
+    text = await db(render_cache.weekly_plan, message.from_user.id, user_targets or meal_planner.default_targets(), week, default)
+    await bot.reply_to(message, text)
+
+@router.command('recipe')
+async def recipe(message):
+    await bot.reply_to(message, messages.CHOOSE_MEAL_TYPE, reply_markup=render_cache.meal_type_keyboard())
+
+async def _remember_photo(recipe, sent_message):
+    if not (sent_message and sent_message.photo):
+        return
+    try:
+        await db(database.save_recipe_photo, recipe['id'], recipe['image_url'], sent_message.photo[-1].file_id)
+    except Exception as e:
+        logging.error(f"Не удалось сохранить file_id изображения для {recipe['name']}: {str(e)}")
+
+async def send_recipe_photo(chat_id, recipe):
+    """Async counterpart of main.send_recipe_photo."""
+    if not recipe['image_url'] or flood_control.degraded():
+        return False
+
+    file_id = await db(database.get_recipe_photo, recipe['id'], recipe['image_url'])
+    if file_id:
+        try:
+            await bot.send_photo(chat_id, file_id)
+            return True
+        except Exception as e:
+            logging.warning(f"Сохраненный file_id больше не действует для {recipe['name']}: {str(e)}")
+            await db(database.delete_recipe_photo, recipe['id'])
+
+    content = await db(image_cache.get_cache().get, recipe['image_url'])
+    if content:
+        try:
+            photo = BytesIO(content)
+            photo.name = f"{recipe['name']}.jpg"
+            await _remember_photo(recipe, await bot.send_photo(chat_id, photo))
+            return True
+        except Exception as e1:
+            logging.warning(f"Не удалось отправить изображение из локального кэша: {str(e1)}")
+    else:
+        asyncio.create_task(fetch_image(recipe['image_url']))
+
+    try:
+        await _remember_photo(recipe, await bot.send_photo(chat_id, recipe['image_url']))
+        return True
+    except Exception as e2:
+        logging.warning(f"Не удалось отправить изображение через прямой URL: {str(e2)}")
+    return False
+
+@router.text(*messages.MEAL_TYPE_BUTTONS)
+async def get_recipe(message):
+    meal_type = message.text.split(' ')[0]
+    recipe = await db(database.get_recipe, meal_type)
+
+    if recipe:
+        image_sent = await send_recipe_photo(message.chat.id, recipe)
+        recipe_text = await db(render_cache.recipe_text, recipe, image_sent)
+        await bot.reply_to(message, recipe_text, parse_mode="Markdown", reply_markup=render_cache.remove_keyboard())
+    else:
+        await bot.reply_to(message, messages.NO_RECIPE)
+
+@router.command('search')
+async def search_recipes(message):
+    query = message.text.split(maxsplit=1)[1:]
+    if not query:
+        conversation.sessions.set(message.chat.id, 'search')
+        await bot.send_message(message.chat.id, messages.SEARCH_PROMPT, reply_markup=render_cache.force_reply_markup())
+        return
+    await reply_search(message, query[0])
+
+@router.state('search')
+@router.reply("Введи ингредиенты")
+async def search_reply(message):
+    conversation.sessions.end(message.chat.id)
+    await reply_search(message, message.text)
+
+async def reply_search(message, query):
+    text, markup = await db(render_cache.search_reply, query)
+    await bot.reply_to(message, text, reply_markup=markup)
+
+@router.callback('r')
+async def show_recipe(call):
+    await bot.answer_callback_query(call.id)
+    payload = call.data.partition(':')[2]
+    recipe = await db(database.get_recipe_by_id, int(payload)) if payload.isdigit() else None
+    if not recipe:
+        await bot.send_message(call.message.chat.id, messages.RECIPE_NOT_FOUND)
+        return
+    image_sent = await send_recipe_photo(call.message.chat.id, recipe)
+    recipe_text = await db(render_cache.recipe_text, recipe, image_sent)
+    await bot.send_message(call.message.chat.id, recipe_text, parse_mode="Markdown")
+
+@router.command('foods', 'recipes')
+async def catalog(message):
+    name = message.text.split()[0].lstrip('/').split('@')[0].lower()
+    text, markup = await db(render_cache.catalog_page, name)
+    await bot.send_message(message.chat.id, text, reply_markup=markup, parse_mode="Markdown")
+
+@router.callback('fp', 'rp')
+async def catalog_page(call):
+    await bot.answer_callback_query(call.id)
+    prefix, _, cursor = call.data.partition(':')
+    text, markup = await db(render_cache.catalog_page, 'foods' if prefix == 'fp' else 'recipes', cursor)
+    try:
+        await bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup, parse_mode="Markdown")
+    except Exception as e:
+        logging.error(f"Не удалось обновить страницу каталога: {str(e)}")
+
+@router.callback('f')
+async def show_food(call):
+    await bot.answer_callback_query(call.id)
+    payload = call.data.partition(':')[2]
+    food = await db(database.get_food_by_id, int(payload)) if payload.isdigit() else None
+    await bot.send_message(call.message.chat.id, messages.food_text(food) if food else messages.FOOD_NOT_FOUND)
+
+@router.command('track')
+async def track(message):
+    conversation.sessions.set(message.chat.id, 'track')
+    await bot.send_message(message.chat.id, messages.TRACK_PROMPT, reply_markup=render_cache.track_prompt_markup())
+
+@router.state('track')
+@router.reply("Введи название блюда")
+async def calculate_calories(message):
+    conversation.sessions.end(message.chat.id)
+    matcher = await db(database.get_food_matcher)
+    found_foods = matcher.match(message.text)
+    if found_foods:
+        await db(diary.record, message.from_user.id, message.text, found_foods)
+    await bot.reply_to(message, messages.calories_text(message.text, found_foods, logged=bool(found_foods)), parse_mode="Markdown")
+
+@router.command('today')
+async def today(message):
+    day, totals = await db(diary.get_today, message.from_user.id)
+    await bot.reply_to(message, messages.today_text(day, totals), parse_mode="Markdown")
+
+@router.command('week')
+async def week(message):
+    await bot.reply_to(message, messages.week_text(await db(diary.get_week, message.from_user.id)), parse_mode="Markdown")
+
+@router.command('stats')
+async def stats(message):
+    await bot.reply_to(message, messages.stats_text(await db(database.get_diary_stats, message.from_user.id)), parse_mode="Markdown")
+
+@router.command('help')
+async def help_command(message):
+    await bot.reply_to(message, render_cache.help_text(), parse_mode="Markdown")
+
+@router.command('healthtip')
+async def send_health_tip(message):
+    health_tips = await db(database.get_health_tips)
+    if health_tips:
+        await bot.reply_to(message, messages.health_tip(random.choice(health_tips)))
+    else:
+        await bot.reply_to(message, messages.NO_HEALTH_TIPS)
+
+@router.command('setreminder')
+async def set_meal_reminder(message):
+    if message.text.split()[1:] == ['off']:
+        await db(database.delete_reminders, message.chat.id)
+        await bot.reply_to(message, messages.REMINDERS_OFF)
+        return
+
+    try:
+        times, tz_name = reminders.parse_reminder_args(message.text)
+    except ValueError as e:
+        await bot.reply_to(message, str(e))
+        return
+
+    await db(reminders.set_reminders, message.chat.id, times, tz_name)
+    await db(database.unblock_chat, message.chat.id)
+    if broadcaster is not None:
+        broadcaster.unblock(message.chat.id)
+    await bot.reply_to(message, messages.reminders_set(times, tz_name))
+
+@router.throttled
+async def throttled(message):
+    await bot.send_message(message.chat.id, messages.FLOOD_WARNING)
+
+@router.throttled_callback
+async def throttled_callback(call):
+    await bot.answer_callback_query(call.id, messages.FLOOD_WARNING)
+
+# Single telebot handler; routing happens in O(1) inside the Router
+@bot.message_handler(content_types=['text'])
+async def dispatch(message):
+    if message.from_user:
+        user_writer.writer.touch(message.from_user.id)
+    await router.dispatch_async(message)
+
+@bot.callback_query_handler(func=lambda call: True)
+async def dispatch_callback(call):
+    user_writer.writer.touch(call.from_user.id)
+    await router.dispatch_callback_async(call)
+
+async def _run_webhook():
+    loop = asyncio.get_running_loop()
+
+    def process_updates(updates):
+        # Wait for the handlers so each webhook worker keeps per-chat order
+        asyncio.run_coroutine_threadsafe(bot.process_new_updates(updates), loop).result()
+
+    server = webhook.WebhookServer(process_updates).start()
+    metrics.register_collector('planeat_webhook', lambda: server.stats)
+    await bot.set_webhook(
+        url=config.WEBHOOK_URL + config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET,
+        max_connections=config.WEBHOOK_WORKERS
+    )
+    try:
+        await asyncio.to_thread(server.serve_forever)
+    finally:
+        server.stop()
+
+async def _run():
+    global _http
+    timeout = aiohttp.ClientTimeout(total=config.IMAGE_FETCH_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        _http = session
+        prefetcher = asyncio.create_task(prefetch_images())
+        logging.info("Bot started (asyncio)")
+        try:
+            if config.UPDATE_MODE == 'webhook':
+                await _run_webhook()
+            else:
+                await bot.remove_webhook()
+                await bot.infinity_polling()
+        finally:
+            prefetcher.cancel()
+
+def run():
+    asyncio.run(_run())
@@ -0,0 +1,72 @@
+"""Load test of broadcast.Broadcaster against the fake Bot API server.
+
+    python benchmarks/bench_broadcast.py [chats] [rate]
+
+Reports delivery metrics, the busiest one-second window seen by the server
+and any chat that received two messages less than a second apart.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot
+
+import broadcast
+import database
+from fake_bot_api import FakeBotApi
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    server = FakeBotApi(latency=0.05, rate_limit_ratio=0.02, retry_after=1, server_error_ratio=0.02,
+                        blocked_chats=range(1, chats, 50), seed=1).start()
+    telebot.apihelper.API_URL = server.api_url
+    bot = telebot.TeleBot('123456:fake-token', threaded=False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, 'bench.db'))
+        database.init_db()
+
+        broadcaster = broadcast.Broadcaster(bot.send_message, rate=rate, workers=16).start()
+        started = time.perf_counter()
+        for chat_id in range(chats):
+            broadcaster.submit(chat_id, "Время завтракать! 🍳")
+            # A second reminder to the same chat must respect the 1 msg/s limit
+            if chat_id % 10 == 0:
+                broadcaster.submit(chat_id, "Не забудь про воду 💧")
+        broadcaster.join()
+        elapsed = time.perf_counter() - started
+        broadcaster.stop()
+        database.close_connections()
+    server.stop()
+
+    stats = broadcaster.stats()
+    times = sorted(item['at'] for item in server.sent)
+    peak = 0
+    first = 0
+    for last, at in enumerate(times):
+        while at - times[first] >= 1.0:
+            first += 1
+        peak = max(peak, last - first + 1)
+    per_chat = {}
+    violations = 0
+    for item in sorted(server.sent, key=lambda item: item['at']):
+        previous = per_chat.get(item['chat_id'])
+        if previous is not None and item['at'] - previous < 0.95:
+            violations += 1
+        per_chat[item['chat_id']] = item['at']
+
+    print(f"delivered {stats['sent']} of {stats['submitted']} in {elapsed:.1f}s "
+          f"({stats['sent'] / elapsed:.1f} msg/s, target {rate:g})")
+    print(f"retried {stats['retried']} (429: {stats['rate_limited']}), blocked {stats['blocked']}, "
+          f"skipped {stats['skipped']}, failed {stats['failed']}")
+    print(f"avg latency {stats['avg_latency']:.2f}s, peak {peak} msg in 1s, per-chat violations {violations}")
+
+
+if __name__ == "__main__":
+    main()
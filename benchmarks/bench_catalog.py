@@ -0,0 +1,73 @@
+"""Catalog page cost: keyset pagination vs OFFSET vs loading the whole table.
+
+    python benchmarks/bench_catalog.py [foods]
+
+Fills food_data with synthetic products and times the first, a middle and
+the last page with database.get_foods_page() (keyset on the name index),
+the same pages with LIMIT/OFFSET, and get_all_foods().
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import database
+
+
+def fill(count, rng):
+    # Inserted in random order so that ids do not follow the name order
+    numbers = list(range(count))
+    rng.shuffle(numbers)
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO food_data (name, calories, protein, fats, carbs) VALUES (?, ?, ?, ?, ?)",
+            ((f"Продукт {number:07d}", rng.uniform(20, 900), 1, 1, 1) for number in numbers)
+        )
+
+
+def timed(func, *args, rounds=20):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = func(*args)
+    return (time.perf_counter() - started) / rounds * 1000, result
+
+
+def offset_page(offset, limit):
+    return database.get_connection().execute(
+        "SELECT id, name, calories FROM food_data ORDER BY name LIMIT ? OFFSET ?", (limit + 1, offset)
+    ).fetchall()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    logging.getLogger().setLevel(logging.WARNING)
+    limit = config.CATALOG_PAGE_SIZE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, 'catalog.db'))
+        database.init_db()
+        fill(count, random.Random(18))
+        conn = database.get_connection()
+        total = conn.execute("SELECT COUNT(*) FROM food_data").fetchone()[0]
+        ids = [row[0] for row in conn.execute("SELECT id FROM food_data ORDER BY name")]
+        print(f"{total} foods, {limit} per page")
+        print(f"{'page':<8} {'keyset':>10} {'offset':>10}")
+        for label, position in (('first', 0), ('middle', total // 2), ('last', total - limit)):
+            cursor_id = ids[position - 1] if position else None
+            keyset_ms, (rows, _) = timed(database.get_foods_page, cursor_id, False, limit)
+            offset_ms, offset_rows = timed(offset_page, position, limit)
+            assert rows == offset_rows[:limit]
+            print(f"{label:<8} {keyset_ms:>8.3f}ms {offset_ms:>8.3f}ms")
+        all_ms, _ = timed(database.get_all_foods, rounds=3)
+        print(f"get_all_foods() {all_ms:.1f}ms")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Conversation store: memory per idle session, cost of a step and a
+lookup, TTL eviction and persistence of a million sessions.
+
+    python benchmarks/bench_conversations.py [sessions]
+
+Memory is measured with tracemalloc for conversation.Conversations and,
+for comparison, for a plain dict of {'state', 'data', 'expires_at'} dicts.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import conversation
+import database
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return store, used
+
+
+def fill(store, sessions):
+    for chat_id in range(sessions):
+        store.set(chat_id, 'track')
+    return store
+
+
+def plain(sessions):
+    now = time.time()
+    return {chat_id: {'state': 'track', 'data': None, 'expires_at': now + 3600} for chat_id in range(sessions)}
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print(f"{sessions} idle sessions")
+
+    _, used = measure(lambda: plain(sessions))
+    print(f"memory, dict of dicts   {used / sessions:>8.0f} bytes per session ({used / 2**20:.0f} MB)")
+    store, used = measure(lambda: fill(conversation.Conversations(max_sessions=sessions, persist=False), sessions))
+    print(f"memory, Conversations   {used / sessions:>8.0f} bytes per session ({used / 2**20:.0f} MB)")
+
+    started = time.perf_counter()
+    fill(store, sessions)
+    print(f"set()                   {(time.perf_counter() - started) / sessions * 1e9:>8.0f} ns per step")
+    started = time.perf_counter()
+    for chat_id in range(sessions):
+        store.state(chat_id)
+    print(f"state(), in a session   {(time.perf_counter() - started) / sessions * 1e9:>8.0f} ns per message")
+    started = time.perf_counter()
+    for chat_id in range(sessions, sessions * 2):
+        store.state(chat_id)
+    print(f"state(), no session     {(time.perf_counter() - started) / sessions * 1e9:>8.0f} ns per message")
+
+    # Everything expires at once: the next step evicts the whole front
+    for session in store._sessions.values():
+        session.expires_at = 0
+    started = time.perf_counter()
+    store.set(-1, 'track')
+    print(f"TTL eviction            {(time.perf_counter() - started) * 1000:>8.0f} ms for {sessions} sessions, "
+          f"{len(store)} left")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, 'conversations.db'))
+        database.init_db()
+        store = fill(conversation.Conversations(max_sessions=sessions, persist=True), sessions)
+        started = time.perf_counter()
+        written = store.flush()
+        print(f"flush                   {(time.perf_counter() - started) * 1000:>8.0f} ms for {written} sessions, "
+              f"one transaction")
+        started = time.perf_counter()
+        loaded = conversation.Conversations(max_sessions=sessions, persist=True).load()
+        print(f"load on start           {(time.perf_counter() - started) * 1000:>8.0f} ms for {loaded} sessions")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
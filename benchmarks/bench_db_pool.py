@@ -0,0 +1,61 @@
+"""Queries per second for database.py with and without the connection pool.
+
+    python benchmarks/bench_db_pool.py [iterations] [threads]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+def unpooled_user_exists(db_path, user_id):
+    # What every database.py function used to do before the pool.
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone() is not None
+    conn.close()
+    return result
+
+
+def run(label, func, iterations, threads):
+    per_thread = iterations // threads
+
+    def worker():
+        for i in range(per_thread):
+            func(i % 1000)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {per_thread * threads / elapsed:>12,.0f} queries/s  ({threads} threads)")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        database.configure(db_path)
+        database.init_db()
+        for user_id in range(0, 1000, 2):
+            database.add_user(user_id, f"user{user_id}", "Bench", "User", user_id)
+
+        run("unpooled", lambda user_id: unpooled_user_exists(db_path, user_id), iterations, threads)
+        run("pooled", database.user_exists, iterations, threads)
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
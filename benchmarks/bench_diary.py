@@ -0,0 +1,96 @@
+"""Diary queries over millions of synthetic food_log rows.
+
+    python benchmarks/bench_diary.py [rows] [users]
+
+Compares the daily_totals rollup lookups used by /today, /week and /stats
+with aggregating food_log directly, and measures log_food() write rate.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+DAYS = 365
+
+
+def populate(conn, rows, users, rng):
+    start = date.today() - timedelta(days=DAYS - 1)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(DAYS)]
+    batch = []
+    with conn:
+        for i in range(rows):
+            calories = rng.uniform(50, 900)
+            batch.append((rng.randrange(users), rng.choice(dates), 'bench', calories,
+                          calories * 0.08, calories * 0.04, calories * 0.12))
+            if len(batch) == 50000:
+                conn.executemany("INSERT INTO food_log (user_id, date, description, calories, protein, fats, carbs) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                batch.clear()
+        if batch:
+            conn.executemany("INSERT INTO food_log (user_id, date, description, calories, protein, fats, carbs) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        conn.execute("INSERT INTO daily_totals (user_id, date, calories, protein, fats, carbs, entries) "
+                     "SELECT user_id, date, SUM(calories), SUM(protein), SUM(fats), SUM(carbs), COUNT(*) "
+                     "FROM food_log GROUP BY user_id, date")
+    return dates
+
+
+def timed(label, func, calls):
+    started = time.perf_counter()
+    for args in calls:
+        func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed / len(calls) * 1e6:>10.1f} us/call")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, 'bench.db'))
+        database.init_db()
+        conn = database.get_connection()
+
+        started = time.perf_counter()
+        dates = populate(conn, rows, users, rng)
+        print(f"populated {rows:,} log rows for {users} users in {time.perf_counter() - started:.1f}s")
+
+        calls = [(rng.randrange(users), rng.choice(dates)) for _ in range(2000)]
+        week_calls = [(user_id, (date.fromisoformat(day) - timedelta(days=6)).isoformat(), day) for user_id, day in calls]
+
+        def scan_day(user_id, day):
+            conn.execute("SELECT SUM(calories), SUM(protein), SUM(fats), SUM(carbs), COUNT(*) FROM food_log "
+                         "WHERE user_id = ? AND date = ?", (user_id, day)).fetchone()
+
+        def scan_week(user_id, start, end):
+            conn.execute("SELECT date, SUM(calories) FROM food_log WHERE user_id = ? AND date BETWEEN ? AND ? "
+                         "GROUP BY date", (user_id, start, end)).fetchall()
+
+        def scan_stats(user_id):
+            conn.execute("SELECT COUNT(DISTINCT date), SUM(calories) FROM food_log WHERE user_id = ?", (user_id,)).fetchone()
+
+        timed("/today  rollup", database.get_daily_totals, calls)
+        timed("/today  food_log aggregate", scan_day, calls)
+        timed("/week   rollup", database.get_daily_totals_range, week_calls)
+        timed("/week   food_log aggregate", scan_week, week_calls)
+        timed("/stats  rollup", database.get_diary_stats, [(user_id,) for user_id, _ in calls[:500]])
+        timed("/stats  food_log aggregate", scan_stats, [(user_id,) for user_id, _ in calls[:500]])
+
+        writes = [(rng.randrange(users), dates[-1], 'bench', 300, 20, 10, 30) for _ in range(5000)]
+        started = time.perf_counter()
+        for args in writes:
+            database.log_food(*args)
+        print(f"log_food                     {len(writes) / (time.perf_counter() - started):>10,.0f} entries/s")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
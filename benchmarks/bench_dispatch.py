@@ -0,0 +1,103 @@
+"""Dispatch cost: telebot's decorator chain vs router.Router.
+
+    python benchmarks/bench_dispatch.py [handlers] [messages]
+
+Registers the same commands, button labels and reply prompts both ways
+(roughly a third of each) and feeds identical messages through
+TeleBot.process_new_messages with no-op handlers.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot
+from telebot import types
+
+from router import Router
+
+
+def noop(message):
+    pass
+
+
+def make_routes(count):
+    per_kind = max(1, count // 3)
+    commands = [f"cmd{i}" for i in range(per_kind)]
+    labels = [[f"Кнопка {i}-{j} 🔘" for j in range(3)] for i in range(per_kind)]
+    prompts = [f"Вопрос {i}: введи значение" for i in range(per_kind)]
+    return commands, labels, prompts
+
+
+def decorator_bot(commands, labels, prompts):
+    bot = telebot.TeleBot('1:bench', threaded=False)
+    for command in commands:
+        bot.register_message_handler(noop, commands=[command])
+    for group in labels:
+        bot.register_message_handler(noop, func=lambda message, group=group: message.text in group)
+    for prompt in prompts:
+        prefix = prompt.split(':')[0]
+        bot.register_message_handler(
+            noop,
+            func=lambda message, prefix=prefix: message.reply_to_message and message.reply_to_message.text.startswith(prefix)
+        )
+    return bot
+
+
+def router_bot(commands, labels, prompts):
+    bot = telebot.TeleBot('1:bench', threaded=False)
+    router = Router()
+    router.command(*commands)(noop)
+    for group in labels:
+        router.text(*group)(noop)
+    for prompt in prompts:
+        router.reply(prompt.split(':')[0])(noop)
+    bot.register_message_handler(router.dispatch, content_types=['text'])
+    return bot
+
+
+def make_messages(commands, labels, prompts, count, rng):
+    chat = {'id': 1, 'type': 'private'}
+    user = {'id': 1, 'is_bot': False, 'first_name': 'Bench'}
+    result = []
+    for i in range(count):
+        message = {'message_id': i, 'date': 0, 'chat': chat, 'from': user}
+        kind = i % 3
+        if kind == 0:
+            command = rng.choice(commands)
+            message['text'] = f"/{command}"
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command) + 1}]
+        elif kind == 1:
+            message['text'] = rng.choice(rng.choice(labels))
+        else:
+            message['text'] = "200г курицы"
+            message['reply_to_message'] = {'message_id': 0, 'date': 0, 'chat': chat, 'from': user,
+                                           'text': rng.choice(prompts)}
+        result.append(types.Message.de_json(message))
+    return result
+
+
+def timed(label, bot, messages):
+    started = time.perf_counter()
+    for message in messages:
+        bot.process_new_messages([message])
+    elapsed = time.perf_counter() - started
+    print(f"{label:<18} {elapsed / len(messages) * 1e6:>8.1f} us/message")
+
+
+def main():
+    handlers = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rng = random.Random(3)
+    commands, labels, prompts = make_routes(handlers)
+    messages = make_messages(commands, labels, prompts, count, rng)
+
+    print(f"{len(commands) + len(labels) + len(prompts)} handlers, {count} messages")
+    timed("decorator chain", decorator_bot(commands, labels, prompts), messages)
+    timed("router", router_bot(commands, labels, prompts), messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Flood control: cost of a check, memory per tracked user, and what a spam
+burst and an overload look like in the counters.
+
+    python benchmarks/bench_flood.py [users]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flood_control
+
+HANDLERS = ('get_recipe', 'calculate_calories', 'help_command', 'today', 'show_recipe')
+VERDICTS = ('allow', 'degrade', 'warn', 'drop')
+
+
+def summary(verdicts):
+    return '  '.join(f"{name} {verdicts.count(code)}" for code, name in enumerate(VERDICTS))
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(23)
+
+    # Budgets wide enough that every check passes and leaves state behind
+    limiter = flood_control.FloodControl(user_rate=1000, user_burst=1000, global_rate=1e9, global_burst=1e9)
+    requests = [(rng.randrange(users), rng.choice(HANDLERS)) for _ in range(500000)]
+    started = time.perf_counter()
+    for user_id, handler in requests:
+        limiter.check(user_id, handler)
+    elapsed = time.perf_counter() - started
+    print(f"check()          {elapsed / len(requests) * 1e9:>8.0f} ns per request")
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    limiter = flood_control.FloodControl()
+    for user_id in range(users):
+        limiter.check(user_id, 'get_recipe')
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"memory           {used / users:>8.0f} bytes per user ({users} users, user and command budget)")
+    started = time.perf_counter()
+    limiter._evict(time.monotonic() + 3600)
+    print(f"eviction         {(time.perf_counter() - started) * 1000:>8.1f} ms for {users} idle users, "
+          f"{limiter.stats()['users']} left")
+
+    limiter = flood_control.FloodControl()
+    spam = [limiter.check(1, 'get_recipe') for _ in range(1000)]
+    print(f"spam             1000 recipe buttons from one user: {summary(spam)}")
+
+    limiter = flood_control.FloodControl()
+    burst = [limiter.check(user_id, 'help_command') for user_id in range(1000)]
+    print(f"overload         1000 users at once: {summary(burst)}")
+    print(f"counters         {limiter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Messages per second for /track food recognition: substring scan vs FoodMatcher.
+
+    python benchmarks/bench_food_matcher.py [foods] [messages]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_matcher import FoodMatcher
+
+SYLLABLES = ['ка', 'ро', 'ми', 'ту', 'ле', 'на', 'со', 'ви', 'ба', 'ду', 'пе', 'ги', 'ло', 'зу', 'ча', 'ше']
+ENDINGS = ['а', 'ы', 'ой', 'у', 'ом', 'е', '']
+FILLER = ['с', 'и', 'на', 'завтрак', 'обед', 'тарелка', 'немного', 'порция', 'вареный', 'жареный']
+
+
+def make_foods(count, rng):
+    foods = {}
+    while len(foods) < count:
+        words = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 2))]
+        foods[' '.join(words)] = {
+            'calories': rng.uniform(20, 600),
+            'protein': rng.uniform(0, 30),
+            'fats': rng.uniform(0, 40),
+            'carbs': rng.uniform(0, 70)
+        }
+    return foods
+
+
+def make_messages(foods, count, rng):
+    names = list(foods)
+    messages = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 4)):
+            parts.append(rng.choice(FILLER))
+            if rng.random() < 0.5:
+                parts.append(f"{rng.randint(1, 300)}г")
+            parts.append(rng.choice(names) + rng.choice(ENDINGS))
+        messages.append(' '.join(parts))
+    return messages
+
+
+def substring_scan(food_data, text):
+    # The original calculate_calories loop.
+    text = text.lower()
+    return [food for food in food_data if food in text]
+
+
+def timed(label, func, messages):
+    started = time.perf_counter()
+    for text in messages:
+        func(text)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<16} {len(messages) / elapsed:>12,.0f} messages/s")
+
+
+def main():
+    food_count = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    message_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(42)
+    foods = make_foods(food_count, rng)
+    messages = make_messages(foods, message_count, rng)
+
+    started = time.perf_counter()
+    matcher = FoodMatcher(foods)
+    print(f"build matcher    {time.perf_counter() - started:.3f}s for {food_count} foods")
+
+    timed("substring scan", lambda text: substring_scan(foods, text), messages[:200])
+    timed("FoodMatcher", matcher.match, messages)
+
+
+if __name__ == "__main__":
+    main()
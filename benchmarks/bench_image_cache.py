@@ -0,0 +1,95 @@
+"""Image cache against a local image host: LRU eviction by byte budget,
+ETag revalidation and de-duplicated concurrent prefetches.
+
+    python benchmarks/bench_image_cache.py [images] [image_bytes] [latency_seconds]
+
+Each check asserts the behaviour and prints what it cost: `images` images
+of `image_bytes` are prefetched into a cache that holds half of them, a
+second prefetch revalidates what is cached (304, no body), and the same
+URLs requested by many threads at once are fetched once.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_cache
+from fake_image_server import FakeImageServer, image_bytes
+
+
+def main():
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    server = FakeImageServer(latency=latency).start()
+    tmp = tempfile.mkdtemp(prefix='planeat-images-')
+    try:
+        urls = [server.url(f"recipe{i}", size) for i in range(images)]
+        budget = size * images // 2
+        # One worker, so the images are cached (and age) in URL order
+        cache = image_cache.ImageCache(os.path.join(tmp, 'eviction'), budget, workers=1)
+
+        started = time.perf_counter()
+        assert all(future.result() for future in cache.prefetch(urls))
+        elapsed = time.perf_counter() - started
+        stats = cache.stats()
+        assert stats['bytes'] <= budget and stats['urls'] == images // 2, stats
+        # The least recently used half went; the newest half is still there
+        assert cache.get(urls[0]) is None
+        assert cache.get(urls[-1]) == image_bytes(f"recipe{images - 1}", size)
+        print(f"eviction       {images} downloads in {elapsed * 1000:.0f} ms, {stats['urls']} kept in "
+              f"{stats['bytes']} of {budget} bytes")
+
+        # get() refreshes recency: the oldest kept image survives the next insert
+        oldest = urls[images - stats['urls']]
+        cache.get(oldest)
+        assert cache.prefetch([server.url('extra', size)])[0].result()
+        assert cache.get(oldest) is not None and cache.get(urls[images - stats['urls'] + 1]) is None
+        print("lru            a read image outlives older untouched ones")
+        cache.close()
+
+        cache = image_cache.ImageCache(os.path.join(tmp, 'revalidation'), size * images * 2, workers=8)
+        assert all(future.result() for future in cache.prefetch(urls))
+        server.statuses.clear()
+        started = time.perf_counter()
+        assert all(future.result() for future in cache.prefetch(urls))
+        elapsed = time.perf_counter() - started
+        assert server.statuses == {304: images}, server.statuses
+        assert all(cache.get(url) is not None for url in urls)
+        print(f"revalidation   {images} URLs answered 304 in {elapsed * 1000:.0f} ms, copies kept")
+        cache.close()
+
+        cache = image_cache.ImageCache(os.path.join(tmp, 'dedup'), size * images * 2, workers=8)
+        server.requests.clear()
+        threads = 16
+        barrier = threading.Barrier(threads)
+        futures = []
+
+        def prefetch():
+            barrier.wait()
+            futures.extend(cache.prefetch(urls))
+
+        workers = [threading.Thread(target=prefetch) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        assert all(future.result() for future in futures)
+        elapsed = time.perf_counter() - started
+        fetched = sum(server.requests.values())
+        assert fetched == images and max(server.requests.values()) == 1, fetched
+        print(f"de-duplication {threads} threads x {images} URLs: {fetched} requests in {elapsed * 1000:.0f} ms")
+        cache.close()
+    finally:
+        server.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Bulk import throughput: importer.py vs one INSERT and commit per row.
+
+    python benchmarks/bench_import.py [foods] [recipes]
+
+Generates synthetic CSV foods and JSONL recipes, imports them into a fresh
+database twice (the second run only updates) and compares with the
+row-at-a-time approach on the foods file. Finally an import is killed after
+it dropped the indexes, and the next init_db() must rebuild them.
+"""
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import importer
+
+
+def write_foods(path, count, rng):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['product_name', 'energy-kcal_100g', 'proteins_100g', 'fat_100g', 'carbohydrates_100g'])
+        for i in range(count):
+            protein, fat = rng.uniform(0, 30), rng.uniform(0, 30)
+            carbs = rng.uniform(0, 100 - protein - fat)
+            writer.writerow([f"Продукт {i}", f"{protein * 4 + fat * 9 + carbs * 4:.1f}".replace('.', ','),
+                             f"{protein:.1f}", f"{fat:.1f}", f"{carbs:.1f}"])
+        writer.writerow(['', '100', '1', '1', '1'])
+        writer.writerow(['битая строка', 'много', '', '', ''])
+
+
+def write_recipes(path, count, rng):
+    meal_types = ['breakfast', 'lunch', 'dinner', 'dessert', 'drink']
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                'meal_type': rng.choice(meal_types),
+                'name': f"Рецепт {i}",
+                'instructions': "1. Смешайте.\n2. Приготовьте.",
+                'calories': rng.randint(150, 900),
+                'ingredients': [f"{rng.randint(10, 300)}г продукта {rng.randint(0, 999)}" for _ in range(rng.randint(3, 12))]
+            }, ensure_ascii=False) + '\n')
+        # JSON values that are not numbers: the rows are skipped
+        for i, invalid in enumerate(({'calories': True}, {'calories': [350]}, {'calories': False})):
+            f.write(json.dumps({'meal_type': 'lunch', 'name': f"Битый рецепт {i}", **invalid}, ensure_ascii=False) + '\n')
+
+
+def naive_foods(path, limit):
+    conn = database.get_connection()
+    mapping = None
+    rows = 0
+    started = time.perf_counter()
+    for row in importer.read_rows(path):
+        if mapping is None:
+            mapping = importer._column_map(row.keys(), importer.FOOD_COLUMNS)
+        try:
+            food = importer.normalize_food(row, mapping)
+        except importer.InvalidRow:
+            continue
+        conn.execute("INSERT OR REPLACE INTO food_data (name, calories, protein, fats, carbs) VALUES (?, ?, ?, ?, ?)", food)
+        conn.commit()
+        rows += 1
+        if rows >= limit:
+            break
+    return rows, time.perf_counter() - started
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    staged, skipped = func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {staged:>8} rows {skipped:>3} skipped {elapsed:>7.2f}s {staged / elapsed:>10.0f} rows/s")
+
+
+def interrupted_import(db_path, recipes_path):
+    # Dies after the indexes are dropped, in the middle of the load
+    database.configure(db_path)
+    database.get_connection().create_function('die', 0, lambda: os._exit(1))
+    merge = importer._merge
+    importer._merge = lambda conn, table, staging, statement, batch, staged_rows: \
+        merge(conn, table, staging, "SELECT die() WHERE ? AND ?", batch, staged_rows)
+    importer.import_recipes(recipes_path)
+
+
+def check_interrupted_import(db_path, recipes_path):
+    database.configure(db_path)
+    database.init_db()
+    indexes = "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'recipes' AND sql IS NOT NULL"
+    before = set(row[0] for row in database.get_connection().execute(indexes))
+    database.close_connections()
+    process = multiprocessing.Process(target=interrupted_import, args=(db_path, recipes_path))
+    process.start()
+    process.join()
+    assert process.exitcode == 1, process.exitcode
+    database.configure(db_path)
+    dropped = before - set(row[0] for row in database.get_connection().execute(indexes))
+    assert dropped, "the import died before dropping any index"
+    database.init_db()
+    assert set(row[0] for row in database.get_connection().execute(indexes)) == before
+    print(f"killed import: {', '.join(sorted(dropped))} rebuilt by the next init_db()")
+    database.close_connections()
+
+
+def main():
+    foods = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    recipes = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(5)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        foods_path = os.path.join(tmp, 'foods.csv')
+        recipes_path = os.path.join(tmp, 'recipes.jsonl')
+        write_foods(foods_path, foods, rng)
+        write_recipes(recipes_path, recipes, rng)
+
+        database.configure(os.path.join(tmp, 'bulk.db'))
+        database.init_db()
+        timed("importer foods", importer.import_foods, foods_path)
+        timed("importer foods (update)", importer.import_foods, foods_path)
+        timed("importer recipes", importer.import_recipes, recipes_path)
+        timed("importer recipes (update)", importer.import_recipes, recipes_path)
+        conn = database.get_connection()
+        print(f"food_data {conn.execute('SELECT COUNT(*) FROM food_data').fetchone()[0]} rows, "
+              f"recipes {conn.execute('SELECT COUNT(*) FROM recipes').fetchone()[0]}, "
+              f"recipe_ingredients {conn.execute('SELECT COUNT(*) FROM recipe_ingredients').fetchone()[0]}")
+
+        database.configure(os.path.join(tmp, 'naive.db'))
+        database.init_db()
+        rows, elapsed = naive_foods(foods_path, min(foods, 20000))
+        print(f"{'row-at-a-time foods':<28} {rows:>8} rows {'':>11} {elapsed:>7.2f}s {rows / elapsed:>10.0f} rows/s")
+        database.close_connections()
+
+        check_interrupted_import(os.path.join(tmp, 'killed.db'), recipes_path)
+
+
+if __name__ == "__main__":
+    main()
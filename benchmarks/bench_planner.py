@@ -0,0 +1,81 @@
+"""/myplan generation time over growing recipe pools.
+
+    python benchmarks/bench_planner.py [max_recipes]
+
+Builds meal_planner.MealPlanner over synthetic recipes and foods (no
+database involved) and reports the build time, p50/p99 of generate() for
+a spread of targets, the share of days within PLAN_TOLERANCE and how many
+distinct recipes a week uses.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import meal_planner
+
+MEAL_TYPES = ('Завтрак', 'Обед', 'Ужин', 'Десерт', 'Напиток')
+
+
+def make_recipes(count, rng):
+    recipes = []
+    for i in range(count):
+        calories = rng.uniform(80, 1000)
+        protein, fats = rng.uniform(0.1, 0.4), rng.uniform(0.15, 0.45)
+        carbs = max(0.05, 1 - protein - fats)
+        macros = (calories * protein / 4, calories * fats / 9, calories * carbs / 4)
+        if rng.random() < 0.2:
+            macros = (None, None, None)
+        recipes.append((i + 1, rng.choice(MEAL_TYPES), f"Рецепт {i}", calories, *macros))
+    return recipes
+
+
+def make_foods(count, rng):
+    return [(i + 1, f"Продукт {i}", rng.uniform(20, 600), rng.uniform(0, 30), rng.uniform(0, 30), rng.uniform(0, 70))
+            for i in range(count)]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    max_recipes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(19)
+    foods = make_foods(2000, rng)
+    targets = [meal_planner.parse_targets([str(calories)]) for calories in range(1400, 3401, 250)]
+    targets.append(meal_planner.parse_targets(['1800', '140', '60', '170']))
+
+    print(f"{'recipes':>9} {'build':>9} {'p50':>9} {'p99':>9} {'in tol.':>8} {'distinct':>9}")
+    # Powers of ten from 1000 up to max_recipes, which is always measured last
+    sizes = []
+    count = 1000
+    while count < max_recipes:
+        sizes.append(count)
+        count *= 10
+    sizes.append(max_recipes)
+    for count in sizes:
+        recipes = make_recipes(count, rng)
+        started = time.perf_counter()
+        planner = meal_planner.MealPlanner(recipes, foods)
+        build = time.perf_counter() - started
+
+        timings, days, within, distinct = [], 0, 0, []
+        for seed in range(20):
+            for target in targets:
+                started = time.perf_counter()
+                plan = planner.generate(target, seed)
+                timings.append(time.perf_counter() - started)
+                days += len(plan)
+                within += sum(day['within_tolerance'] for day in plan)
+                distinct.append(len({meal[1] for day in plan for meal in day['meals']}))
+        print(f"{count:>9} {build * 1000:>7.0f}ms {percentile(timings, 0.5) * 1000:>7.2f}ms "
+              f"{percentile(timings, 0.99) * 1000:>7.2f}ms {within / days:>8.0%} "
+              f"{sum(distinct) / len(distinct):>6.1f}/28")
+
+
+if __name__ == "__main__":
+    main()
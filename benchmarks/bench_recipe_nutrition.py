@@ -0,0 +1,110 @@
+"""Ingredient-level recipe nutrition: full rebuild and incremental update.
+
+    python benchmarks/bench_recipe_nutrition.py [recipes] [foods]
+
+Imports synthetic foods and recipes (ingredient lines like "150г бакура",
+"2 ст. л. мелисы", "соль по вкусу"), then times recipe_nutrition.update()
+for a full relink, a full recompute, the recipes queued by changed foods
+and an import that touches a few hundred recipes.
+"""
+import csv
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import importer
+import recipe_nutrition
+
+SYLLABLES = ('ба', 'ку', 'ро', 'ми', 'ле', 'са', 'то', 'ни', 'ва', 'пе', 'ды', 'жу', 'ло', 'ре', 'зи', 'ха')
+
+
+def food_names(count, rng):
+    names = set()
+    while len(names) < count:
+        names.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4))))
+    return sorted(names)
+
+
+def write_foods(path, names, rng):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'calories', 'protein', 'fats', 'carbs'])
+        for name in names:
+            writer.writerow([name, f"{rng.uniform(20, 800):.1f}", f"{rng.uniform(0, 30):.1f}",
+                             f"{rng.uniform(0, 40):.1f}", f"{rng.uniform(0, 70):.1f}"])
+
+
+def ingredient(names, rng):
+    kind = rng.random()
+    if kind < 0.6:
+        return f"{rng.randint(10, 300)}г {rng.choice(names)}"
+    if kind < 0.8:
+        return f"{rng.randint(1, 3)} ст. л. {rng.choice(names)}"
+    if kind < 0.9:
+        return rng.choice(names)
+    return "соль по вкусу"
+
+
+def write_recipes(path, count, names, rng, prefix="Рецепт"):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                'meal_type': 'lunch', 'name': f"{prefix} {i}", 'calories': None,
+                'ingredients': [ingredient(names, rng) for _ in range(rng.randint(4, 12))]
+            }, ensure_ascii=False) + '\n')
+
+
+def timed(label, full=False, relink=False):
+    started = time.perf_counter()
+    processed, lines, linked = recipe_nutrition.update(full=full, relink=relink)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {processed:>7} recipes {lines:>8} lines {linked:>8} linked {elapsed:>7.2f}s")
+
+
+def main():
+    recipes = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    foods = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(20)
+    names = food_names(foods, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        foods_path = os.path.join(tmp, 'foods.csv')
+        recipes_path = os.path.join(tmp, 'recipes.jsonl')
+        write_foods(foods_path, names, rng)
+        write_recipes(recipes_path, recipes, names, rng)
+        database.configure(os.path.join(tmp, 'nutrition.db'))
+        database.init_db()
+        importer.import_foods(foods_path)
+        importer.import_recipes(recipes_path)
+        conn = database.get_connection()
+        with conn:
+            conn.execute("DELETE FROM recipe_nutrition_dirty")
+
+        timed("relink and recompute all", full=True, relink=True)
+        timed("recompute all", full=True)
+        with conn:
+            conn.execute("UPDATE food_data SET calories = calories * 1.1 WHERE name = ?", (names[0],))
+        timed("one food changed")
+        with conn:
+            conn.execute("UPDATE food_data SET protein = protein + 1 WHERE id % 100 = 0")
+        timed("1% of foods changed")
+        write_recipes(recipes_path, 500, names, rng, prefix="Новый рецепт")
+        importer.import_recipes(recipes_path)
+        timed("500 recipes imported")
+        row = conn.execute(
+            "SELECT COUNT(*), SUM(matched), SUM(ingredients) FROM recipe_nutrition"
+        ).fetchone()
+        print(f"recipe_nutrition: {row[0]} recipes, {row[1]} of {row[2]} lines with food and weight")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
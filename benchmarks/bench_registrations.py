@@ -0,0 +1,84 @@
+"""/start registrations per second: a commit per user vs the write-behind queue.
+
+    python benchmarks/bench_registrations.py [users] [threads]
+
+"direct" is the old /start path (unblock_chat, user_exists, add_user: two
+commits per user); "write-behind" queues the same writes in
+user_writer.UserWriter and reports the handler-side rate plus the time
+until the last registration is committed. Each runs with
+PRAGMA synchronous NORMAL and FULL (an fsync per commit).
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import database
+import user_writer
+
+
+def direct(user_id):
+    database.unblock_chat(user_id)
+    if not database.user_exists(user_id):
+        database.add_user(user_id, f"user{user_id}", "Bench", "User", user_id)
+
+
+def run(func, users, threads):
+    def worker(offset):
+        for user_id in range(offset, users, threads):
+            func(user_id)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def count_users():
+    return database.get_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    print(f"{users} registrations, {threads} threads")
+    print(f"{'synchronous':<12} {'path':<13} {'handlers':>14} {'committed':>14} {'commits':>8}")
+    for synchronous in ('NORMAL', 'FULL'):
+        config.DB_SYNCHRONOUS = synchronous
+        with tempfile.TemporaryDirectory() as tmp:
+            database.configure(os.path.join(tmp, 'direct.db'))
+            database.init_db()
+            elapsed = run(direct, users, threads)
+            assert count_users() == users
+            print(f"{synchronous:<12} {'direct':<13} {users / elapsed:>10,.0f} /s {users / elapsed:>10,.0f} /s "
+                  f"{users * 2:>8}")
+
+            database.configure(os.path.join(tmp, 'write_behind.db'))
+            database.init_db()
+            writer = user_writer.UserWriter().start()
+
+            def register(user_id):
+                writer.unblock(user_id)
+                writer.register(user_id, f"user{user_id}", "Bench", "User", user_id)
+
+            started = time.perf_counter()
+            elapsed = run(register, users, threads)
+            writer.stop()
+            committed = time.perf_counter() - started
+            assert count_users() == users
+            stats = writer.stats()
+            print(f"{synchronous:<12} {'write-behind':<13} {users / elapsed:>10,.0f} /s {users / committed:>10,.0f} /s "
+                  f"{stats['batches']:>8}")
+            database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Threaded vs asyncio runtime under concurrent simulated chats.
+
+    python benchmarks/bench_runtime.py [chats] [api_latency_seconds]
+
+Both runtimes handle the same update mix against the fake Bot API server;
+the time until every update has been answered is reported.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot
+from telebot import asyncio_helper, types
+
+import database
+import messages
+from fake_bot_api import FakeBotApi
+
+
+def make_updates(chats, first_message_id):
+    updates = []
+    message_id = first_message_id
+    for chat_id in range(1, chats + 1):
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f"User{chat_id}"}
+        chat = {'id': chat_id, 'type': 'private'}
+        kind = chat_id % 4
+        message = {'message_id': message_id, 'date': int(time.time()), 'chat': chat, 'from': user}
+        if kind == 0:
+            message.update(text='/help', entities=[{'type': 'bot_command', 'offset': 0, 'length': 5}])
+        elif kind == 1:
+            message.update(text='/healthtip', entities=[{'type': 'bot_command', 'offset': 0, 'length': 10}])
+        elif kind == 2:
+            message['text'] = messages.GOAL_BUTTONS[chat_id % 3]
+        else:
+            message['text'] = '200г курицы и 150 г риса'
+            message['reply_to_message'] = {'message_id': message_id - 1, 'date': int(time.time()), 'chat': chat,
+                                           'from': {'id': 1, 'is_bot': True, 'first_name': 'PlanEat'},
+                                           'text': messages.TRACK_PROMPT}
+        updates.append(types.Update.de_json({'update_id': message_id, 'message': message}))
+        message_id += 10
+    return updates
+
+
+def wait_for_replies(server, message_ids, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        answered = {item['reply_to'] for item in server.sent}
+        if message_ids <= answered:
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def bench_threaded(server, chats):
+    import main
+    updates = make_updates(chats, 10)
+    ids = {update.message.message_id for update in updates}
+    started = time.perf_counter()
+    main.bot.process_new_updates(updates)
+    wait_for_replies(server, ids)
+    return time.perf_counter() - started
+
+
+def bench_asyncio(server, chats):
+    import async_main
+    updates = make_updates(chats, 10 + chats * 10 + 10)
+    ids = {update.message.message_id for update in updates}
+
+    async def run():
+        started = time.perf_counter()
+        await async_main.bot.process_new_updates(updates)
+        await asyncio.to_thread(wait_for_replies, server, ids)
+        elapsed = time.perf_counter() - started
+        await asyncio_helper.session_manager.session.close()
+        return elapsed
+
+    return asyncio.run(run())
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    server = FakeBotApi(latency=latency).start()
+    telebot.apihelper.API_URL = server.api_url
+    asyncio_helper.API_URL = server.api_url
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, 'bench.db'))
+        database.init_db()
+
+        threaded = bench_threaded(server, chats)
+        print(f"threaded  {chats / threaded:>8.1f} updates/s  ({threaded:.2f}s for {chats} chats)")
+        asynchronous = bench_asyncio(server, chats)
+        print(f"asyncio   {chats / asynchronous:>8.1f} updates/s  ({asynchronous:.2f}s for {chats} chats)")
+        database.close_connections()
+    server.stop()
+    # main.py starts the reminder scheduler thread on import
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""/search latency over a large recipe table: FTS5 vs a LIKE scan.
+
+    python benchmarks/bench_search.py [recipes]
+
+Imports synthetic recipes with importer.py, times search.search() on a set
+of queries (p50/p99) against the equivalent LIKE '%...%' scan, checks that
+the triggers keep recipe_search in step with updates, moved ingredients and
+deletes, and that broad words (bounded candidates) and rare words (bm25 over
+every match) are both ranked.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import importer
+import search
+
+DISHES = ('салат', 'суп', 'омлет', 'каша', 'запеканка', 'рагу', 'плов', 'паста', 'смузи', 'котлеты', 'блины', 'жаркое')
+INGREDIENTS = (
+    'курица', 'рис', 'гречка', 'говядина', 'лосось', 'творог', 'яйцо', 'сыр', 'помидор', 'огурец', 'картофель',
+    'морковь', 'лук', 'банан', 'яблоко', 'овсянка', 'молоко', 'кефир', 'индейка', 'тыква', 'брокколи', 'фасоль'
+)
+QUERIES = (
+    'курица рис', 'что приготовить из курицы и риса', 'салат с огурцом', 'гречка с говядиной до 500',
+    'творог', 'лосось 300-600', 'омлет с сыром', 'тыквенный суп', 'брокколи', 'от 700'
+)
+
+
+def write_recipes(path, count, rng):
+    meal_types = ['breakfast', 'lunch', 'dinner', 'dessert', 'drink']
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            main = rng.sample(INGREDIENTS, rng.randint(3, 8))
+            f.write(json.dumps({
+                'meal_type': rng.choice(meal_types),
+                'name': f"{rng.choice(DISHES).capitalize()} с {main[0]} №{i}",
+                'instructions': f"Нарежьте {main[1]}, добавьте {main[2]} и готовьте 20 минут.",
+                'calories': rng.randint(150, 900),
+                'ingredients': [f"{rng.randint(10, 300)}г {ingredient}" for ingredient in main]
+            }, ensure_ascii=False) + '\n')
+
+
+def like_search(text, limit=search.MAX_RESULTS):
+    stems, min_calories, max_calories = search.parse_query(text)
+    conditions = ["(recipes.name LIKE ? OR recipes.instructions LIKE ? OR EXISTS ("
+                  "SELECT 1 FROM recipe_ingredients WHERE recipe_id = recipes.id AND ingredient LIKE ?))"] * len(stems)
+    params = [f"%{stem}%" for stem in stems for _ in range(3)]
+    sql = "SELECT id, name, meal_type, calories FROM recipes WHERE calories >= COALESCE(?, 0) AND calories <= COALESCE(?, 1e9)"
+    if conditions:
+        sql += " AND " + " AND ".join(conditions)
+    return database.get_connection().execute(sql + " LIMIT ?", [min_calories, max_calories, *params, limit]).fetchall()
+
+
+def measure(func, rounds):
+    timings = []
+    for _ in range(rounds):
+        for query in QUERIES:
+            started = time.perf_counter()
+            func(query)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+
+def check_ranking():
+    # Every query word is in thousands of recipes: the bounded candidate
+    # ranking still puts recipes named after a query word first
+    for query in ('творог', 'брокколи', 'курица рис'):
+        stems = search.parse_query(query)[0]
+        names = [row[1].lower() for row in search.search(query)]
+        assert names and all(any(stem in name for stem in stems) for name in names), (query, names)
+    # A rare word is ranked by bm25() over all of its matches
+    conn = database.get_connection()
+    with conn:
+        conn.execute("UPDATE recipes SET instructions = instructions || ' Подавайте с киноа.' "
+                     "WHERE id IN (SELECT id FROM recipes ORDER BY id LIMIT 3)")
+        conn.execute("UPDATE recipes SET name = 'Салат с киноа' WHERE id = (SELECT MAX(id) FROM recipes)")
+    found = search.search('киноа')
+    assert len(found) == 4 and found[0][1] == 'Салат с киноа', found
+    assert found == database.search_recipes(search.match_expression(search.parse_query('киноа')[0]))
+    print("ranking       broad words rank name matches first, rare words use bm25 over all matches")
+
+
+def check_triggers():
+    conn = database.get_connection()
+    recipe_id = conn.execute("SELECT id FROM recipes ORDER BY id DESC LIMIT 1").fetchone()[0]
+    with conn:
+        conn.execute("UPDATE recipes SET name = 'Чизкейк безглютеновый' WHERE id = ?", (recipe_id,))
+        conn.execute("INSERT INTO recipe_ingredients (recipe_id, ingredient) VALUES (?, 'маскарпоне')", (recipe_id,))
+    found = [row[0] for row in search.search('безглютеновый чизкейк с маскарпоне')]
+    assert found == [recipe_id], found
+    other_id = conn.execute("SELECT id FROM recipes WHERE id < ? ORDER BY id DESC LIMIT 1", (recipe_id,)).fetchone()[0]
+    with conn:
+        conn.execute("UPDATE recipe_ingredients SET recipe_id = ? WHERE ingredient = 'маскарпоне'", (other_id,))
+    found = [row[0] for row in search.search('маскарпоне')]
+    assert found == [other_id], found
+    with conn:
+        conn.execute("DELETE FROM recipe_ingredients WHERE ingredient = 'маскарпоне'")
+        conn.execute("DELETE FROM recipe_ingredients WHERE recipe_id = ?", (recipe_id,))
+        conn.execute("DELETE FROM recipes WHERE id = ?", (recipe_id,))
+    assert search.search('маскарпоне') == []
+    assert conn.execute("SELECT COUNT(*) FROM recipe_search").fetchone()[0] == \
+        conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+    print("triggers      recipe_search follows update, ingredient insert, move and delete")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(17)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'recipes.jsonl')
+        write_recipes(path, count, rng)
+        database.configure(os.path.join(tmp, 'search.db'))
+        database.init_db()
+        started = time.perf_counter()
+        importer.import_recipes(path)
+        print(f"{count} recipes imported and indexed in {time.perf_counter() - started:.1f}s")
+
+        for query in QUERIES[:3]:
+            print(f"  {query!r}: {[name for _, name, _, _ in search.search(query)[:3]]}")
+        fts_p50, fts_p99 = measure(search.search, 20)
+        like_p50, like_p99 = measure(like_search, 1)
+        print(f"fts5          p50 {fts_p50 * 1000:8.2f} ms  p99 {fts_p99 * 1000:8.2f} ms")
+        print(f"like scan     p50 {like_p50 * 1000:8.2f} ms  p99 {like_p99 * 1000:8.2f} ms")
+        check_ranking()
+        check_triggers()
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
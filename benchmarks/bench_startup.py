@@ -0,0 +1,133 @@
+"""Cold start: time from launching `python main.py` to the first handled update.
+
+    python benchmarks/bench_startup.py [rounds] [foods]
+
+Each round starts main.main() in a fresh process against the fake Bot API
+with a /help update already waiting, and reports when the bot first asked
+for updates (ready) and when the reply arrived (first reply). The fresh
+database rounds create and seed the schema; the restart rounds reuse a
+database at the current schema version holding `foods` extra products.
+The "seeds missing" rounds restart on a current schema with an emptied
+seed table (health_tips), which init_db() has to refill before the bot
+can answer.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_bot_api import FakeBotApi
+
+TIMEOUT = 30
+
+
+def child(api_url, db_path):
+    import telebot
+    telebot.apihelper.API_URL = api_url
+
+    import database
+    import main
+
+    database.configure(db_path)
+    main.main()
+
+
+def help_update():
+    return {'message': {
+        'message_id': 1, 'date': int(time.time()),
+        'chat': {'id': 1, 'type': 'private'}, 'from': {'id': 1, 'is_bot': False, 'first_name': 'User1'},
+        'text': '/help', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}]
+    }}
+
+
+def prepare(db_path, foods):
+    import database
+
+    database.configure(db_path)
+    database.init_db()
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO food_data (name, calories, protein, fats, carbs) VALUES (?, ?, 1, 1, 1)",
+            ((f"Продукт {i:07d}", 100 + i % 500) for i in range(foods))
+        )
+    database.close_connections()
+
+
+def empty_seed(db_path):
+    import database
+
+    database.configure(db_path)
+    conn = database.get_connection()
+    with conn:
+        conn.execute("DELETE FROM health_tips")
+    database.close_connections()
+
+
+def start_once(tmp, db_path):
+    server = FakeBotApi().start()
+    update_id = server.push_update(help_update())
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--child', server.api_url, db_path],
+        cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + TIMEOUT
+        while not server.sent and time.monotonic() < deadline:
+            time.sleep(0.002)
+        if not server.sent:
+            raise RuntimeError("no reply from the bot")
+        return server.update_served_at[update_id] - started, server.sent[0]['at'] - started
+    finally:
+        process.kill()
+        process.wait()
+        server.stop()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    foods = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    tmp = tempfile.mkdtemp(prefix='planeat-startup-')
+    try:
+        print(f"{'start':<16} {'ready p50':>10} {'reply p50':>10} {'reply max':>10}")
+        fresh_path = os.path.join(tmp, 'fresh.db')
+        restart_path = os.path.join(tmp, 'restart.db')
+        prepare(restart_path, foods)
+        unseeded_path = os.path.join(tmp, 'unseeded.db')
+        prepare(unseeded_path, 0)
+        runs = (('fresh database', fresh_path), ('restart', restart_path), ('seeds missing', unseeded_path))
+        for label, db_path in runs:
+            ready, replied = [], []
+            for _ in range(rounds):
+                if db_path == fresh_path:
+                    for suffix in ('', '-wal', '-shm'):
+                        if os.path.exists(db_path + suffix):
+                            os.remove(db_path + suffix)
+                elif db_path == unseeded_path:
+                    empty_seed(db_path)
+                first_poll, first_reply = start_once(tmp, db_path)
+                ready.append(first_poll)
+                replied.append(first_reply)
+            print(f"{label:<16} {percentile(ready, 0.5) * 1000:>8.0f}ms {percentile(replied, 0.5) * 1000:>8.0f}ms "
+                  f"{max(replied) * 1000:>8.0f}ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:4])
+    else:
+        main()
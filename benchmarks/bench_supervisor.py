@@ -0,0 +1,111 @@
+"""Supervisor mode: throughput over 1..N worker processes and per-chat order.
+
+    python benchmarks/bench_supervisor.py [chats] [max_processes] [api_latency_seconds]
+
+For each process count, supervisor.Supervisor long-polls the fake Bot API
+(which serves every update at once), forwards updates to its workers by
+chat id, and the time until each update has its reply is measured. Every
+chat sends a few messages (/help, a /track answer, /search) and the replies
+must come back in the order the messages were sent. Throughput only grows
+with the number of processes while there are cores to run them.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telebot import apihelper
+
+import database
+import messages
+import supervisor
+from fake_bot_api import FakeBotApi
+
+PER_CHAT = 4
+
+
+def chat_messages(chat_id, first_message_id):
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f"User{chat_id}"}
+    chat = {'id': chat_id, 'type': 'private'}
+    prompt = {'message_id': first_message_id - 1, 'date': int(time.time()), 'chat': chat,
+              'from': {'id': 1, 'is_bot': True, 'first_name': 'PlanEat'}, 'text': messages.TRACK_PROMPT}
+    texts = ['/help', '200г курицы и 150 г риса', '/search курица рис', '/help']
+    result = []
+    for offset, text in enumerate(texts[:PER_CHAT]):
+        message = {'message_id': first_message_id + offset, 'date': int(time.time()), 'chat': chat, 'from': user,
+                   'text': text}
+        if text.startswith('/'):
+            length = len(text.split()[0])
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': length}]
+        else:
+            message['reply_to_message'] = prompt
+        result.append({'message': message})
+    return result
+
+
+def run(processes, chats, latency, tmp):
+    db_path = os.path.join(tmp, f'supervisor-{processes}.db')
+    database.configure(db_path)
+    database.init_db()
+    database.close_connections()
+
+    server = FakeBotApi(latency=latency).start()
+    apihelper.API_URL = server.api_url
+    pool = supervisor.Supervisor(processes, db_path=db_path, api_url=server.api_url).start()
+    # Let the workers import main and connect before timing
+    time.sleep(3)
+
+    expected = {}
+    for chat_id in range(1, chats + 1):
+        for update in chat_messages(chat_id, chat_id * 100):
+            server.push_update(update)
+            expected.setdefault(chat_id, []).append(update['message']['message_id'])
+    total = sum(len(ids) for ids in expected.values())
+
+    started = time.perf_counter()
+    polling = threading.Thread(target=pool.poll, daemon=True)
+    polling.start()
+    deadline = time.monotonic() + 300
+    while len({item['reply_to'] for item in server.sent if item['reply_to']}) < total and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    database.configure(db_path)
+    leases = database.get_connection().execute("SELECT holder FROM leases WHERE name = 'reminders'").fetchall()
+    database.close_connections()
+    pool.stop()
+    polling.join()
+
+    replies = {}
+    for item in sorted(server.sent, key=lambda item: item['at']):
+        if item['reply_to']:
+            replies.setdefault(item['chat_id'], []).append(item['reply_to'])
+    in_order = sum(replies.get(chat_id) == ids for chat_id, ids in expected.items())
+    server.stop()
+    answered = sum(len(ids) for ids in replies.values())
+    print(f"{processes:>9} {answered:>6}/{total:<6} {answered / elapsed:>9.1f}/s {in_order:>6}/{chats:<6} "
+          f"{pool.stats['restarts']:>8}  {leases[0][0] if leases else '-'}")
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    max_processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+
+    print(f"{chats} chats x {PER_CHAT} messages, API latency {latency * 1000:.0f} ms, {os.cpu_count()} cores")
+    print(f"{'processes':>9} {'answered':>13} {'throughput':>11} {'in order':>13} {'restarts':>8}  reminder lease")
+    tmp = tempfile.mkdtemp(prefix='planeat-supervisor-')
+    try:
+        processes = 1
+        while processes <= max_processes:
+            run(processes, chats, latency, tmp)
+            processes *= 2
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Local stand-in for the Telegram Bot API used by the benchmarks.
+
+Point pyTelegramBotAPI at it with
+
+    telebot.apihelper.API_URL = server.api_url
+
+It answers getMe, getUpdates, sendMessage, sendPhoto, setWebhook and
+deleteWebhook, can inject latency, 429s (with retry_after) and 5xx errors,
+answers 403 for chats listed in blocked_chats, and records every outgoing
+message with a timestamp.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+class FakeBotApi:
+    def __init__(self, latency=0.0, rate_limit_ratio=0.0, retry_after=1, server_error_ratio=0.0,
+                 blocked_chats=(), host='127.0.0.1', port=0, seed=None):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.server_error_ratio = server_error_ratio
+        self.blocked_chats = set(blocked_chats)
+        self.sent = []
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._updates = []
+        self._updates_ready = threading.Condition(self._lock)
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self.update_served_at = {}
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without TCP_NODELAY
+            # keep-alive clients stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _respond(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit('/', 1)[-1]
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if body and content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode('utf-8')))
+                elif body and content_type.startswith('application/json'):
+                    params.update(json.loads(body))
+                status, payload = api.handle(method, params)
+                self._respond(status, payload)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def handle(self):
+                # Clients killed mid-request (bench_startup.py) just go away
+                try:
+                    super().handle()
+                except ConnectionError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return self.base_url + "/bot{0}/{1}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def push_update(self, update):
+        """Queue an update (dict without update_id) for getUpdates."""
+        with self._updates_ready:
+            update = dict(update, update_id=self._next_update_id)
+            self._next_update_id += 1
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+            return update['update_id']
+
+    def _error(self, code, description, **parameters):
+        payload = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            payload['parameters'] = parameters
+        return code, payload
+
+    def _message(self, chat_id, **fields):
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'PlanEat'}
+        }
+        message.update(fields)
+        return message
+
+    def handle(self, method, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self._get_updates(params)}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'PlanEat', 'username': 'planeat_bot'}}
+        if method in ('setWebhook', 'deleteWebhook'):
+            return 200, {'ok': True, 'result': True}
+
+        if self.latency:
+            time.sleep(self.latency)
+        roll = self._random.random()
+        if roll < self.rate_limit_ratio:
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        if roll < self.rate_limit_ratio + self.server_error_ratio:
+            return self._error(502, "Bad Gateway")
+
+        chat_id = int(params.get('chat_id', 0))
+        if chat_id in self.blocked_chats:
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        fields = {}
+        if method == 'sendMessage':
+            fields['text'] = params.get('text', '')
+        elif method == 'sendPhoto':
+            fields['photo'] = [{'file_id': f"photo-{chat_id}", 'file_unique_id': f"u{chat_id}", 'width': 1, 'height': 1}]
+        else:
+            return 200, {'ok': True, 'result': True}
+
+        message = self._message(chat_id, **fields)
+        with self._lock:
+            self.sent.append({
+                'method': method,
+                'chat_id': chat_id,
+                'reply_to': int(params['reply_to_message_id']) if params.get('reply_to_message_id') else None,
+                'text': fields.get('text'),
+                'at': time.perf_counter()
+            })
+        return 200, {'ok': True, 'result': message}
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        limit = int(params.get('limit', 100) or 100)
+        timeout = float(params.get('timeout', 0) or 0)
+        deadline = time.monotonic() + min(timeout, 1.0)
+        with self._updates_ready:
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._updates_ready.wait(deadline - time.monotonic())
+            batch = self._updates[:limit]
+            now = time.perf_counter()
+            for update in batch:
+                self.update_served_at.setdefault(update['update_id'], now)
+            return batch
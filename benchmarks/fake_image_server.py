@@ -0,0 +1,74 @@
+"""Local stand-in for the recipe image hosts used by the benchmarks.
+
+    server = FakeImageServer(latency=0.05).start()
+    url = server.url('salad', 20000)   # a 20000-byte image
+
+Every path /<name>/<size> serves `size` bytes derived from the name, with
+an ETag; a request whose If-None-Match matches gets 304 without a body.
+Requests are counted per path (server.requests) and by status
+(server.statuses).
+"""
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeImageServer:
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.requests = {}
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                name, _, size = self.path.strip('/').partition('/')
+                etag = f'"{hashlib.md5(self.path.encode()).hexdigest()}"'
+                with server._lock:
+                    server.requests[self.path] = server.requests.get(self.path, 0) + 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if not size.isdigit():
+                    status, body = 404, b''
+                elif self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+                else:
+                    status, body = 200, image_bytes(name, int(size))
+                with server._lock:
+                    server.statuses[status] = server.statuses.get(status, 0) + 1
+                self.send_response(status)
+                if status != 404:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://{host}:{self._server.server_address[1]}"
+
+    def url(self, name, size):
+        return f"{self.base_url}/{name}/{size}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='fake-image-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def image_bytes(name, size):
+    block = hashlib.sha256(name.encode()).digest()
+    return (block * (size // len(block) + 1))[:size]
@@ -0,0 +1,265 @@
+"""End-to-end load test of main.py against the fake Bot API.
+
+    python benchmarks/loadtest.py [--users 2000] [--per-user 5] [--rate 0]
+                                  [--latency 0.01] [--rate-limit 0.0]
+    python benchmarks/loadtest.py --dump updates.jsonl
+
+main.bot is started unchanged with infinity_polling(); the generated updates
+are served through getUpdates and every update is matched with its answer.
+Reports throughput, p50/p99 latency (getUpdates -> reply) and per-query
+database timings from metrics.py. Recipe images are served by a local
+benchmarks/fake_image_server.py, so no request leaves the machine. --dump
+writes the generated mix as JSONL for benchmarks/post_updates.py instead
+of running it.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import messages
+
+# Relative frequency of each action in a simulated session
+MIX = (
+    ('track_reply', 35),
+    ('recipe_button', 20),
+    ('plan_button', 15),
+    ('track', 10),
+    ('start', 8),
+    ('command', 12),
+)
+COMMANDS = ('/help', '/today', '/week', '/stats', '/healthtip', '/plan', '/recipe')
+MEALS = (
+    '200г курицы и 150 г риса', '2 яйца и тост', 'овсянка с бананом', 'гречка 200 г с говядиной',
+    'творог 150г и яблоко', 'салат из огурцов и помидоров', 'лосось 120 г с картофелем', '1 стакан молока'
+)
+
+
+def _command(text):
+    return {'text': text, 'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]}
+
+
+def generate_updates(users, per_user, seed=1):
+    """Per-user sessions interleaved across users; each chat keeps its order.
+
+    Every session starts with /start; the rest is drawn from MIX. Message ids
+    are unique across the whole run so replies can be matched to updates.
+    """
+    rng = random.Random(seed)
+    actions = [action for action, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    sessions = []
+    message_id = 1
+    for user_id in range(1, users + 1):
+        user = {'id': 100000 + user_id, 'is_bot': False, 'first_name': f"User{user_id}", 'username': f"user{user_id}"}
+        chat = {'id': user['id'], 'type': 'private', 'first_name': user['first_name']}
+        session = []
+        for i in range(per_user):
+            action = 'start' if i == 0 else rng.choices(actions, weights)[0]
+            message = {'message_id': message_id, 'date': int(time.time()), 'chat': chat, 'from': user}
+            if action == 'start':
+                message.update(_command('/start'))
+            elif action == 'track':
+                message.update(_command('/track'))
+            elif action == 'command':
+                message.update(_command(rng.choice(COMMANDS)))
+            elif action == 'plan_button':
+                message['text'] = rng.choice(messages.GOAL_BUTTONS)
+            elif action == 'recipe_button':
+                message['text'] = rng.choice(messages.MEAL_TYPE_BUTTONS)
+            else:
+                message['text'] = rng.choice(MEALS)
+                message['reply_to_message'] = {
+                    'message_id': message_id - 1, 'date': int(time.time()), 'chat': chat,
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'PlanEat'}, 'text': messages.TRACK_PROMPT
+                }
+            session.append({'message': message})
+            message_id += 1
+        sessions.append(session)
+
+    updates = []
+    while sessions:
+        rng.shuffle(sessions)
+        for session in sessions:
+            updates.append(session.pop(0))
+        sessions = [session for session in sessions if session]
+    return updates
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class ReplyMatcher:
+    """Pairs every pushed update with the first bot message that answers it.
+
+    Handlers answer with reply_to except /track, whose prompt is a plain
+    sendMessage; those are matched per chat in order.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.seen = 0
+        self.answered_at = {}
+        self.track_waiting = {}
+
+    def expect_track(self, chat_id, message_id):
+        self.track_waiting.setdefault(chat_id, []).append(message_id)
+
+    def poll(self):
+        sent = self.server.sent
+        while self.seen < len(sent):
+            item = sent[self.seen]
+            self.seen += 1
+            if item['reply_to'] is not None:
+                self.answered_at.setdefault(item['reply_to'], item['at'])
+            elif item['text'] == messages.TRACK_PROMPT and self.track_waiting.get(item['chat_id']):
+                self.answered_at.setdefault(self.track_waiting[item['chat_id']].pop(0), item['at'])
+        return len(self.answered_at)
+
+
+def print_histogram(title, histogram):
+    print(f"\n{title}")
+    series = histogram.snapshot()
+    for labels, (count, total) in sorted(series.items()):
+        print(f"  {labels[0]:<24} {count:>7} "
+              f"{histogram.quantile(0.5, *labels) * 1000:>8.2f} ms "
+              f"{histogram.quantile(0.99, *labels) * 1000:>8.2f} ms "
+              f"{total:>8.2f} s")
+    return series
+
+
+def dump(path, updates):
+    with open(path, 'w', encoding='utf-8') as f:
+        for update_id, update in enumerate(updates, 1):
+            f.write(json.dumps(dict(update, update_id=update_id), ensure_ascii=False) + '\n')
+    print(f"{len(updates)} updates written to {path}")
+
+
+def run(args, updates):
+    from fake_bot_api import FakeBotApi
+    from fake_image_server import FakeImageServer
+
+    server = FakeBotApi(latency=args.latency, rate_limit_ratio=args.rate_limit, seed=2).start()
+    images = FakeImageServer(latency=args.latency).start()
+
+    import telebot
+    telebot.apihelper.API_URL = server.api_url
+
+    import conversation
+    import database
+    import main
+    import metrics
+    import user_writer
+
+    tmp = tempfile.mkdtemp(prefix='planeat-loadtest-')
+    database.configure(os.path.join(tmp, 'loadtest.db'))
+    database.init_db()
+    conn = database.get_connection()
+    with conn:
+        # The seeded recipes point at real image hosts
+        for (recipe_id,) in conn.execute("SELECT id FROM recipes").fetchall():
+            conn.execute("UPDATE recipes SET image_url = ? WHERE id = ?", (images.url(f"recipe{recipe_id}", 50000), recipe_id))
+    metrics.instrument_bot_api()
+    user_writer.writer.start()
+    conversation.sessions.start()
+    if not args.flood_control:
+        # Offered all at once, the updates would mostly be served degraded
+        main.router.limiter = None
+
+    matcher = ReplyMatcher(server)
+    update_ids = {}
+    for update in updates:
+        message = update['message']
+        if message['text'] == '/track':
+            matcher.expect_track(message['chat']['id'], message['message_id'])
+
+    polling = threading.Thread(
+        target=main.bot.infinity_polling, kwargs={'timeout': 5, 'long_polling_timeout': 1}, daemon=True
+    )
+    polling.start()
+
+    started = time.perf_counter()
+    interval = 1.0 / args.rate if args.rate else 0.0
+    for i, update in enumerate(updates):
+        if interval:
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        update_ids[update['message']['message_id']] = server.push_update(update)
+
+    deadline = time.monotonic() + args.timeout
+    while matcher.poll() < len(updates) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    main.bot.stop_polling()
+    user_writer.writer.stop()
+    conversation.sessions.stop()
+
+    latencies = []
+    finished = started
+    for message_id, answered_at in matcher.answered_at.items():
+        served_at = server.update_served_at.get(update_ids.get(message_id))
+        if served_at is not None:
+            latencies.append(answered_at - served_at)
+        finished = max(finished, answered_at)
+    elapsed = finished - started
+
+    print(f"{len(updates)} updates from {args.users} users, API latency {args.latency * 1000:.0f} ms, "
+          f"429 ratio {args.rate_limit:.2f}")
+    print(f"answered      {len(latencies)} / {len(updates)}")
+    print(f"throughput    {len(latencies) / elapsed:.1f} updates/s  ({elapsed:.2f}s)")
+    print(f"latency       p50 {percentile(latencies, 0.5) * 1000:.1f} ms  p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"api calls     {dict(sorted(server.calls.items()))}")
+    if main.router.limiter is not None:
+        print(f"flood control {main.router.limiter.stats()}")
+
+    if metrics.ENABLED:
+        print_histogram("bot api (per method: calls, p50, p99, total)", metrics.BOT_API_SECONDS)
+        for (method, code), count in sorted(metrics.BOT_API_ERRORS.snapshot().items()):
+            print(f"  {method} failed with {code}: {count}")
+        queries = print_histogram("database (per query: calls, p50, p99, total)", metrics.DB_QUERY_SECONDS)
+        db_total = sum(total for _, total in queries.values())
+        handler_total = sum(total for _, total in metrics.HANDLER_SECONDS.snapshot().values())
+        errors = sum(metrics.DB_ERRORS.snapshot().values())
+        print(f"  time in database {db_total:.2f}s of {handler_total:.2f}s in handlers, {errors} query errors (locked/busy)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--per-user', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=0, help="updates per second to offer, 0 = all at once")
+    parser.add_argument('--latency', type=float, default=0.01, help="fake Bot API latency, seconds")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="share of sends answered with 429")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-metrics', action='store_true', help="run without metrics.py instrumentation")
+    parser.add_argument('--flood-control', action='store_true', help="keep flood_control.py limits on")
+    parser.add_argument('--dump', metavar='PATH', help="only write the generated updates as JSONL")
+    args = parser.parse_args()
+
+    updates = generate_updates(args.users, args.per_user, args.seed)
+    if args.dump:
+        dump(args.dump, updates)
+        return
+
+    # Must be set before database.py is imported (decorators are applied then)
+    config.METRICS_ENABLED = not args.no_metrics
+    config.IMAGE_CACHE_DIR = tempfile.mkdtemp(prefix='planeat-images-')
+    run(args, updates)
+    # Do not wait for the image prefetch pool, which concurrent.futures joins at exit
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""POST recorded Telegram updates to a running webhook server.
+
+    python benchmarks/post_updates.py updates.jsonl [url] [secret] [repeat]
+
+The file holds one update per line (or a JSON array). Defaults come from
+config.py. Prints status codes and acknowledgement latency.
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import config
+
+
+def load_updates(path):
+    with open(path, encoding='utf-8') as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), 'sample_updates.jsonl')
+    url = sys.argv[2] if len(sys.argv) > 2 else f"http://{config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}"
+    secret = sys.argv[3] if len(sys.argv) > 3 else config.WEBHOOK_SECRET
+    repeat = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    updates = load_updates(path)
+    session = requests.Session()
+    statuses = {}
+    latencies = []
+    update_id = 1
+    for _ in range(repeat):
+        for update in updates:
+            update = dict(update, update_id=update_id)
+            update_id += 1
+            started = time.perf_counter()
+            response = session.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': secret})
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    latencies.sort()
+    print(f"posted {len(latencies)} updates: {statuses}")
+    print(f"ack latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+
+import requests
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+
+import config
+import database
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self._paused_until and self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds` (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+class Broadcaster:
+    """Fan-out delivery of many messages through the Bot API.
+
+    A pool of sender threads shares a global token bucket (Telegram allows
+    about 30 messages/s per bot) and keeps at least `per_chat_interval`
+    between messages to the same chat. 429 answers are retried after their
+    retry_after, 5xx and network errors with exponential backoff; chats that
+    blocked the bot are recorded in blocked_chats and skipped.
+    """
+
+    def __init__(self, send, rate=None, per_chat_interval=None, workers=None, max_retries=None):
+        self.send = send
+        # No burst allowance: messages are spaced evenly so no 1s window exceeds the rate
+        self.bucket = TokenBucket(rate or config.BROADCAST_RATE, capacity=1)
+        self.per_chat_interval = per_chat_interval if per_chat_interval is not None else config.BROADCAST_PER_CHAT_INTERVAL
+        self.workers = workers or config.BROADCAST_WORKERS
+        self.max_retries = max_retries if max_retries is not None else config.BROADCAST_MAX_RETRIES
+
+        self._ready = queue.Queue()
+        self._delayed = []
+        self._delayed_cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._next_allowed = {}
+        self._chat_lock = threading.Lock()
+        self._blocked = set()
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self.metrics = {
+            'submitted': 0, 'sent': 0, 'failed': 0, 'blocked': 0, 'skipped': 0,
+            'retried': 0, 'rate_limited': 0, 'latency_total': 0.0
+        }
+        self._metrics_lock = threading.Lock()
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._threads = [threading.Thread(target=self._delay_loop, name='broadcast-delay', daemon=True)]
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker, name=f'broadcast-{i}', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._delayed_cond:
+            self._delayed_cond.notify_all()
+        for _ in range(self.workers):
+            self._ready.put(None)
+
+    def submit(self, chat_id, text, **kwargs):
+        with self._pending_cond:
+            self._pending += 1
+        self._count('submitted')
+        self._ready.put([chat_id, text, kwargs, 0, time.monotonic()])
+
+    def unblock(self, chat_id):
+        """Deliver to the chat again after it unblocked the bot (/start, /setreminder)."""
+        self._blocked.discard(chat_id)
+
+    def join(self, timeout=None):
+        """Wait until every submitted message is delivered or given up on."""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def stats(self):
+        with self._metrics_lock:
+            stats = dict(self.metrics)
+        stats['queued'] = self._ready.qsize() + len(self._delayed)
+        stats['avg_latency'] = stats['latency_total'] / stats['sent'] if stats['sent'] else 0.0
+        return stats
+
+    def _count(self, name, value=1):
+        with self._metrics_lock:
+            self.metrics[name] += value
+
+    def _done(self, outcome):
+        self._count(outcome)
+        with self._pending_cond:
+            self._pending -= 1
+            if self._pending == 0:
+                self._pending_cond.notify_all()
+
+    def _delay(self, job, seconds):
+        with self._delayed_cond:
+            heapq.heappush(self._delayed, (time.monotonic() + seconds, next(self._sequence), job))
+            self._delayed_cond.notify()
+
+    def _delay_loop(self):
+        with self._delayed_cond:
+            while self._running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.put(heapq.heappop(self._delayed)[2])
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._delayed_cond.wait(timeout)
+
+    def _reserve_chat(self, chat_id):
+        """Return 0 if the chat may be messaged now, else seconds to wait."""
+        with self._chat_lock:
+            now = time.monotonic()
+            allowed = self._next_allowed.get(chat_id, 0.0)
+            if allowed > now:
+                return allowed - now
+            self._next_allowed[chat_id] = now + self.per_chat_interval
+            if len(self._next_allowed) > 100000:
+                self._next_allowed = {chat: at for chat, at in self._next_allowed.items() if at > now}
+            return 0
+
+    def _backoff(self, attempt):
+        return config.BROADCAST_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+
+    def _classify(self, error, attempt):
+        """Return ('retry', delay), ('blocked', None) or ('failed', None)."""
+        if isinstance(error, ApiTelegramException):
+            if error.error_code == 429:
+                retry_after = (error.result_json.get('parameters') or {}).get('retry_after', 1)
+                self.bucket.pause(retry_after)
+                self._count('rate_limited')
+                return 'retry', float(retry_after)
+            if error.error_code == 403 or (error.error_code == 400 and 'chat not found' in error.description):
+                return 'blocked', None
+            if error.error_code >= 500:
+                return 'retry', self._backoff(attempt)
+            return 'failed', None
+        if isinstance(error, ApiHTTPException) and error.result.status_code >= 500:
+            return 'retry', self._backoff(attempt)
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return 'retry', self._backoff(attempt)
+        return 'failed', None
+
+    def _worker(self):
+        while True:
+            job = self._ready.get()
+            if job is None:
+                return
+            chat_id, text, kwargs, attempt, submitted_at = job
+            if chat_id in self._blocked:
+                self._done('skipped')
+                continue
+
+            # Reserve the chat only once a global token is in hand, so time
+            # spent waiting on the bucket cannot squeeze two sends together.
+            self.bucket.acquire()
+            wait = self._reserve_chat(chat_id)
+            if wait:
+                self._delay(job, wait)
+                continue
+
+            try:
+                self.send(chat_id, text, **kwargs)
+            except Exception as e:
+                outcome, delay = self._classify(e, attempt)
+                if outcome == 'retry' and attempt < self.max_retries:
+                    job[3] = attempt + 1
+                    self._count('retried')
+                    self._delay(job, delay)
+                    continue
+                if outcome == 'blocked':
+                    self._blocked.add(chat_id)
+                    try:
+                        database.mark_chat_blocked(chat_id, str(e))
+                    except Exception as db_error:
+                        logging.error(f"Не удалось отметить чат {chat_id} как заблокированный: {str(db_error)}")
+                    self._done('blocked')
+                else:
+                    logging.error(f"Не удалось доставить сообщение в чат {chat_id}: {str(e)}")
+                    self._done('failed')
+                continue
+
+            self._count('latency_total', time.monotonic() - submitted_at)
+            self._done('sent')
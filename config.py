@@ -1,2 +1,111 @@
 TOKEN = "token-here"
 
+# "threaded" (TeleBot worker threads) or "asyncio" (AsyncTeleBot, see async_main.py)
+RUNTIME = "threaded"
+
+# How updates arrive: "polling" (getUpdates) or "webhook" (see webhook.py).
+# WEBHOOK_URL is the public https base URL, e.g. of a reverse proxy that
+# forwards WEBHOOK_PATH to WEBHOOK_HOST:WEBHOOK_PORT.
+UPDATE_MODE = "polling"
+WEBHOOK_URL = "https://example.com"
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT = 8443
+WEBHOOK_SECRET = "change-me"
+WEBHOOK_WORKERS = 8
+WEBHOOK_QUEUE_SIZE = 10000
+
+# SQLite
+DB_PATH = "users.db"
+DB_BUSY_TIMEOUT = 5.0
+DB_JOURNAL_MODE = "WAL"
+DB_SYNCHRONOUS = "NORMAL"
+DB_CACHE_SIZE = -8000  # negative value = size in KiB
+DB_MMAP_SIZE = 64 * 1024 * 1024
+DB_STATEMENT_CACHE = 256
+
+# Seconds between checks of the reference data version (see database._cached)
+REFERENCE_CACHE_CHECK_INTERVAL = 5.0
+
+# Maximum number of rendered replies kept by render_cache.py
+RENDER_CACHE_SIZE = 1024
+
+# Rows per page of the /foods and /recipes catalogs
+CATALOG_PAGE_SIZE = 8
+
+# /myplan: allowed deviation of a day's calories from the user's target
+PLAN_TOLERANCE = 0.10
+
+# Prometheus-format metrics (see metrics.py), read once at startup.
+# Served on METRICS_HOST:METRICS_PORT/metrics. In supervisor mode
+# (WORKER_PROCESSES > 1) worker i serves its own on METRICS_PORT + 1 + i.
+METRICS_ENABLED = False
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+
+# Recipe image cache (see image_cache.py)
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+IMAGE_PREFETCH_WORKERS = 4
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_REVALIDATE_INTERVAL = 6 * 60 * 60
+# The first warm-up waits until the bot has been handling updates for a while
+IMAGE_PREFETCH_DELAY = 30
+
+# Meal reminders (see reminders.py)
+REMINDER_TIMEZONE = "Europe/Moscow"
+REMINDER_CATCHUP_MINUTES = 5
+
+# Calendar days of the calorie diary (see diary.py)
+DIARY_TIMEZONE = REMINDER_TIMEZONE
+
+# Broadcast fan-out (see broadcast.py); Telegram allows ~30 messages/s per bot
+BROADCAST_RATE = 25
+BROADCAST_PER_CHAT_INTERVAL = 1.0
+BROADCAST_WORKERS = 8
+BROADCAST_MAX_RETRIES = 5
+BROADCAST_BACKOFF = 1.0
+
+# Write-behind queue for registrations and last-seen times (see user_writer.py):
+# a write is committed within USER_WRITE_INTERVAL seconds, sooner once
+# USER_WRITE_BATCH writes are queued
+USER_WRITE_INTERVAL = 0.5
+USER_WRITE_BATCH = 2000
+
+# Conversation state of multi-step flows (see conversation.py): a step
+# expires CONVERSATION_TTL seconds after it was set; beyond
+# CONVERSATION_MAX_SESSIONS chats the oldest sessions are dropped
+CONVERSATION_TTL = 3600
+CONVERSATION_MAX_SESSIONS = 100000
+# Keep sessions across restarts in the database, written every
+# CONVERSATION_FLUSH_INTERVAL seconds
+CONVERSATION_PERSIST = True
+CONVERSATION_FLUSH_INTERVAL = 1.0
+
+# Flood control (see flood_control.py); rates are requests per second,
+# bursts are requests
+FLOOD_CONTROL_ENABLED = True
+FLOOD_USER_RATE = 1.0
+FLOOD_USER_BURST = 10
+# Stricter budgets for expensive handlers, per user: handler name -> (rate, burst)
+FLOOD_COMMAND_LIMITS = {
+    'get_recipe': (0.2, 3),
+    'show_recipe': (0.2, 3),
+    'calculate_calories': (0.5, 5),
+    'search_recipes': (0.5, 5),
+    'search_reply': (0.5, 5),
+    'my_plan': (0.1, 3),
+}
+# Above this rate in total (Telegram delivers ~30 messages/s per bot),
+# requests are answered without photos
+FLOOD_GLOBAL_RATE = 30
+FLOOD_GLOBAL_BURST = 60
+FLOOD_EVICT_INTERVAL = 60
+
+# Supervisor mode (see supervisor.py): with WORKER_PROCESSES > 1 one process
+# receives the updates (UPDATE_MODE) and shards them by chat over worker
+# processes; WORKER_QUEUE_SIZE updates can wait per worker
+WORKER_PROCESSES = 1
+WORKER_QUEUE_SIZE = 10000
+# Lease that elects the worker running the reminder scheduler, seconds
+LEASE_TTL = 30
@@ -0,0 +1,176 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import config
+import database
+
+# Conversation state of multi-step flows (/track, /search without a query):
+# the step a chat is at and the little data collected so far. router.Router
+# sends the next message of a chat with a session to the handler of its
+# step, so answers no longer have to be recognised by the text of the
+# prompt they reply to.
+
+class Session:
+    __slots__ = ('state', 'data', 'expires_at')
+
+    def __init__(self, state, data, expires_at):
+        self.state = state
+        self.data = data
+        self.expires_at = expires_at
+
+class Conversations:
+    """Sessions by chat id with a TTL and a size limit.
+
+    A session expires `ttl` seconds after its last step (set()); beyond
+    `max_sessions` chats the least recently updated sessions are dropped.
+    Sessions are kept in update order, which with a single ttl is also
+    expiry order, so both evictions pop from the front. With `persist`,
+    steps and ends are written to the conversations table by a background
+    thread every `flush_interval` seconds (one transaction per flush), and
+    start() loads the sessions that have not expired yet. A supervisor
+    worker passes its shard=(index, processes) so it loads, and later
+    writes, only the chats it owns.
+    """
+
+    def __init__(self, ttl=None, max_sessions=None, persist=None, flush_interval=None):
+        self.ttl = ttl or config.CONVERSATION_TTL
+        self.max_sessions = max_sessions or config.CONVERSATION_MAX_SESSIONS
+        self.persist = config.CONVERSATION_PERSIST if persist is None else persist
+        self.flush_interval = flush_interval or config.CONVERSATION_FLUSH_INTERVAL
+        self._sessions = OrderedDict()
+        # chat id -> Session to save, or None to delete
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.metrics = {'started': 0, 'ended': 0, 'expired': 0, 'evicted': 0, 'loaded': 0, 'written': 0, 'errors': 0}
+
+    def get(self, chat_id):
+        """The chat's current Session, or None."""
+        session = self._sessions.get(chat_id)
+        if session is None:
+            return None
+        if session.expires_at <= time.time():
+            with self._lock:
+                if self._sessions.get(chat_id) is session:
+                    self._drop(chat_id, 'expired')
+            return None
+        return session
+
+    def state(self, chat_id):
+        session = self.get(chat_id)
+        return session.state if session else None
+
+    def set(self, chat_id, state, data=None):
+        """Move the chat to `state` (starting a session if needed); returns the Session."""
+        now = time.time()
+        session = Session(state, data, now + self.ttl)
+        with self._lock:
+            if self._sessions.pop(chat_id, None) is None:
+                self.metrics['started'] += 1
+            self._sessions[chat_id] = session
+            if self.persist:
+                self._dirty[chat_id] = session
+            self._evict(now)
+        return session
+
+    def end(self, chat_id):
+        """End the chat's session; a no-op without one."""
+        if chat_id not in self._sessions:
+            return
+        with self._lock:
+            if chat_id in self._sessions:
+                self._drop(chat_id, 'ended')
+
+    def _drop(self, chat_id, counter):
+        # Called with the lock held
+        del self._sessions[chat_id]
+        if self.persist:
+            self._dirty[chat_id] = None
+        self.metrics[counter] += 1
+
+    def _evict(self, now):
+        # Called with the lock held; the front holds the oldest sessions
+        sessions = self._sessions
+        while sessions:
+            chat_id, session = next(iter(sessions.items()))
+            if session.expires_at <= now:
+                self._drop(chat_id, 'expired')
+            elif len(sessions) > self.max_sessions:
+                self._drop(chat_id, 'evicted')
+            else:
+                break
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def load(self, shard=None):
+        """Read the sessions that have not expired from the database."""
+        rows = database.load_conversations(time.time(), shard)
+        with self._lock:
+            for chat_id, state, data, expires_at in rows:
+                self._sessions[chat_id] = Session(state, json.loads(data) if data else None, expires_at)
+            self._evict(time.time())
+            self.metrics['loaded'] += len(rows)
+        return len(rows)
+
+    def start(self, shard=None):
+        if not self.persist or self._thread is not None:
+            return self
+        self.load(shard)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='conversations', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background thread and write what is left."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.persist:
+            self.flush()
+
+    def flush(self):
+        """Write the changed sessions in one transaction; returns their number."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                saved = [
+                    (chat_id, session.state, json.dumps(session.data, ensure_ascii=False) if session.data else None,
+                     session.expires_at)
+                    for chat_id, session in dirty.items() if session is not None
+                ]
+            if not dirty:
+                return 0
+            ended = [chat_id for chat_id, session in dirty.items() if session is None]
+            try:
+                database.save_conversations(saved, ended)
+            except Exception as e:
+                logging.error(f"Не удалось сохранить диалоги ({len(dirty)} записей): {str(e)}")
+                with self._lock:
+                    # Newer changes win
+                    self._dirty = {**dirty, **self._dirty}
+                    self.metrics['errors'] += 1
+                return 0
+            with self._lock:
+                self.metrics['written'] += len(dirty)
+            return len(dirty)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            with self._lock:
+                self._evict(time.time())
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, sessions=len(self._sessions), unsaved=len(self._dirty))
+
+# Shared by the routers of main.py and async_main.py
+sessions = Conversations()
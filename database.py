@@ -1,13 +1,167 @@
+import hashlib
 import logging
 import sqlite3
+import threading
+import time
+
+import config
+import food_matcher
+import metrics
+import migrations
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
 
+# Every thread (telebot worker, scheduler) keeps one long-lived connection, so
+# the pragmas are applied once and sqlite3's statement cache stays warm.
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+_db_path = config.DB_PATH
+
+def configure(db_path):
+    """Switch to another database file and drop every open connection."""
+    global _db_path
+    close_connections()
+    _db_path = db_path
+
+def _open_connection():
+    conn = sqlite3.connect(
+        _db_path,
+        timeout=config.DB_BUSY_TIMEOUT,
+        cached_statements=config.DB_STATEMENT_CACHE,
+        check_same_thread=False
+    )
+    conn.execute(f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = {int(config.DB_CACHE_SIZE)}")
+    conn.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}")
+    return conn
+
+def get_connection():
+    """Return the calling thread's connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.generation != _generation:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.generation = _generation
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+def close_connections():
+    """Close all pooled connections; threads reconnect lazily on next use."""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        conn.close()
+
+# Reference data (plans, recipes, foods, tips) is read on almost every message
+# but changes rarely. It is cached in memory; triggers bump
+# reference_version on every write, and the cache compares against it at most
+# once per REFERENCE_CACHE_CHECK_INTERVAL seconds. Cached values are shared
+# between callers and must not be mutated.
+REFERENCE_TABLES = ('meal_plans', 'recipes', 'recipe_ingredients', 'food_data', 'health_tips')
+
+_reference_cache = {}
+_reference_lock = threading.RLock()
+_reference_stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+_reference_version = None
+_reference_checked_at = 0.0
+
+@metrics.timed_query
+def _read_reference_version():
+    row = get_connection().execute("SELECT version FROM reference_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+def _check_reference_version():
+    global _reference_version, _reference_checked_at
+    now = time.monotonic()
+    if now - _reference_checked_at < config.REFERENCE_CACHE_CHECK_INTERVAL:
+        return
+    with _reference_lock:
+        if now - _reference_checked_at < config.REFERENCE_CACHE_CHECK_INTERVAL:
+            return
+        version = _read_reference_version()
+        if version != _reference_version:
+            if _reference_version is not None:
+                _reference_stats['reloads'] += 1
+                logging.info(f"Reference data changed (version {_reference_version} -> {version}), cache cleared")
+            _reference_cache.clear()
+            _reference_version = version
+        _reference_checked_at = now
+
+def _cached(key, loader):
+    _check_reference_version()
+    try:
+        value = _reference_cache[key]
+    except KeyError:
+        pass
+    else:
+        _reference_stats['hits'] += 1
+        return value
+
+    with _reference_lock:
+        if key in _reference_cache:
+            _reference_stats['hits'] += 1
+            return _reference_cache[key]
+        _reference_stats['misses'] += 1
+        value = loader()
+        _reference_cache[key] = value
+        return value
+
+def invalidate_reference_cache():
+    """Force the next cached read to re-check the reference data version."""
+    global _reference_checked_at
+    with _reference_lock:
+        _reference_checked_at = 0.0
+
+def reference_version():
+    """Version of the reference data currently held in the cache."""
+    _check_reference_version()
+    return _reference_version
+
+def reference_cache_stats():
+    return dict(_reference_stats, version=_reference_version, size=len(_reference_cache))
+
+def _is_seeded(conn):
+    return conn.execute(
+        "SELECT EXISTS (SELECT 1 FROM meal_plans) AND EXISTS (SELECT 1 FROM recipes) "
+        "AND EXISTS (SELECT 1 FROM food_data) AND EXISTS (SELECT 1 FROM health_tips)"
+    ).fetchone()[0]
+
+def restore_deferred_indexes(conn):
+    """Rebuild the indexes an import dropped and never got to recreate."""
+    if not conn.execute("SELECT EXISTS (SELECT 1 FROM deferred_indexes)").fetchone()[0]:
+        return
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have rebuilt them while we waited for the lock
+        for name, sql in conn.execute("SELECT name, sql FROM deferred_indexes").fetchall():
+            conn.execute(sql)
+            logging.warning(f"Index {name} left dropped by an unfinished import rebuilt")
+        conn.execute("DELETE FROM deferred_indexes")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
 def init_db():
-    conn = sqlite3.connect('users.db')
+    conn = get_connection()
+    # A restart against an up-to-date, seeded database has nothing to create:
+    # skip the DDL, triggers and seed checks
+    if migrations.schema_version(conn) == migrations.LATEST_VERSION and _is_seeded(conn):
+        restore_deferred_indexes(conn)
+        invalidate_reference_cache()
+        logging.info(f"Database schema is up to date (version {migrations.LATEST_VERSION})")
+        return
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -70,20 +224,129 @@ def init_db():
     )
     ''')
 
-    cursor.execute("SELECT COUNT(*) FROM meal_plans")
-    if cursor.fetchone()[0] == 0:
+    # One row per chat and meal; utc_minute is the minute of the UTC day the
+    # reminder is due at and is the bucket the scheduler reads each tick.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS reminders (
+        chat_id INTEGER NOT NULL,
+        meal TEXT NOT NULL,
+        local_time TEXT NOT NULL,
+        timezone TEXT NOT NULL,
+        utc_minute INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, meal)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_utc_minute ON reminders (utc_minute)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_slot ON reminders (timezone, local_time)")
+
+    # Calorie diary: one food_log row per /track entry, plus a per-day rollup
+    # kept up to date in the same transaction so /today, /week and /stats
+    # never have to aggregate the log.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS food_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        description TEXT,
+        calories REAL NOT NULL,
+        protein REAL NOT NULL,
+        fats REAL NOT NULL,
+        carbs REAL NOT NULL,
+        logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_food_log_user_date ON food_log (user_id, date)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS daily_totals (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        calories REAL NOT NULL DEFAULT 0,
+        protein REAL NOT NULL DEFAULT 0,
+        fats REAL NOT NULL DEFAULT 0,
+        carbs REAL NOT NULL DEFAULT 0,
+        entries INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, date)
+    ) WITHOUT ROWID
+    ''')
+
+    # Chats that blocked the bot; broadcasts and reminders skip them
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS blocked_chats (
+        chat_id INTEGER PRIMARY KEY,
+        reason TEXT,
+        blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # Telegram file_id of an already uploaded recipe photo, valid while the
+    # recipe keeps the same image_url (url_hash).
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recipe_photos (
+        recipe_id INTEGER PRIMARY KEY,
+        url_hash TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (recipe_id) REFERENCES recipes (id)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS reference_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO reference_version (id, version) VALUES (1, 0)")
+
+    migrations.migrate(conn)
+    # The reference_version insert above leaves a transaction open when no
+    # migration ran (and committed)
+    conn.commit()
+    restore_deferred_indexes(conn)
+
+    # Triggers and seed data commit together, so a seeded database at the
+    # latest version always has its triggers too
+    conn.execute("BEGIN IMMEDIATE")
+    # Triggers are (re)created after migrations, which may rebuild tables
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS recipes_image_url_photos AFTER UPDATE OF image_url ON recipes
+    BEGIN
+        DELETE FROM recipe_photos WHERE recipe_id = NEW.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS recipes_delete_photos AFTER DELETE ON recipes
+    BEGIN
+        DELETE FROM recipe_photos WHERE recipe_id = OLD.id;
+    END
+    ''')
+
+    _create_search_triggers(cursor)
+    _create_nutrition_triggers(cursor)
+
+    for table in REFERENCE_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table}
+            BEGIN
+                UPDATE reference_version SET version = version + 1 WHERE id = 1;
+            END
+            ''')
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM meal_plans)")
+    if not cursor.fetchone()[0]:
         insert_initial_meal_plans(cursor)
     
-    cursor.execute("SELECT COUNT(*) FROM recipes")
-    if cursor.fetchone()[0] == 0:
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM recipes)")
+    if not cursor.fetchone()[0]:
         insert_initial_recipes(cursor)
     
-    cursor.execute("SELECT COUNT(*) FROM food_data")
-    if cursor.fetchone()[0] == 0:
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM food_data)")
+    if not cursor.fetchone()[0]:
         insert_initial_food_data(cursor)
     
-    cursor.execute("SELECT COUNT(*) FROM health_tips")
-    if cursor.fetchone()[0] == 0:
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM health_tips)")
+    if not cursor.fetchone()[0]:
         initial_tips = [
             ("Питайся разнообразно и сбалансированно."),
             ("Уделяй достаточно времени на приготовление пищи."),
@@ -96,9 +359,89 @@ def init_db():
         logging.info("Initial health tips data inserted")
     
     conn.commit()
-    conn.close()
+    invalidate_reference_cache()
     logging.info("Database initialized with all tables and data")
 
+_RECIPE_INGREDIENTS = "(SELECT group_concat(ingredient, ' ') FROM recipe_ingredients WHERE recipe_id = {0})"
+
+def _create_search_triggers(cursor):
+    """Keep recipe_search (FTS5, one row per recipe) in step with recipes and their ingredients."""
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS recipes_search_insert AFTER INSERT ON recipes
+    BEGIN
+        INSERT INTO recipe_search (rowid, name, ingredients, instructions)
+        VALUES (NEW.id, NEW.name, {_RECIPE_INGREDIENTS.format('NEW.id')}, NEW.instructions);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS recipes_search_update AFTER UPDATE OF name, instructions ON recipes
+    BEGIN
+        UPDATE recipe_search SET name = NEW.name, instructions = NEW.instructions WHERE rowid = NEW.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS recipes_search_delete AFTER DELETE ON recipes
+    BEGIN
+        DELETE FROM recipe_search WHERE rowid = OLD.id;
+    END
+    ''')
+    create_ingredient_search_triggers(cursor)
+
+def create_ingredient_search_triggers(cursor, refresh_ids=None):
+    """Per-row triggers for recipe_ingredients; refresh_ids (a SELECT of recipe
+    ids) re-indexes the ingredients of recipes loaded while they were dropped."""
+    # A row moved to another recipe leaves the old one to re-index too
+    reindex = "UPDATE recipe_search SET ingredients = {0} WHERE rowid = {1}.recipe_id;"
+    for event, rows in (('INSERT', ('NEW',)), ('DELETE', ('OLD',)), ('UPDATE OF ingredient, recipe_id', ('NEW', 'OLD'))):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS recipe_ingredients_search_{event.split()[0].lower()} AFTER {event} ON recipe_ingredients
+        BEGIN
+            {' '.join(reindex.format(_RECIPE_INGREDIENTS.format(row + '.recipe_id'), row) for row in rows)}
+        END
+        ''')
+    if refresh_ids:
+        cursor.execute(
+            f"UPDATE recipe_search SET ingredients = {_RECIPE_INGREDIENTS.format('recipe_search.rowid')} "
+            f"WHERE rowid IN ({refresh_ids})"
+        )
+
+def _create_nutrition_triggers(cursor):
+    """Queue recipes for recipe_nutrition.py: ingredient edits and renamed or
+    deleted foods need the lines relinked, new food values only new sums."""
+    relink = ("INSERT INTO recipe_nutrition_dirty (recipe_id, relink) VALUES ({0}.recipe_id, 1) "
+              "ON CONFLICT (recipe_id) DO UPDATE SET relink = 1;")
+    for event, rows in (('INSERT', ('NEW',)), ('DELETE', ('OLD',)), ('UPDATE OF ingredient, recipe_id', ('NEW', 'OLD'))):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS recipe_ingredients_nutrition_{event.split()[0].lower()} AFTER {event} ON recipe_ingredients
+        BEGIN
+            {' '.join(relink.format(row) for row in rows)}
+        END
+        ''')
+    for name, event, row, flag in (
+        ('values', 'UPDATE OF calories, protein, fats, carbs', 'NEW', 0),
+        ('name', 'UPDATE OF name', 'NEW', 1),
+        ('delete', 'DELETE', 'OLD', 1),
+    ):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS food_data_nutrition_{name} AFTER {event} ON food_data
+        BEGIN
+            INSERT INTO recipe_nutrition_dirty (recipe_id, relink)
+            SELECT DISTINCT recipe_id, {flag} FROM recipe_ingredients WHERE food_id = {row}.id
+            ON CONFLICT (recipe_id) DO UPDATE SET relink = MAX(relink, excluded.relink);
+        END
+        ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS recipes_delete_nutrition AFTER DELETE ON recipes
+    BEGIN
+        DELETE FROM recipe_nutrition WHERE recipe_id = OLD.id;
+    END
+    ''')
+
+def drop_ingredient_search_triggers(cursor):
+    """For bulk loads, which would otherwise rewrite a recipe's search row once per ingredient."""
+    for event in ('insert', 'delete', 'update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS recipe_ingredients_search_{event}")
+
 def insert_initial_meal_plans(cursor):
     meal_plans = [
         ('Похудение', 'Понедельник', 'Завтрак', 'Овсянка с ягодами', 250),
@@ -132,54 +475,45 @@ def insert_initial_meal_plans(cursor):
     logging.info("Initial meal plans data inserted")
 
 def insert_initial_recipes(cursor):
+    # (meal_type, name, instructions, calories, protein, fats, carbs, image_url, ingredients)
     recipes = [
         ('Завтрак', 'Омлет с овощами и сыром', 
          '1. Взбейте яйца в миске.\n2. Нарежьте овощи и добавьте к яйцам.\n3. Посыпьте тертым сыром, добавьте специи.\n4. Жарьте на среднем огне до готовности.', 
-         'Около 350 ккал',
-         'https://img1.russianfood.com/dycontent/images_upl/390/big_389184.jpg'),
+         350, 22, 26, 7,
+         'https://img1.russianfood.com/dycontent/images_upl/390/big_389184.jpg',
+         ['3 яйца', '50г сыра', '1 помидор', '1/2 болгарского перца', 'зелень', 'соль, перец']),
         ('Обед', 'Греческий салат с курицей', 
          '1. Нарежьте овощи, сыр и оливки.\n2. Приготовьте курицу на гриле и нарежьте.\n3. Смешайте все ингредиенты.\n4. Заправьте оливковым маслом и лимонным соком, посыпьте орегано.', 
-         'Около 400 ккал',
-         'https://static.1000.menu/img/content-v2/eb/79/22217/grecheskii-salat-s-kuricei_1589111068_12_max.jpg'),
+         400, 35, 24, 10,
+         'https://static.1000.menu/img/content-v2/eb/79/22217/grecheskii-salat-s-kuricei_1589111068_12_max.jpg',
+         ['150г куриной грудки', '1 огурец', '1 помидор', '50г феты', '10 оливок', 'оливковое масло', 'лимонный сок', 'орегано']),
         ('Ужин', 'Запеченный лосось с овощами', 
          '1. Нарежьте овощи и выложите на противень.\n2. Полейте оливковым маслом, посолите и поперчите.\n3. Сверху положите филе лосося.\n4. Сбрызните лимонным соком и посыпьте зеленью.\n5. Запекайте при 180°C в течение 20 минут.', 
-         'Около 380 ккал',
-         'https://img.povar.ru/main/43/7f/e9/fc/zapechennii_losos_s_ovoshami-404089.jpg'),
+         380, 32, 22, 14,
+         'https://img.povar.ru/main/43/7f/e9/fc/zapechennii_losos_s_ovoshami-404089.jpg',
+         ['150г филе лосося', 'цукини', 'болгарский перец', 'морковь', 'лук', 'оливковое масло', 'лимон', 'зелень', 'соль, перец']),
         ('Десерт', 'Протеиновые панкейки с ягодами', 
          '1. Смешайте банан, яйца и протеин в блендере.\n2. Жарьте на антипригарной сковороде небольшими порциями.\n3. Подавайте с ягодами и корицей.', 
-         'Около 250 ккал',
-         'https://fitbreak.ru/wp-content/uploads/2021/05/belkovye-pankejki.jpg'),
+         250, 24, 6, 28,
+         'https://fitbreak.ru/wp-content/uploads/2021/05/belkovye-pankejki.jpg',
+         ['1 банан', '2 яйца', '30г протеинового порошка', '100г ягод', 'корица']),
         ('Напиток', 'Протеиновый смузи', 
          '1. Смешайте все ингредиенты в блендере до однородной массы.\n2. При необходимости добавьте лед.', 
-         'Около 300 ккал',
-         'https://edaplus.info/food_pictures/protein-smoothie.jpg')
+         300, 28, 5, 38,
+         'https://edaplus.info/food_pictures/protein-smoothie.jpg',
+         ['1 банан', '200мл молока', '150г ягод', '30г протеинового порошка', '1 ст.л. меда'])
     ]
-    
-    for recipe in recipes:
-        cursor.execute(
-            "INSERT INTO recipes (meal_type, name, instructions, calories, image_url) VALUES (?, ?, ?, ?, ?)",
-            recipe
-        )
-        recipe_id = cursor.lastrowid
-        
-        # Add ingredients based on recipe
-        if recipe[1] == 'Омлет с овощами и сыром':
-            ingredients = ['3 яйца', '50г сыра', '1 помидор', '1/2 болгарского перца', 'зелень', 'соль, перец']
-        elif recipe[1] == 'Греческий салат с курицей':
-            ingredients = ['150г куриной грудки', '1 огурец', '1 помидор', '50г феты', '10 оливок', 'оливковое масло', 'лимонный сок', 'орегано']
-        elif recipe[1] == 'Запеченный лосось с овощами':
-            ingredients = ['150г филе лосося', 'цукини', 'болгарский перец', 'морковь', 'лук', 'оливковое масло', 'лимон', 'зелень', 'соль, перец']
-        elif recipe[1] == 'Протеиновые панкейки с ягодами':
-            ingredients = ['1 банан', '2 яйца', '30г протеинового порошка', '100г ягод', 'корица']
-        elif recipe[1] == 'Протеиновый смузи':
-            ingredients = ['1 банан', '200мл молока', '150г ягод', '30г протеинового порошка', '1 ст.л. меда']
-            
-        for ingredient in ingredients:
-            cursor.execute(
-                "INSERT INTO recipe_ingredients (recipe_id, ingredient) VALUES (?, ?)",
-                (recipe_id, ingredient)
-            )
-    
+
+    cursor.executemany(
+        "INSERT INTO recipes (meal_type, name, instructions, calories, protein, fats, carbs, image_url) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [recipe[:8] for recipe in recipes]
+    )
+    recipe_ids = dict(cursor.execute("SELECT name, id FROM recipes").fetchall())
+    cursor.executemany(
+        "INSERT INTO recipe_ingredients (recipe_id, ingredient) VALUES (?, ?)",
+        [(recipe_ids[recipe[1]], ingredient) for recipe in recipes for ingredient in recipe[8]]
+    )
     logging.info("Initial recipes and ingredients data inserted")
 
 def insert_initial_food_data(cursor):
@@ -211,31 +545,46 @@ def insert_initial_food_data(cursor):
     )
     logging.info("Initial food data inserted")
 
+@metrics.timed_query
 def user_exists(user_id):
     """Check if a user with the given user_id exists in the database."""
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone() is not None
-    conn.close()
-    return result
+    cursor = get_connection().execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
+    return cursor.fetchone() is not None
 
+# A repeated registration refreshes the profile instead of failing on the key
+_UPSERT_USER = '''
+INSERT INTO users (user_id, username, first_name, last_name, chat_id, last_seen)
+VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+ON CONFLICT (user_id) DO UPDATE SET
+    username = excluded.username, first_name = excluded.first_name, last_name = excluded.last_name,
+    chat_id = excluded.chat_id, last_seen = excluded.last_seen
+'''
+
+@metrics.timed_query
 def add_user(user_id, username, first_name, last_name, chat_id):
-    """Add a new user to the database."""
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO users (user_id, username, first_name, last_name, chat_id) VALUES (?, ?, ?, ?, ?)",
-        (user_id, username, first_name, last_name, chat_id)
-    )
-    conn.commit()
-    conn.close()
+    """Add a user to the database, or update the profile of an existing one."""
+    conn = get_connection()
+    with conn:
+        conn.execute(_UPSERT_USER, (user_id, username, first_name, last_name, chat_id, None))
     logging.info(f"Added new user: {user_id} - {username} - {first_name} {last_name}")
 
+@metrics.timed_query
+def save_user_activity(users, last_seen, unblocked):
+    """Write a batch from user_writer in one transaction: user rows
+    (user_id, username, first_name, last_name, chat_id, last_seen) to upsert,
+    (last_seen, user_id) pairs and chat ids to remove from blocked_chats."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(_UPSERT_USER, users)
+        conn.executemany("UPDATE users SET last_seen = ? WHERE user_id = ?", last_seen)
+        conn.executemany("DELETE FROM blocked_chats WHERE chat_id = ?", [(chat_id,) for chat_id in unblocked])
+
 def get_meal_plan(goal):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute(
+    return _cached(('meal_plan', goal), lambda: _load_meal_plan(goal))
+
+@metrics.timed_query
+def _load_meal_plan(goal):
+    cursor = get_connection().execute(
         "SELECT day, meal, dish, calories FROM meal_plans WHERE goal = ? ORDER BY day, CASE meal "
         "WHEN 'Завтрак' THEN 1 "
         "WHEN 'Перекус 1' THEN 2 "
@@ -245,50 +594,81 @@ def get_meal_plan(goal):
         "ELSE 6 END",
         (goal,)
     )
-    meals = cursor.fetchall()
-    conn.close()
-    return meals
+    return cursor.fetchall()
+
+def _get_ingredients(cursor, recipe_id):
+    cursor.execute(
+        "SELECT ingredient FROM recipe_ingredients WHERE recipe_id = ?",
+        (recipe_id,)
+    )
+    return [row[0] for row in cursor.fetchall()]
 
 def get_recipe(meal_type):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
+    return _cached(('recipe', meal_type), lambda: _load_recipe(meal_type))
+
+@metrics.timed_query
+def _load_recipe(meal_type):
+    cursor = get_connection().cursor()
     cursor.execute(
-        "SELECT id, name, instructions, calories, image_url FROM recipes WHERE meal_type = ?",
+        "SELECT id, name, instructions, calories, protein, fats, carbs, image_url FROM recipes WHERE meal_type = ?",
         (meal_type,)
     )
     recipe = cursor.fetchone()
     
     if recipe:
-        recipe_id, name, instructions, calories, image_url = recipe
-        
-        # Get ingredients for this recipe
-        cursor.execute(
-            "SELECT ingredient FROM recipe_ingredients WHERE recipe_id = ?",
-            (recipe_id,)
-        )
-        ingredients = [row[0] for row in cursor.fetchall()]
-        
-        conn.close()
+        recipe_id, name, instructions, calories, protein, fats, carbs, image_url = recipe
         return {
+            'id': recipe_id,
             'name': name,
-            'ingredients': ingredients,
+            'ingredients': _get_ingredients(cursor, recipe_id),
             'instructions': instructions,
             'calories': calories,
+            'protein': protein,
+            'fats': fats,
+            'carbs': carbs,
             'image_url': image_url
         }
     
-    conn.close()
     return None
 
+def _url_hash(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+@metrics.timed_query
+def get_recipe_photo(recipe_id, image_url):
+    """Return the cached Telegram file_id for the recipe photo, if still valid."""
+    row = get_connection().execute(
+        "SELECT file_id FROM recipe_photos WHERE recipe_id = ? AND url_hash = ?",
+        (recipe_id, _url_hash(image_url))
+    ).fetchone()
+    return row[0] if row else None
+
+@metrics.timed_query
+def save_recipe_photo(recipe_id, image_url, file_id):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO recipe_photos (recipe_id, url_hash, file_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(recipe_id) DO UPDATE SET url_hash = excluded.url_hash, file_id = excluded.file_id, "
+            "updated_at = CURRENT_TIMESTAMP",
+            (recipe_id, _url_hash(image_url), file_id)
+        )
+
+@metrics.timed_query
+def delete_recipe_photo(recipe_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM recipe_photos WHERE recipe_id = ?", (recipe_id,))
+
 def get_food_data():
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, calories, protein, fats, carbs FROM food_data")
-    foods = cursor.fetchall()
+    return _cached('food_data', _load_food_data)
+
+@metrics.timed_query
+def _load_food_data():
+    cursor = get_connection().execute("SELECT name, calories, protein, fats, carbs FROM food_data")
     
     food_data = {}
-    for food in foods:
-        name, calories, protein, fats, carbs = food
+    for name, calories, protein, fats, carbs in cursor.fetchall():
         food_data[name] = {
             'calories': calories,
             'protein': protein,
@@ -296,74 +676,154 @@ def get_food_data():
             'carbs': carbs
         }
     
-    conn.close()
     return food_data
 
+def get_food_matcher():
+    """Matcher over food_data, rebuilt together with the cached food table."""
+    return _cached('food_matcher', lambda: food_matcher.FoodMatcher(get_food_data()))
+
+def get_meal_planner():
+    """Meal planner over recipes and food_data, rebuilt with the cached reference data."""
+    import meal_planner
+
+    return _cached('meal_planner', lambda: meal_planner.MealPlanner(*_load_planner_rows()))
+
+@metrics.timed_query
+def _load_planner_rows():
+    conn = get_connection()
+    # Values computed from the ingredients fill in what the recipe lacks
+    recipes = conn.execute(
+        "SELECT id, meal_type, name, COALESCE(recipes.calories, nutrition.calories), "
+        "COALESCE(recipes.protein, nutrition.protein), COALESCE(recipes.fats, nutrition.fats), "
+        "COALESCE(recipes.carbs, nutrition.carbs) "
+        "FROM recipes LEFT JOIN recipe_nutrition AS nutrition ON nutrition.recipe_id = recipes.id "
+        "WHERE COALESCE(recipes.calories, nutrition.calories) > 0"
+    ).fetchall()
+    foods = conn.execute("SELECT id, name, calories, protein, fats, carbs FROM food_data WHERE calories > 0").fetchall()
+    return recipes, foods
+
+@metrics.timed_query
+def get_user_targets(user_id):
+    """(calories, protein, fats, carbs) per day, or None if the user has not set them."""
+    return get_connection().execute(
+        "SELECT calories, protein, fats, carbs FROM user_targets WHERE user_id = ?", (user_id,)
+    ).fetchone()
+
+@metrics.timed_query
+def set_user_targets(user_id, calories, protein, fats, carbs):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO user_targets (user_id, calories, protein, fats, carbs) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET calories = excluded.calories, protein = excluded.protein, "
+            "fats = excluded.fats, carbs = excluded.carbs, updated_at = CURRENT_TIMESTAMP",
+            (user_id, calories, protein, fats, carbs)
+        )
+
+@metrics.timed_query
 def get_all_recipes():
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT id, meal_type, name, calories FROM recipes ORDER BY meal_type")
-    recipes = cursor.fetchall()
-    
-    conn.close()
-    return recipes
+    cursor = get_connection().execute("SELECT id, meal_type, name, calories FROM recipes ORDER BY meal_type")
+    return cursor.fetchall()
+
+@metrics.timed_query
+def search_recipes(match, min_calories=None, max_calories=None, limit=10):
+    """Best matches for an FTS5 MATCH expression as (id, name, meal_type, calories) rows.
+
+    Name hits weigh more than ingredient hits, which weigh more than hits in
+    the instructions. Every match is ranked before the limit applies, so the
+    best one is found however many recipes match; a word found in a large
+    share of the recipes costs tens of milliseconds (search.search() only
+    ranks those through search_candidates()).
+    """
+    cursor = get_connection().execute(
+        "SELECT recipes.id, recipes.name, recipes.meal_type, recipes.calories "
+        "FROM recipe_search JOIN recipes ON recipes.id = recipe_search.rowid "
+        "WHERE recipe_search MATCH ? "
+        "AND (? IS NULL OR recipes.calories >= ?) AND (? IS NULL OR recipes.calories <= ?) "
+        "ORDER BY bm25(recipe_search, 10.0, 5.0, 1.0) LIMIT ?",
+        (match, min_calories, min_calories, max_calories, max_calories, limit)
+    )
+    return cursor.fetchall()
+
+@metrics.timed_query
+def count_matches(match, limit):
+    """Number of recipes matching an FTS5 MATCH expression, counted up to `limit`."""
+    cursor = get_connection().execute(
+        "SELECT count(*) FROM (SELECT 1 FROM recipe_search WHERE recipe_search MATCH ? LIMIT ?)", (match, limit)
+    )
+    return cursor.fetchone()[0]
+
+@metrics.timed_query
+def search_candidates(match, min_calories=None, max_calories=None, limit=64):
+    """Up to `limit` unranked matches as (id, name, meal_type, calories, ingredients) rows.
+
+    The scan stops at the limit instead of visiting every match, so the cost
+    does not grow with the number of recipes a word is found in.
+    """
+    cursor = get_connection().execute(
+        "SELECT recipes.id, recipes.name, recipes.meal_type, recipes.calories, recipe_search.ingredients "
+        "FROM recipe_search JOIN recipes ON recipes.id = recipe_search.rowid "
+        "WHERE recipe_search MATCH ? "
+        "AND (? IS NULL OR recipes.calories >= ?) AND (? IS NULL OR recipes.calories <= ?) LIMIT ?",
+        (match, min_calories, min_calories, max_calories, max_calories, limit)
+    )
+    return cursor.fetchall()
+
+@metrics.timed_query
+def get_recipes_by_calories(min_calories=None, max_calories=None, limit=10):
+    """(id, name, meal_type, calories) rows in the calorie range, lightest first."""
+    cursor = get_connection().execute(
+        "SELECT id, name, meal_type, calories FROM recipes "
+        "WHERE calories >= COALESCE(?, 0) AND calories <= COALESCE(?, 1e9) ORDER BY calories LIMIT ?",
+        (min_calories, max_calories, limit)
+    )
+    return cursor.fetchall()
+
+@metrics.timed_query
+def get_recipe_image_urls():
+    cursor = get_connection().execute("SELECT DISTINCT image_url FROM recipes WHERE image_url IS NOT NULL AND image_url != ''")
+    return [row[0] for row in cursor.fetchall()]
 
+@metrics.timed_query
 def get_recipe_by_id(recipe_id):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
+    cursor = get_connection().cursor()
     cursor.execute(
-        "SELECT id, meal_type, name, instructions, calories, image_url FROM recipes WHERE id = ?",
+        "SELECT id, meal_type, name, instructions, calories, protein, fats, carbs, image_url FROM recipes WHERE id = ?",
         (recipe_id,)
     )
     recipe_data = cursor.fetchone()
     
     if recipe_data:
-        recipe_id, meal_type, name, instructions, calories, image_url = recipe_data
-        
-        cursor.execute(
-            "SELECT ingredient FROM recipe_ingredients WHERE recipe_id = ?",
-            (recipe_id,)
-        )
-        ingredients = [row[0] for row in cursor.fetchall()]
-        
-        conn.close()
+        recipe_id, meal_type, name, instructions, calories, protein, fats, carbs, image_url = recipe_data
         return {
             'id': recipe_id,
             'meal_type': meal_type,
             'name': name,
             'instructions': instructions,
             'calories': calories,
+            'protein': protein,
+            'fats': fats,
+            'carbs': carbs,
             'image_url': image_url,
-            'ingredients': ingredients
+            'ingredients': _get_ingredients(cursor, recipe_id)
         }
     
-    conn.close()
     return None
 
 
+@metrics.timed_query
 def get_all_meal_plans():
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT id, goal, day, meal, dish, calories FROM meal_plans ORDER BY goal, day, meal")
-    plans = cursor.fetchall()
-    
-    conn.close()
-    return plans
+    cursor = get_connection().execute("SELECT id, goal, day, meal, dish, calories FROM meal_plans ORDER BY goal, day, meal")
+    return cursor.fetchall()
 
+@metrics.timed_query
 def get_meal_plan_by_id(plan_id):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    cursor.execute(
+    cursor = get_connection().execute(
         "SELECT id, goal, day, meal, dish, calories FROM meal_plans WHERE id = ?",
         (plan_id,)
     )
     plan = cursor.fetchone()
     
-    conn.close()
     if plan:
         plan_id, goal, day, meal, dish, calories = plan
         return {
@@ -376,27 +836,19 @@ def get_meal_plan_by_id(plan_id):
         }
     return None
 
+@metrics.timed_query
 def get_all_foods():
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT id, name, calories, protein, fats, carbs FROM food_data ORDER BY name")
-    foods = cursor.fetchall()
-    
-    conn.close()
-    return foods
+    cursor = get_connection().execute("SELECT id, name, calories, protein, fats, carbs FROM food_data ORDER BY name")
+    return cursor.fetchall()
 
+@metrics.timed_query
 def get_food_by_id(food_id):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    cursor.execute(
+    cursor = get_connection().execute(
         "SELECT id, name, calories, protein, fats, carbs FROM food_data WHERE id = ?",
         (food_id,)
     )
     food = cursor.fetchone()
     
-    conn.close()
     if food:
         food_id, name, calories, protein, fats, carbs = food
         return {
@@ -409,20 +861,220 @@ def get_food_by_id(food_id):
         }
     return None
 
+def _catalog_page(table, cursor_id, backward, limit):
+    """One page of (id, name, calories) rows of table ordered by its unique name.
+
+    Keyset pagination: the page starts right after (or, going backward, ends
+    right before) the row cursor_id, found through the name index, so every
+    page is a single bounded index range whatever the table size. One extra
+    row is read to tell whether the page has a neighbour in that direction.
+    Returns (rows, more) with rows in ascending order.
+    """
+    conn = get_connection()
+    if cursor_id is None:
+        rows = conn.execute(f"SELECT id, name, calories FROM {table} ORDER BY name LIMIT ?", (limit + 1,)).fetchall()
+    else:
+        # A deleted cursor row gives NULL and an empty page
+        operator, order = ('<', 'DESC') if backward else ('>', 'ASC')
+        rows = conn.execute(
+            f"SELECT id, name, calories FROM {table} "
+            f"WHERE name {operator} (SELECT name FROM {table} WHERE id = ?) "
+            f"ORDER BY name {order} LIMIT ?",
+            (cursor_id, limit + 1)
+        ).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    return rows, more
+
+@metrics.timed_query
+def get_foods_page(cursor_id=None, backward=False, limit=10):
+    return _catalog_page('food_data', cursor_id, backward, limit)
+
+@metrics.timed_query
+def get_recipes_page(cursor_id=None, backward=False, limit=10):
+    return _catalog_page('recipes', cursor_id, backward, limit)
+
+@metrics.timed_query
 def get_all_users():
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT user_id, username, first_name, last_name, registration_date FROM users ORDER BY registration_date DESC")
-    users = cursor.fetchall()
-    
-    conn.close()
-    return users
+    cursor = get_connection().execute("SELECT user_id, username, first_name, last_name, registration_date FROM users ORDER BY registration_date DESC")
+    return cursor.fetchall()
 
 def get_health_tips():
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT tip FROM health_tips")
-    tips = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return tips 
\ No newline at end of file
+    return _cached('health_tips', _load_health_tips)
+
+@metrics.timed_query
+def _load_health_tips():
+    cursor = get_connection().execute("SELECT tip FROM health_tips")
+    return [row[0] for row in cursor.fetchall()]
+
+@metrics.timed_query
+def set_reminders(chat_id, reminders, timezone):
+    """Replace the chat's reminders with (meal, local_time, utc_minute) rows."""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM reminders WHERE chat_id = ?", (chat_id,))
+        conn.executemany(
+            "INSERT INTO reminders (chat_id, meal, local_time, timezone, utc_minute) VALUES (?, ?, ?, ?, ?)",
+            [(chat_id, meal, local_time, timezone, utc_minute) for meal, local_time, utc_minute in reminders]
+        )
+
+@metrics.timed_query
+def delete_reminders(chat_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM reminders WHERE chat_id = ?", (chat_id,))
+
+@metrics.timed_query
+def get_due_reminders(utc_minute):
+    cursor = get_connection().execute(
+        "SELECT chat_id, meal FROM reminders WHERE utc_minute = ? "
+        "AND chat_id NOT IN (SELECT chat_id FROM blocked_chats)",
+        (utc_minute,)
+    )
+    return cursor.fetchall()
+
+@metrics.timed_query
+def get_reminder_slots():
+    cursor = get_connection().execute(
+        "SELECT timezone, local_time, MIN(utc_minute) FROM reminders GROUP BY timezone, local_time"
+    )
+    return cursor.fetchall()
+
+@metrics.timed_query
+def update_reminder_slot(timezone, local_time, utc_minute):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE reminders SET utc_minute = ? WHERE timezone = ? AND local_time = ?",
+            (utc_minute, timezone, local_time)
+        )
+
+@metrics.timed_query
+def mark_chat_blocked(chat_id, reason=None):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO blocked_chats (chat_id, reason) VALUES (?, ?)",
+            (chat_id, reason)
+        )
+    logging.info(f"Chat {chat_id} marked as blocked: {reason}")
+
+@metrics.timed_query
+def unblock_chat(chat_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM blocked_chats WHERE chat_id = ?", (chat_id,))
+
+@metrics.timed_query
+def acquire_lease(name, holder, ttl):
+    """Take the lease `name` if it is free or expired, or renew it if holder
+    already has it, for ttl seconds; True if holder has the lease."""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+            (name, holder, now + ttl, now)
+        )
+        row = conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+    return row is not None and row[0] == holder
+
+@metrics.timed_query
+def release_lease(name, holder):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+@metrics.timed_query
+def load_conversations(now, shard=None):
+    """Drop expired conversation sessions and return the rest as
+    (chat_id, state, data, expires_at), oldest first. With shard=(index, count)
+    only the chats with chat_id % count == index (as in Python, also for
+    negative group ids) are touched."""
+    where, params = "", ()
+    if shard is not None:
+        index, count = shard
+        where, params = " AND ((chat_id % ?) + ?) % ? = ?", (count, count, count, index)
+    conn = get_connection()
+    with conn:
+        conn.execute(f"DELETE FROM conversations WHERE expires_at <= ?{where}", (now, *params))
+    return conn.execute(
+        f"SELECT chat_id, state, data, expires_at FROM conversations WHERE 1{where} ORDER BY expires_at", params
+    ).fetchall()
+
+@metrics.timed_query
+def save_conversations(saved, ended):
+    """Write a batch from conversation.Conversations in one transaction:
+    (chat_id, state, data, expires_at) rows to upsert and chat ids to delete."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO conversations (chat_id, state, data, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET state = excluded.state, data = excluded.data, "
+            "expires_at = excluded.expires_at",
+            saved
+        )
+        conn.executemany("DELETE FROM conversations WHERE chat_id = ?", [(chat_id,) for chat_id in ended])
+
+@metrics.timed_query
+def log_food(user_id, date, description, calories, protein, fats, carbs):
+    """Append a diary entry and fold it into daily_totals atomically."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO food_log (user_id, date, description, calories, protein, fats, carbs) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, date, description, calories, protein, fats, carbs)
+        )
+        conn.execute(
+            "INSERT INTO daily_totals (user_id, date, calories, protein, fats, carbs, entries) VALUES (?, ?, ?, ?, ?, ?, 1) "
+            "ON CONFLICT(user_id, date) DO UPDATE SET "
+            "calories = calories + excluded.calories, protein = protein + excluded.protein, "
+            "fats = fats + excluded.fats, carbs = carbs + excluded.carbs, entries = entries + 1",
+            (user_id, date, calories, protein, fats, carbs)
+        )
+
+@metrics.timed_query
+def get_daily_totals(user_id, date):
+    row = get_connection().execute(
+        "SELECT calories, protein, fats, carbs, entries FROM daily_totals WHERE user_id = ? AND date = ?",
+        (user_id, date)
+    ).fetchone()
+    if row:
+        calories, protein, fats, carbs, entries = row
+        return {'calories': calories, 'protein': protein, 'fats': fats, 'carbs': carbs, 'entries': entries}
+    return None
+
+@metrics.timed_query
+def get_daily_totals_range(user_id, start_date, end_date):
+    """Rollup rows (date, calories, protein, fats, carbs, entries) for start_date..end_date."""
+    cursor = get_connection().execute(
+        "SELECT date, calories, protein, fats, carbs, entries FROM daily_totals "
+        "WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+        (user_id, start_date, end_date)
+    )
+    return cursor.fetchall()
+
+@metrics.timed_query
+def get_diary_stats(user_id):
+    row = get_connection().execute(
+        "SELECT COUNT(*), MIN(date), SUM(entries), AVG(calories), AVG(protein), AVG(fats), AVG(carbs), MAX(calories) "
+        "FROM daily_totals WHERE user_id = ?",
+        (user_id,)
+    ).fetchone()
+    days, first_date, entries, calories, protein, fats, carbs, max_calories = row
+    if not days:
+        return None
+    return {
+        'days': days,
+        'first_date': first_date,
+        'entries': entries,
+        'avg_calories': calories,
+        'avg_protein': protein,
+        'avg_fats': fats,
+        'avg_carbs': carbs,
+        'max_calories': max_calories
+    }
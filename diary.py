@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import config
+import database
+
+# Calorie diary helpers shared by both runtimes. Dates are calendar days in
+# config.DIARY_TIMEZONE, stored as ISO strings so they sort correctly.
+
+def today():
+    return datetime.now(ZoneInfo(config.DIARY_TIMEZONE)).date()
+
+def totals(found_foods):
+    return {
+        'calories': sum(food['calories'] for food in found_foods),
+        'protein': sum(food['protein'] for food in found_foods),
+        'fats': sum(food['fats'] for food in found_foods),
+        'carbs': sum(food['carbs'] for food in found_foods)
+    }
+
+def record(user_id, text, found_foods):
+    """Store a /track result in the diary; returns the entry totals."""
+    entry = totals(found_foods)
+    database.log_food(user_id, today().isoformat(), text, entry['calories'], entry['protein'], entry['fats'], entry['carbs'])
+    return entry
+
+def get_today(user_id):
+    day = today()
+    return day, database.get_daily_totals(user_id, day.isoformat())
+
+def get_week(user_id):
+    """Rollups for the last 7 days, one (date, totals-or-None) per day."""
+    end = today()
+    start = end - timedelta(days=6)
+    rows = {row[0]: row for row in database.get_daily_totals_range(user_id, start.isoformat(), end.isoformat())}
+    week = []
+    for offset in range(7):
+        day = start + timedelta(days=offset)
+        row = rows.get(day.isoformat())
+        if row:
+            _, calories, protein, fats, carbs, entries = row
+            week.append((day, {'calories': calories, 'protein': protein, 'fats': fats, 'carbs': carbs, 'entries': entries}))
+        else:
+            week.append((day, None))
+    return week
@@ -0,0 +1,110 @@
+import contextvars
+import threading
+import time
+
+import config
+
+# Flood control applied by router.Router before a handler runs. Every budget
+# is a token bucket (rate per second, burst) kept as a single float per key,
+# the time its bucket will be full again (GCRA), so a tracked user costs one
+# dict entry per budget; entries of full buckets carry no state and are
+# evicted.
+
+ALLOW = 0
+DEGRADE = 1  # over the global budget: handled, but without expensive extras
+WARN = 2     # over a user budget: dropped, the user is told once
+DROP = 3     # still over it: dropped silently
+
+_degraded = contextvars.ContextVar('flood_degraded', default=False)
+
+def degraded():
+    """True while handling a request admitted under overload: skip photos and
+    other expensive extras, answer in text."""
+    return _degraded.get()
+
+def set_degraded(value):
+    # Set for every routed update, so it never leaks into the next one
+    _degraded.set(value)
+
+class _Budget:
+    __slots__ = ('interval', 'tolerance', 'full_at')
+
+    def __init__(self, rate, burst):
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.full_at = {}
+
+    def conforms(self, key, now):
+        return self.full_at.get(key, now) - now <= self.tolerance
+
+    def take(self, key, now):
+        self.full_at[key] = max(self.full_at.get(key, now), now) + self.interval
+
+    def evict(self, now):
+        self.full_at = {key: full_at for key, full_at in self.full_at.items() if full_at > now}
+
+class FloodControl:
+    """Per-user, per-user-and-handler and global request budgets.
+
+    A request over its user's budget, or over the handler's budget
+    (FLOOD_COMMAND_LIMITS, keyed by handler name) for that user, is dropped;
+    the first drop of a burst gets WARN so the user can be told to slow
+    down. A request over the global budget is still handled, as DEGRADE.
+    """
+
+    def __init__(self, user_rate=None, user_burst=None, command_limits=None,
+                 global_rate=None, global_burst=None, evict_interval=None):
+        self.user = _Budget(user_rate or config.FLOOD_USER_RATE, user_burst or config.FLOOD_USER_BURST)
+        limits = config.FLOOD_COMMAND_LIMITS if command_limits is None else command_limits
+        self.commands = {name: _Budget(rate, burst) for name, (rate, burst) in limits.items()}
+        self.overall = _Budget(global_rate or config.FLOOD_GLOBAL_RATE, global_burst or config.FLOOD_GLOBAL_BURST)
+        self.evict_interval = evict_interval or config.FLOOD_EVICT_INTERVAL
+        self._warned = set()
+        self._evicted_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.metrics = {'allowed': 0, 'degraded': 0, 'throttled_user': 0, 'throttled_command': 0, 'warned': 0}
+
+    def check(self, user_id, handler_name):
+        """Verdict for a request of user_id to the handler: ALLOW, DEGRADE, WARN or DROP."""
+        command = self.commands.get(handler_name)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._evicted_at >= self.evict_interval:
+                self._evict(now)
+            if not self.user.conforms(user_id, now):
+                return self._throttled(user_id, 'throttled_user')
+            if command is not None and not command.conforms(user_id, now):
+                return self._throttled(user_id, 'throttled_command')
+            self.user.take(user_id, now)
+            if command is not None:
+                command.take(user_id, now)
+            self._warned.discard(user_id)
+            if not self.overall.conforms(None, now):
+                self.metrics['degraded'] += 1
+                return DEGRADE
+            self.overall.take(None, now)
+            self.metrics['allowed'] += 1
+            return ALLOW
+
+    def _throttled(self, user_id, counter):
+        self.metrics[counter] += 1
+        if user_id in self._warned:
+            return DROP
+        self._warned.add(user_id)
+        self.metrics['warned'] += 1
+        return WARN
+
+    def _evict(self, now):
+        # Full buckets behave exactly like absent entries
+        self.user.evict(now)
+        for budget in self.commands.values():
+            budget.evict(now)
+        self._warned &= self.user.full_at.keys()
+        self._evicted_at = now
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, users=len(self.user.full_at))
+
+# Shared by the routers of main.py and async_main.py
+limiter = FloodControl() if config.FLOOD_CONTROL_ENABLED else None
@@ -0,0 +1,179 @@
+import functools
+import re
+
+# Light suffix-stripping stemmer for Russian nouns and adjectives. It is not a
+# full morphological analyser, but it maps the case forms people actually type
+# ("курицы", "курицей", "яйца", "рисом") onto the stem of the dictionary form.
+_ENDINGS = sorted([
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю', 'ая', 'яя',
+    'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ов', 'ев', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+], key=len, reverse=True)
+_MIN_STEM = 3
+_IRREGULAR = {'яиц': 'яйц'}
+
+_TOKEN_RE = re.compile(r"\d+/\d+|\d+(?:[.,]\d+)?|[^\W\d_]+")
+
+# Grams per unit; None means "pieces" and is resolved per food.
+UNITS = {
+    'г': 1, 'гр': 1, 'грамм': 1, 'грамма': 1, 'граммов': 1,
+    'кг': 1000, 'килограмм': 1000, 'килограмма': 1000,
+    'мл': 1, 'л': 1000, 'литр': 1000, 'литра': 1000,
+    'ст': 15, 'ч': 5,
+    'шт': None, 'штука': None, 'штуки': None, 'штук': None,
+}
+
+DEFAULT_GRAMS = 100
+
+# Typical weight of one piece for foods that are counted rather than weighed.
+PIECE_GRAMS = {
+    'яйцо': 55,
+    'банан': 120,
+    'яблоко': 180,
+    'хлеб': 30,
+    'картофель': 100,
+    'морковь': 80,
+}
+
+_MAX_QUANTITY_GAP = 2
+
+# Messages and ingredient lists repeat a small vocabulary over and over
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+def _parse_number(token):
+    if '/' in token:
+        numerator, denominator = token.split('/')
+        return int(numerator) / int(denominator) if int(denominator) else None
+    return float(token.replace(',', '.'))
+
+def tokenize(text):
+    """Split text into ('num', value) and ('word', raw, stem) tokens."""
+    tokens = []
+    for raw in _TOKEN_RE.findall(text.lower()):
+        if raw[0].isdigit():
+            value = _parse_number(raw)
+            if value is not None:
+                tokens.append(('num', value))
+        else:
+            tokens.append(('word', raw, stem(raw)))
+    return tokens
+
+class FoodMatcher:
+    """Trie over stemmed food names, built once per food_data version.
+
+    Matching walks the message tokens once and, at every position, follows the
+    trie as far as it goes, so the cost depends on the message length and the
+    longest food name, not on the number of foods.
+    """
+
+    def __init__(self, food_data, piece_grams=PIECE_GRAMS):
+        self.food_data = food_data
+        self.piece_grams = piece_grams
+        self._trie = {}
+        for name in food_data:
+            stems = [token[2] for token in tokenize(name) if token[0] == 'word']
+            if not stems:
+                continue
+            node = self._trie
+            for item in stems:
+                node = node.setdefault(item, {})
+            node.setdefault(None, name)
+
+    def _find_foods(self, tokens):
+        spans = []
+        i = 0
+        while i < len(tokens):
+            node = self._trie
+            found = None
+            j = i
+            while j < len(tokens) and tokens[j][0] == 'word' and tokens[j][2] in node:
+                node = node[tokens[j][2]]
+                j += 1
+                if None in node:
+                    found = (i, j, node[None])
+            if found:
+                spans.append(found)
+                i = found[1]
+            else:
+                i += 1
+        return spans
+
+    @staticmethod
+    def _find_quantities(tokens):
+        quantities = []
+        i = 0
+        while i < len(tokens):
+            if tokens[i][0] != 'num':
+                i += 1
+                continue
+            amount = tokens[i][1]
+            unit = None
+            end = i + 1
+            if end < len(tokens) and tokens[end][0] == 'word' and tokens[end][1] in UNITS:
+                unit = UNITS[tokens[end][1]]
+                end += 1
+                # "ст. л." / "ч. л." spoon abbreviations come as two tokens
+                if unit in (15, 5) and end < len(tokens) and tokens[end][0] == 'word' and tokens[end][1] == 'л':
+                    end += 1
+            quantities.append((i, end, amount, unit))
+            i = end
+        return quantities
+
+    def _grams(self, name, amount, unit):
+        if unit is None:
+            return amount * self.piece_grams.get(name, DEFAULT_GRAMS)
+        return amount * unit
+
+    def match(self, text):
+        """Return the foods found in text with grams and scaled macros.
+
+        A quantity right before a food ("200г риса", "2 яйца") or right after it
+        ("курица 150 г") scales the per-100g values; without one a 100g portion
+        is assumed.
+        """
+        tokens = tokenize(text)
+        spans = self._find_foods(tokens)
+        if not spans:
+            return []
+        quantities = self._find_quantities(tokens)
+        used = set()
+
+        results = []
+        for index, (start, end, name) in enumerate(spans):
+            previous_end = spans[index - 1][1] if index else 0
+            next_start = spans[index + 1][0] if index + 1 < len(spans) else len(tokens)
+            quantity = None
+            for q in quantities:
+                if q in used:
+                    continue
+                if previous_end <= q[0] and q[1] <= start and start - q[1] <= _MAX_QUANTITY_GAP:
+                    quantity = q
+                elif quantity is None and end <= q[0] < next_start and q[0] - end <= _MAX_QUANTITY_GAP:
+                    quantity = q
+                    break
+            if quantity:
+                used.add(quantity)
+                grams = self._grams(name, quantity[2], quantity[3])
+            else:
+                grams = DEFAULT_GRAMS
+
+            values = self.food_data[name]
+            factor = grams / 100
+            results.append({
+                'name': name,
+                'grams': grams,
+                'calories': values['calories'] * factor,
+                'protein': values['protein'] * factor,
+                'fats': values['fats'] * factor,
+                'carbs': values['carbs'] * factor
+            })
+        return results
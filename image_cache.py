@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import config
+import metrics
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'image/jpeg,image/png,image/*;q=0.8,*/*;q=0.5',
+    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
+    'Referer': 'https://www.google.com/'
+}
+
+MIN_IMAGE_SIZE = 100
+
+class ImageCache:
+    """Content-addressed on-disk cache of remote images.
+
+    Files are stored under their SHA-256 digest; index.json maps every URL to
+    its digest plus the ETag/Last-Modified validators and is kept in LRU order.
+    Only the background workers touch the network: get() reads local bytes.
+
+    With `forward`, the directory belongs to another process (the
+    supervisor of supervisor.py) and this one only reads it: get() picks up
+    the owner's index.json when it changes, and prefetch() passes the URLs
+    to forward(urls) instead of downloading them.
+    """
+
+    def __init__(self, directory, max_bytes, workers=4, timeout=10, session=None, forward=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.forward = forward
+        self.session = session or requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-prefetch')
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._index_path = os.path.join(directory, 'index.json')
+        self._index_mtime = None
+        os.makedirs(directory, exist_ok=True)
+        self._index = self._load_index()
+
+    def _index_changed(self):
+        try:
+            return os.stat(self._index_path).st_mtime_ns != self._index_mtime
+        except OSError:
+            return False
+
+    def _load_index(self):
+        try:
+            self._index_mtime = os.stat(self._index_path).st_mtime_ns
+            with open(self._index_path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return OrderedDict()
+        index = OrderedDict()
+        for url, entry in entries:
+            if os.path.exists(self._path(entry['digest'])):
+                index[url] = entry
+        return index
+
+    def _save_index(self):
+        tmp_path = f"{self._index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self._index.items()), f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, url):
+        """Return cached bytes for url, or None. Never touches the network."""
+        if self.forward is not None and self._index_changed():
+            index = self._load_index()
+            with self._lock:
+                self._index = index
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                return None
+            self._index.move_to_end(url)
+        try:
+            with open(self._path(entry['digest']), 'rb') as f:
+                return f.read()
+        except OSError:
+            with self._lock:
+                self._index.pop(url, None)
+            return None
+
+    def request_headers(self, url):
+        """Request headers for url, with validators if a copy is cached."""
+        with self._lock:
+            entry = self._index.get(url)
+        headers = dict(HEADERS)
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, status_code, content, headers):
+        """Record a fetch result for url. Returns True if url is cached."""
+        if status_code == 304:
+            with self._lock:
+                entry = self._index.get(url)
+                if entry:
+                    entry['checked_at'] = time.time()
+                    self._save_index()
+                return entry is not None
+        if status_code != 200:
+            logging.error(f"Не удалось загрузить изображение {url}, код статуса: {status_code}")
+            return False
+        if not content or len(content) < MIN_IMAGE_SIZE:
+            logging.error(f"Получено пустое или слишком маленькое изображение: {url}")
+            return False
+
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._index[url] = {
+                'digest': digest,
+                'size': len(content),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'checked_at': time.time()
+            }
+            self._index.move_to_end(url)
+            self._evict()
+            self._save_index()
+        return True
+
+    def fetch(self, url):
+        """Download or revalidate url and store it. Returns True if cached."""
+        with metrics.timer(metrics.IMAGE_FETCH_SECONDS):
+            response = self.session.get(url, headers=self.request_headers(url), timeout=self.timeout)
+        return self.store(url, response.status_code, response.content, response.headers)
+
+    def _evict(self):
+        sizes = {}
+        for entry in self._index.values():
+            sizes[entry['digest']] = entry['size']
+        total = sum(sizes.values())
+        while total > self.max_bytes and len(self._index) > 1:
+            url, entry = self._index.popitem(last=False)
+            digest = entry['digest']
+            if any(other['digest'] == digest for other in self._index.values()):
+                continue
+            total -= entry['size']
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                pass
+            logging.info(f"Изображение вытеснено из кэша: {url}")
+
+    def _fetch_logged(self, url):
+        try:
+            return self.fetch(url)
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке изображения {url}: {str(e)}")
+            return False
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def prefetch(self, urls):
+        """Queue downloads for urls on the worker pool; returns the futures."""
+        if self.forward is not None:
+            self.forward([url for url in urls if url])
+            return []
+        futures = []
+        for url in urls:
+            if not url:
+                continue
+            with self._lock:
+                future = self._pending.get(url)
+                if future is None:
+                    future = self._executor.submit(self._fetch_logged, url)
+                    self._pending[url] = future
+            futures.append(future)
+        return futures
+
+    def stats(self):
+        with self._lock:
+            digests = {entry['digest']: entry['size'] for entry in self._index.values()}
+            return {'urls': len(self._index), 'files': len(digests), 'bytes': sum(digests.values())}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache(forward=None):
+    """The process-wide cache; the first call may pass forward (see ImageCache)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache(
+                config.IMAGE_CACHE_DIR,
+                config.IMAGE_CACHE_MAX_BYTES,
+                workers=config.IMAGE_PREFETCH_WORKERS,
+                timeout=config.IMAGE_FETCH_TIMEOUT,
+                forward=forward
+            )
+        return _cache
+
+def start_prefetcher(get_urls, interval=None, delay=None):
+    """Warm the cache with get_urls() after delay seconds and then every interval seconds."""
+    interval = interval or config.IMAGE_REVALIDATE_INTERVAL
+    delay = config.IMAGE_PREFETCH_DELAY if delay is None else delay
+
+    def run():
+        time.sleep(delay)
+        while True:
+            try:
+                urls = get_urls()
+                futures = get_cache().prefetch(urls)
+                ready = sum(1 for future in futures if future.result())
+                logging.info(f"Кэш изображений прогрет: {ready} из {len(futures)} доступны локально")
+            except Exception as e:
+                logging.error(f"Ошибка при прогреве кэша изображений: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='image-prefetcher', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,348 @@
+"""Bulk import of foods and recipes from CSV/TSV or JSONL files.
+
+    python importer.py foods foods.csv [--db users.db] [--batch 5000]
+    python importer.py recipes recipes.jsonl
+
+Files may be gzip-compressed (.gz). Foods need a name and calories per 100 g
+(protein, fats and carbs default to 0); common column names of open
+nutrition datasets are recognised, e.g. product_name / energy-kcal_100g /
+proteins_100g / fat_100g / carbohydrates_100g. Recipes need meal_type and
+name; ingredients are a JSON list or a ';'-separated string. Empty or
+missing recipe fields keep the values already stored.
+
+Rows are streamed into a TEMP staging table in executemany batches and
+merged in chunked transactions with INSERT ... ON CONFLICT(name), so an
+import can be repeated and updates existing rows. Secondary indexes of the
+target table are dropped and rebuilt at the end when the import is larger
+than the table.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import time
+
+import config
+import database
+import migrations
+
+FOOD_COLUMNS = {
+    'name': ('name', 'product_name', 'product', 'food', 'название'),
+    'calories': ('calories', 'kcal', 'energy_kcal', 'energy-kcal_100g', 'energy_kcal_100g', 'калории'),
+    'protein': ('protein', 'proteins', 'proteins_100g', 'белки'),
+    'fats': ('fats', 'fat', 'fat_100g', 'жиры'),
+    'carbs': ('carbs', 'carbohydrates', 'carbohydrates_100g', 'углеводы'),
+}
+RECIPE_COLUMNS = {
+    'meal_type': ('meal_type', 'type', 'category'),
+    'name': ('name', 'title'),
+    'instructions': ('instructions', 'steps', 'directions'),
+    'calories': ('calories', 'kcal'),
+    'protein': ('protein', 'proteins'),
+    'fats': ('fats', 'fat'),
+    'carbs': ('carbs', 'carbohydrates'),
+    'image_url': ('image_url', 'image', 'photo'),
+    'ingredients': ('ingredients',),
+}
+MEAL_TYPES = {
+    'завтрак': 'Завтрак', 'breakfast': 'Завтрак',
+    'обед': 'Обед', 'lunch': 'Обед',
+    'ужин': 'Ужин', 'dinner': 'Ужин',
+    'десерт': 'Десерт', 'dessert': 'Десерт',
+    'напиток': 'Напиток', 'drink': 'Напиток', 'beverage': 'Напиток',
+}
+
+MAX_NAME_LENGTH = 200
+MAX_CALORIES = 900  # kcal per 100 g; pure fat is ~900
+PROGRESS_INTERVAL = 2.0
+
+class InvalidRow(ValueError):
+    pass
+
+def open_source(path):
+    raw = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+    return io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+
+def read_rows(path):
+    """Yield dicts from a CSV, TSV or JSONL file without loading it whole."""
+    name = path[:-3] if path.endswith('.gz') else path
+    with open_source(path) as f:
+        if name.endswith(('.jsonl', '.ndjson', '.json')):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            delimiter = '\t' if name.endswith('.tsv') else ','
+            yield from csv.DictReader(f, delimiter=delimiter)
+
+def _column_map(fields, columns):
+    lowered = {field.strip().lower(): field for field in fields}
+    mapping = {}
+    for key, aliases in columns.items():
+        for alias in aliases:
+            if alias in lowered:
+                mapping[key] = lowered[alias]
+                break
+    return mapping
+
+def _text(value):
+    return re.sub(r'\s+', ' ', str(value or '')).strip()
+
+def _number(value, field, default=None, maximum=None):
+    if value is None or value == '':
+        if default is None:
+            raise InvalidRow(f"missing {field}")
+        return default
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        # true/false, lists and objects from JSON input
+        raise InvalidRow(f"{field} is not a number: {value!r}")
+    try:
+        number = float(value)
+    except ValueError:
+        # Decimal comma, as exported by Russian-locale spreadsheets
+        try:
+            number = float(value.replace(',', '.'))
+        except ValueError:
+            raise InvalidRow(f"{field} is not a number: {value!r}")
+    if number != number or number < 0 or (maximum is not None and number > maximum):
+        raise InvalidRow(f"{field} out of range: {value!r}")
+    return number
+
+def normalize_food(row, mapping):
+    name = _text(row.get(mapping.get('name'))).lower()
+    if not name:
+        raise InvalidRow("missing name")
+    if len(name) > MAX_NAME_LENGTH:
+        raise InvalidRow("name too long")
+    calories = _number(row.get(mapping.get('calories')), 'calories', maximum=MAX_CALORIES)
+    protein = _number(row.get(mapping.get('protein')), 'protein', 0.0, 100)
+    fats = _number(row.get(mapping.get('fats')), 'fats', 0.0, 100)
+    carbs = _number(row.get(mapping.get('carbs')), 'carbs', 0.0, 100)
+    if protein + fats + carbs > 101:
+        raise InvalidRow("protein + fats + carbs exceed 100 g")
+    return (name, calories, protein, fats, carbs)
+
+def normalize_recipe(row, mapping):
+    """Returns ((meal_type, name, instructions, calories, protein, fats, carbs, image_url), ingredients)."""
+    meal_type = MEAL_TYPES.get(_text(row.get(mapping.get('meal_type'))).lower())
+    if not meal_type:
+        raise InvalidRow(f"unknown meal_type: {row.get(mapping.get('meal_type'))!r}")
+    name = _text(row.get(mapping.get('name')))
+    if not name or len(name) > MAX_NAME_LENGTH:
+        raise InvalidRow("missing or too long name")
+
+    # Per serving; free text such as "Около 350 ккал" is accepted too
+    calories = row.get(mapping.get('calories'))
+    if isinstance(calories, bool) or (calories is not None and not isinstance(calories, (str, int, float))):
+        raise InvalidRow(f"calories is not a number: {calories!r}")
+    calories = calories or None
+    calories = migrations.parse_calories(calories)
+    if calories is not None:
+        calories = _number(calories, 'calories', maximum=5000)
+    macros = []
+    for key in ('protein', 'fats', 'carbs'):
+        value = row.get(mapping.get(key))
+        macros.append(None if value in (None, '') else _number(value, key, maximum=500))
+
+    ingredients = row.get(mapping.get('ingredients')) or []
+    if isinstance(ingredients, str):
+        ingredients = ingredients.split(';')
+    ingredients = [_text(ingredient) for ingredient in ingredients if _text(ingredient)]
+
+    instructions = str(row.get(mapping.get('instructions')) or '').strip() or None
+    image_url = _text(row.get(mapping.get('image_url'))) or None
+    return (meal_type, name, instructions, calories, *macros, image_url), ingredients
+
+class Progress:
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.reported = self.started
+
+    def rate(self, rows):
+        return rows / max(time.perf_counter() - self.started, 1e-9)
+
+    def update(self, rows, skipped):
+        now = time.perf_counter()
+        if now - self.reported >= PROGRESS_INTERVAL:
+            self.reported = now
+            logging.info(f"{self.label}: {rows} rows staged, {skipped} skipped, {self.rate(rows):.0f} rows/s")
+
+def _secondary_indexes(conn, table):
+    """Non-unique indexes of table as (name, sql); safe to drop during a load."""
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    return [(name, sql) for name, sql in rows if not sql.upper().startswith('CREATE UNIQUE')]
+
+def _merge(conn, table, staging, statement, batch, staged_rows):
+    """Run statement (with ? ? for a staging rowid range) chunk by chunk.
+
+    Dropped indexes are recorded in deferred_indexes in the same transaction,
+    so if the process dies mid-load the next init_db() or import rebuilds them.
+    """
+    existing = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    deferred = _secondary_indexes(conn, table) if staged_rows > existing else []
+    if deferred:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO deferred_indexes (name, sql) VALUES (?, ?)", deferred)
+            for name, _ in deferred:
+                conn.execute(f"DROP INDEX {name}")
+    try:
+        last = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {staging}").fetchone()[0]
+        for start in range(1, last + 1, batch):
+            with conn:
+                conn.execute(statement, (start, start + batch - 1))
+    finally:
+        if deferred:
+            with conn:
+                conn.executemany("DELETE FROM deferred_indexes WHERE name = ?", [(name,) for name, _ in deferred])
+                for name, sql in deferred:
+                    conn.execute(sql)
+                    logging.info(f"Index {name} rebuilt")
+
+def _stage(conn, rows, normalize, columns, insert, batch, label):
+    """Validate rows and executemany them into staging in batches of `batch`."""
+    progress = Progress(label)
+    mapping = None
+    pending = []
+    staged = skipped = 0
+    for line, row in enumerate(rows, 1):
+        if mapping is None:
+            mapping = _column_map(row.keys(), columns)
+        try:
+            pending.append(normalize(row, mapping))
+        except InvalidRow as e:
+            skipped += 1
+            if skipped <= 10:
+                logging.warning(f"{label}: row {line} skipped: {e}")
+            continue
+        if len(pending) >= batch:
+            staged += insert(pending)
+            pending = []
+            progress.update(staged, skipped)
+    if pending:
+        staged += insert(pending)
+    logging.info(f"{label}: {staged} rows staged, {skipped} skipped, {progress.rate(staged):.0f} rows/s")
+    return staged, skipped, progress
+
+def import_foods(path, batch=5000):
+    conn = database.get_connection()
+    database.restore_deferred_indexes(conn)
+    conn.execute("DROP TABLE IF EXISTS temp.staging_foods")
+    conn.execute("CREATE TEMP TABLE staging_foods (name TEXT, calories REAL, protein REAL, fats REAL, carbs REAL)")
+
+    def insert(rows):
+        with conn:
+            conn.executemany("INSERT INTO staging_foods VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    staged, skipped, progress = _stage(conn, read_rows(path), normalize_food, FOOD_COLUMNS, insert, batch, 'foods')
+    _merge(conn, 'food_data', 'staging_foods', '''
+        INSERT INTO food_data (name, calories, protein, fats, carbs)
+        SELECT name, calories, protein, fats, carbs FROM staging_foods WHERE rowid BETWEEN ? AND ?
+        ON CONFLICT (name) DO UPDATE SET
+            calories = excluded.calories, protein = excluded.protein,
+            fats = excluded.fats, carbs = excluded.carbs
+    ''', batch, staged)
+    conn.execute("DROP TABLE temp.staging_foods")
+    database.invalidate_reference_cache()
+    logging.info(f"foods: {staged} rows imported in {time.perf_counter() - progress.started:.1f}s "
+                 f"({progress.rate(staged):.0f} rows/s)")
+    return staged, skipped
+
+def import_recipes(path, batch=1000):
+    conn = database.get_connection()
+    database.restore_deferred_indexes(conn)
+    conn.execute("DROP TABLE IF EXISTS temp.staging_recipes")
+    conn.execute("DROP TABLE IF EXISTS temp.staging_ingredients")
+    conn.execute(
+        "CREATE TEMP TABLE staging_recipes (meal_type TEXT, name TEXT, instructions TEXT, "
+        "calories REAL, protein REAL, fats REAL, carbs REAL, image_url TEXT)"
+    )
+    conn.execute("CREATE TEMP TABLE staging_ingredients (recipe_row INTEGER, ingredient TEXT)")
+    staged_rows = 0
+
+    def insert(rows):
+        # staging_recipes is fresh, so its rowids are 1..n in insertion order
+        nonlocal staged_rows
+        with conn:
+            conn.executemany("INSERT INTO staging_recipes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [recipe for recipe, _ in rows])
+            conn.executemany(
+                "INSERT INTO staging_ingredients VALUES (?, ?)",
+                [(staged_rows + i, ingredient) for i, (_, ingredients) in enumerate(rows, 1) for ingredient in ingredients]
+            )
+        staged_rows += len(rows)
+        return len(rows)
+
+    staged, skipped, progress = _stage(conn, read_rows(path), normalize_recipe, RECIPE_COLUMNS, insert, batch, 'recipes')
+    _merge(conn, 'recipes', 'staging_recipes', '''
+        INSERT INTO recipes (meal_type, name, instructions, calories, protein, fats, carbs, image_url)
+        SELECT meal_type, name, instructions, calories, protein, fats, carbs, image_url
+        FROM staging_recipes WHERE rowid BETWEEN ? AND ?
+        ON CONFLICT (name) DO UPDATE SET
+            meal_type = excluded.meal_type,
+            instructions = COALESCE(excluded.instructions, instructions),
+            calories = COALESCE(excluded.calories, calories),
+            protein = COALESCE(excluded.protein, protein),
+            fats = COALESCE(excluded.fats, fats),
+            carbs = COALESCE(excluded.carbs, carbs),
+            image_url = COALESCE(excluded.image_url, image_url)
+    ''', batch, staged)
+
+    # Ingredients of imported recipes are replaced, not merged; when a name
+    # repeats in the input the last row wins, as it does for the recipe itself
+    conn.execute("CREATE INDEX temp.staging_recipes_name ON staging_recipes (name)")
+    ingredients = conn.execute("SELECT COUNT(*) FROM staging_ingredients").fetchone()[0]
+    imported_ids = "SELECT recipes.id FROM recipes JOIN staging_recipes ON staging_recipes.name = recipes.name"
+    with conn:
+        database.drop_ingredient_search_triggers(conn)
+    try:
+        with conn:
+            conn.execute(f"DELETE FROM recipe_ingredients WHERE recipe_id IN ({imported_ids})")
+        _merge(conn, 'recipe_ingredients', 'staging_ingredients', '''
+            INSERT INTO recipe_ingredients (recipe_id, ingredient)
+            SELECT recipes.id, staging_ingredients.ingredient
+            FROM staging_ingredients
+            JOIN staging_recipes ON staging_recipes.rowid = staging_ingredients.recipe_row
+            JOIN recipes ON recipes.name = staging_recipes.name
+            WHERE staging_ingredients.rowid BETWEEN ? AND ?
+            AND staging_recipes.rowid = (SELECT MAX(rowid) FROM staging_recipes AS latest WHERE latest.name = staging_recipes.name)
+            ORDER BY staging_ingredients.rowid
+        ''', batch * 10, ingredients)
+    finally:
+        with conn:
+            database.create_ingredient_search_triggers(conn, refresh_ids=imported_ids)
+    conn.execute("DROP TABLE temp.staging_recipes")
+    conn.execute("DROP TABLE temp.staging_ingredients")
+    database.invalidate_reference_cache()
+    logging.info(f"recipes: {staged} recipes with {ingredients} ingredients imported in "
+                 f"{time.perf_counter() - progress.started:.1f}s ({progress.rate(staged):.0f} rows/s)")
+    return staged, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('kind', choices=('foods', 'recipes'))
+    parser.add_argument('path')
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--batch', type=int, default=None, help="rows per executemany batch and transaction")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} not found")
+    database.configure(args.db)
+    database.init_db()
+    if args.kind == 'foods':
+        import_foods(args.path, args.batch or 5000)
+    else:
+        import_recipes(args.path, args.batch or 1000)
+    database.close_connections()
+
+if __name__ == "__main__":
+    main()
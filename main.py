@@ -1,14 +1,24 @@
 import logging
 import telebot
-from telebot import types
 import config
+import broadcast
+import conversation
 import database
-import requests
+import diary
+import flood_control
+import image_cache
+import messages
+import metrics
 from io import BytesIO
-import schedule
-import time
+import reminders
+import render_cache
+import webhook
+from router import Router
 import random
+import signal
+import sys
 import threading
+import user_writer
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -16,25 +26,24 @@ logging.basicConfig(
 )
 
 bot = telebot.TeleBot(config.TOKEN)
+router = Router(flood_control.limiter, conversation.sessions)
 
-@bot.message_handler(commands=['start'])
+@router.command('start')
 def start(message):
     user_id = message.from_user.id
     username = message.from_user.username
     first_name = message.from_user.first_name
     last_name = message.from_user.last_name
     chat_id = message.chat.id
+    user_writer.writer.unblock(chat_id)
+    broadcaster.unblock(chat_id)
     
-    if not database.user_exists(user_id):
-        database.add_user(user_id, username, first_name, last_name, chat_id)
-        welcome_message = f"👋 Привет, {first_name}!\n\n"
-        welcome_message += "Добро пожаловать в PlanEat – твой персональный помощник для отслеживания калорий и планирования питания! 🥗\n\n С моей помощью ты сможешь:\n• Записывать и отслеживать калории 📊\n• Контролировать свой рацион 🍎\n• Достигать своих целей по питанию 🎯\n\n Начни свой путь к здоровому питанию прямо сейчас!\n\nДля начала моей работы, необходимо пройти небольшую регистрацию, отправь мне команду /reg"
-        bot.reply_to(message, welcome_message)
+    if user_writer.writer.register(user_id, username, first_name, last_name, chat_id):
+        bot.reply_to(message, messages.welcome(first_name))
     else:
-        welcome_back_message = f"С возвращением, {first_name}! 🎉\n\n Рад видеть тебя снова в PlanEat. Продолжим отслеживать твои калории и поддерживать здоровое питание! 💪"
-        bot.reply_to(message, welcome_back_message)
+        bot.reply_to(message, messages.welcome_back(first_name))
 
-@bot.message_handler(commands=['reg'])
+@router.command('reg')
 def reg(message):
     user_id = message.from_user.id
     username = message.from_user.username
@@ -42,217 +51,317 @@ def reg(message):
     last_name = message.from_user.last_name
     chat_id = message.chat.id
 
-    if not database.user_exists(user_id):
-        database.add_user(user_id, username, first_name, last_name, chat_id)
-        bot.reply_to(message, "Спасибо! Ты успешно зарегистрирован!\nТеперь ты можешь воспользоваться командами: \n• /plan - для создания плана питания\n• /recipe - для получения рецепта\n• /track - для отслеживания калорий\n• /help - для просмотра доступных команд")
+    if user_writer.writer.register(user_id, username, first_name, last_name, chat_id):
+        bot.reply_to(message, messages.REGISTERED)
     else:
-        bot.reply_to(message, "Ты уже зарегистрирован!")
+        bot.reply_to(message, messages.ALREADY_REGISTERED)
 
-@bot.message_handler(commands=['plan'])
+@router.command('plan')
 def plan(message):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
-    btn1 = types.KeyboardButton('Похудение 🔽')
-    btn2 = types.KeyboardButton('Набор массы 🔼')
-    btn3 = types.KeyboardButton('Поддержание веса ⚖️')
-    markup.add(btn1, btn2, btn3)
-    
-    bot.reply_to(message, "Выбери свою цель, чтобы получить подходящий план питания на неделю:", reply_markup=markup)
+    bot.reply_to(message, messages.CHOOSE_GOAL, reply_markup=render_cache.goal_keyboard())
 
-@bot.message_handler(func=lambda message: message.text in ['Похудение 🔽', 'Набор массы 🔼', 'Поддержание веса ⚖️'])
+@router.text(*messages.GOAL_BUTTONS)
 def create_plan(message):
     goal = message.text.split(' ')[0]  
     
-    meal_plan = database.get_meal_plan(goal)
-    
-    if meal_plan:
-        days = {}
-        for day, meal, dish, calories in meal_plan:
-            if day not in days:
-                days[day] = []
-            days[day].append((meal, dish, calories))
-        
-        plan_text = f"📋 План питания на неделю для {goal.lower()}:\n\n"
-        
-        for day in sorted(days.keys()):
-            plan_text += f"🔸 {day}:\n"
-            for meal, dish, calories in days[day]:
-                plan_text += f"  • {meal}: {dish} ({calories} ккал)\n"
-            plan_text += "\n"
-            
-        plan_text += "... и так далее на всю неделю"
-    else:
-        plan_text = "К сожалению, не удалось найти план питания для выбранной цели."
-    
-    markup = types.ReplyKeyboardRemove()
-    bot.reply_to(message, plan_text, reply_markup=markup)
-    bot.send_message(message.chat.id, "Хочешь получить детальные рецепты блюд из плана? Используй команду /recipe")
+    bot.reply_to(message, render_cache.plan_text(goal), reply_markup=render_cache.remove_keyboard())
+    bot.send_message(message.chat.id, messages.PLAN_FOLLOWUP)
+
+@router.command('targets')
+def targets(message):
+    # meal_planner pulls in numpy, which stays off the startup path
+    import meal_planner
+
+    args = message.text.split()[1:]
+    if not args:
+        current = database.get_user_targets(message.from_user.id)
+        bot.reply_to(message, messages.targets_text(current) if current else messages.TARGETS_USAGE)
+        return
+    parsed = meal_planner.parse_targets(args)
+    if parsed is None:
+        bot.reply_to(message, messages.TARGETS_USAGE)
+        return
+    database.set_user_targets(message.from_user.id, *parsed)
+    bot.reply_to(message, messages.targets_text(parsed))
 
-@bot.message_handler(commands=['recipe'])
+@router.command('myplan')
+def my_plan(message):
+    import meal_planner
+
+    user_targets = database.get_user_targets(message.from_user.id)
+    default = user_targets is None
+    week = tuple(diary.today().isocalendar())[:2]
+    text = render_cache.weekly_plan(message.from_user.id, user_targets or meal_planner.default_targets(), week, default)
+    bot.reply_to(message, text)
+
+@router.command('recipe')
 def recipe(message):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    btn1 = types.KeyboardButton('Завтрак 🍳')
-    btn2 = types.KeyboardButton('Обед 🍲')
-    btn3 = types.KeyboardButton('Ужин 🍽️')
-    btn4 = types.KeyboardButton('Десерт 🍰')
-    btn5 = types.KeyboardButton('Напиток 🥤')
-    markup.add(btn1, btn2, btn3, btn4, btn5)
-    
-    bot.reply_to(message, "Выбери тип блюда, для которого хочешь получить рецепт:", reply_markup=markup)
+    bot.reply_to(message, messages.CHOOSE_MEAL_TYPE, reply_markup=render_cache.meal_type_keyboard())
+
+def _remember_photo(recipe, sent_message):
+    if not (sent_message and sent_message.photo):
+        return
+    try:
+        database.save_recipe_photo(recipe['id'], recipe['image_url'], sent_message.photo[-1].file_id)
+    except Exception as e:
+        logging.error(f"Не удалось сохранить file_id изображения для {recipe['name']}: {str(e)}")
+
+def send_recipe_photo(chat_id, recipe):
+    """Send the recipe photo, reusing the Telegram file_id after the first upload."""
+    # Under overload the recipe is answered in text only
+    if not recipe['image_url'] or flood_control.degraded():
+        return False
 
-@bot.message_handler(func=lambda message: message.text in ['Завтрак 🍳', 'Обед 🍲', 'Ужин 🍽️', 'Десерт 🍰', 'Напиток 🥤'])
+    file_id = database.get_recipe_photo(recipe['id'], recipe['image_url'])
+    if file_id:
+        try:
+            bot.send_photo(chat_id, file_id)
+            return True
+        except Exception as e:
+            logging.warning(f"Сохраненный file_id больше не действует для {recipe['name']}: {str(e)}")
+            database.delete_recipe_photo(recipe['id'])
+
+    # Only local bytes are read here; downloads happen in the image prefetcher.
+    content = image_cache.get_cache().get(recipe['image_url'])
+    if content:
+        try:
+            photo = BytesIO(content)
+            photo.name = f"{recipe['name']}.jpg"
+            _remember_photo(recipe, bot.send_photo(chat_id, photo))
+            logging.info(f"Изображение успешно отправлено из локального кэша для: {recipe['name']}")
+            return True
+        except Exception as e1:
+            logging.warning(f"Не удалось отправить изображение из локального кэша: {str(e1)}")
+    else:
+        image_cache.get_cache().prefetch([recipe['image_url']])
+
+    try:
+        _remember_photo(recipe, bot.send_photo(chat_id, recipe['image_url']))
+        logging.info(f"Изображение успешно отправлено через прямой URL для: {recipe['name']}")
+        return True
+    except Exception as e2:
+        logging.warning(f"Не удалось отправить изображение через прямой URL: {str(e2)}")
+    return False
+
+@router.text(*messages.MEAL_TYPE_BUTTONS)
 def get_recipe(message):
     meal_type = message.text.split(' ')[0]  
     
     recipe = database.get_recipe(meal_type)
     
     if recipe:
-        image_sent = False
-        if recipe['image_url']:
-            try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': 'image/jpeg,image/png,image/*;q=0.8,*/*;q=0.5',
-                    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-                    'Referer': 'https://www.google.com/'
-                }
-                bot.send_photo(message.chat.id, recipe['image_url'])
-                image_sent = True
-                logging.info(f"Изображение успешно отправлено через прямой URL для: {recipe['name']}")
-            except Exception as e1:
-                logging.warning(f"Не удалось отправить изображение через прямой URL: {str(e1)}")
-                
-                try:
-                    response = requests.get(recipe['image_url'], headers=headers, stream=True, timeout=10)
-                    
-                    if response.status_code == 200:
-                        content = response.content
-                        if content and len(content) > 100:  
-                            photo = BytesIO(content)
-                            photo.name = f"{recipe['name']}.jpg"
-                            bot.send_photo(message.chat.id, photo)
-                            image_sent = True
-                            logging.info(f"Изображение успешно отправлено через BytesIO для: {recipe['name']}")
-                        else:
-                            logging.error(f"Получено пустое или слишком маленькое изображение для: {recipe['name']}")
-                    else:
-                        logging.error(f"Не удалось загрузить изображение для {recipe['name']}, код статуса: {response.status_code}")
-                except Exception as e2:
-                    logging.error(f"Вторая попытка отправки изображения также не удалась: {str(e2)}")
-        
-        response = f"🍽️ *{recipe['name']}*\n\n"
-        if not image_sent:
-            response += "*Изображение блюда недоступно*\n\n"
-        
-        response += "*Ингредиенты:*\n"
-        for ingredient in recipe['ingredients']:
-            response += f"• {ingredient}\n"
-        response += f"\n*Приготовление:*\n{recipe['instructions']}\n\n"
-        response += f"*Калорийность:* {recipe['calories']}"
+        image_sent = send_recipe_photo(message.chat.id, recipe)
         
-        markup = types.ReplyKeyboardRemove()
-        bot.reply_to(message, response, parse_mode="Markdown", reply_markup=markup)
+        bot.reply_to(message, render_cache.recipe_text(recipe, image_sent), parse_mode="Markdown", reply_markup=render_cache.remove_keyboard())
     else:
-        bot.reply_to(message, "К сожалению, у меня нет рецептов для этого типа блюда.")
+        bot.reply_to(message, messages.NO_RECIPE)
+
+@router.command('search')
+def search_recipes(message):
+    query = message.text.split(maxsplit=1)[1:]
+    if not query:
+        conversation.sessions.set(message.chat.id, 'search')
+        bot.send_message(message.chat.id, messages.SEARCH_PROMPT, reply_markup=render_cache.force_reply_markup())
+        return
+    reply_search(message, query[0])
+
+@router.state('search')
+@router.reply("Введи ингредиенты")
+def search_reply(message):
+    conversation.sessions.end(message.chat.id)
+    reply_search(message, message.text)
+
+def reply_search(message, query):
+    text, markup = render_cache.search_reply(query)
+    bot.reply_to(message, text, reply_markup=markup)
+
+@router.callback('r')
+def show_recipe(call):
+    bot.answer_callback_query(call.id)
+    payload = call.data.partition(':')[2]
+    recipe = database.get_recipe_by_id(int(payload)) if payload.isdigit() else None
+    if not recipe:
+        bot.send_message(call.message.chat.id, messages.RECIPE_NOT_FOUND)
+        return
+    image_sent = send_recipe_photo(call.message.chat.id, recipe)
+    bot.send_message(call.message.chat.id, render_cache.recipe_text(recipe, image_sent), parse_mode="Markdown")
+
+@router.command('foods', 'recipes')
+def catalog(message):
+    name = message.text.split()[0].lstrip('/').split('@')[0].lower()
+    text, markup = render_cache.catalog_page(name)
+    bot.send_message(message.chat.id, text, reply_markup=markup, parse_mode="Markdown")
+
+@router.callback('fp', 'rp')
+def catalog_page(call):
+    bot.answer_callback_query(call.id)
+    prefix, _, cursor = call.data.partition(':')
+    text, markup = render_cache.catalog_page('foods' if prefix == 'fp' else 'recipes', cursor)
+    try:
+        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup, parse_mode="Markdown")
+    except Exception as e:
+        logging.error(f"Не удалось обновить страницу каталога: {str(e)}")
+
+@router.callback('f')
+def show_food(call):
+    bot.answer_callback_query(call.id)
+    payload = call.data.partition(':')[2]
+    food = database.get_food_by_id(int(payload)) if payload.isdigit() else None
+    bot.send_message(call.message.chat.id, messages.food_text(food) if food else messages.FOOD_NOT_FOUND)
 
-@bot.message_handler(commands=['track'])
+@router.command('track')
 def track(message):
-    markup = types.ForceReply(selective=True)
-    bot.send_message(message.chat.id, "Введи название блюда и его приблизительный состав или вес, чтобы я подсчитал калории:", reply_markup=markup)
+    conversation.sessions.set(message.chat.id, 'track')
+    bot.send_message(message.chat.id, messages.TRACK_PROMPT, reply_markup=render_cache.track_prompt_markup())
 
-@bot.message_handler(func=lambda message: message.reply_to_message and message.reply_to_message.text.startswith("Введи название блюда"))
+@router.state('track')
+@router.reply("Введи название блюда")
 def calculate_calories(message):
-    food_text = message.text.lower()
-    
-    calories = 0
-    protein = 0
-    fats = 0
-    carbs = 0
-    
-    food_data = database.get_food_data()
-    
-    found_foods = []
-    for food in food_data:
-        if food in food_text:
-            found_foods.append(food)
-            calories += food_data[food]['calories']
-            protein += food_data[food]['protein']
-            fats += food_data[food]['fats']
-            carbs += food_data[food]['carbs']
-    
+    conversation.sessions.end(message.chat.id)
+    found_foods = database.get_food_matcher().match(message.text)
     if found_foods:
-        response = f"📊 *Подсчет калорий для: {message.text}*\n\n"
-        response += f"*Обнаруженные продукты:* {', '.join(found_foods)}\n\n"
-        response += f"*Приблизительная пищевая ценность (на 100г каждого продукта):*\n"
-        response += f"• Калории: {calories:.0f} ккал\n"
-        response += f"• Белки: {protein:.1f} г\n"
-        response += f"• Жиры: {fats:.1f} г\n"
-        response += f"• Углеводы: {carbs:.1f} г\n\n"
-        response += "⚠️ Это приблизительная оценка. Для более точного подсчета, укажите граммовку каждого продукта."
-    else:
-        response = "Извини, я не смог распознать продукты в твоем сообщении. Попробуй указать более распространенные продукты, например: курица, рис, яйца, молоко и т.д."
-    
-    bot.reply_to(message, response, parse_mode="Markdown")
+        diary.record(message.from_user.id, message.text, found_foods)
+    bot.reply_to(message, messages.calories_text(message.text, found_foods, logged=bool(found_foods)), parse_mode="Markdown")
 
-@bot.message_handler(commands=['help'])
+@router.command('today')
+def today(message):
+    day, totals = diary.get_today(message.from_user.id)
+    bot.reply_to(message, messages.today_text(day, totals), parse_mode="Markdown")
+
+@router.command('week')
+def week(message):
+    bot.reply_to(message, messages.week_text(diary.get_week(message.from_user.id)), parse_mode="Markdown")
+
+@router.command('stats')
+def stats(message):
+    bot.reply_to(message, messages.stats_text(database.get_diary_stats(message.from_user.id)), parse_mode="Markdown")
+
+@router.command('help')
 def help_command(message):
-    help_text = "🍽️ *PlanEat - Калорийный помощник*\n\n"
-    help_text += "*Доступные команды:*\n"
-    help_text += "• /start - Начать работу с ботом\n"
-    help_text += "• /reg - Зарегистрироваться в системе\n"
-    help_text += "• /plan - Создать план питания на основе твоей цели\n"
-    help_text += "• /recipe - Получить рецепты блюд\n"
-    help_text += "• /track - Отслеживать калории в блюдах\n"
-    help_text += "• /healthtip - Получить ежедневный совет по здоровью\n"
-    help_text += "• /setreminder - Установить напоминания о приеме пищи\n"
-    help_text += "• /help - Показать это сообщение\n\n"
-    help_text += "Если у тебя есть вопросы или предложения, не стесняйся обращаться!"
-    
-    bot.reply_to(message, help_text, parse_mode="Markdown")
+    bot.reply_to(message, render_cache.help_text(), parse_mode="Markdown")
 
-@bot.message_handler(commands=['healthtip'])
+@router.command('healthtip')
 def send_health_tip(message):
     health_tips = database.get_health_tips()
     if health_tips:
         tip = random.choice(health_tips)
-        bot.reply_to(message, f"💡 Совет по здоровью: {tip}")
+        bot.reply_to(message, messages.health_tip(tip))
     else:
-        bot.reply_to(message, "Извините, в данный момент нет доступных советов по здоровью.")
+        bot.reply_to(message, messages.NO_HEALTH_TIPS)
 
-@bot.message_handler(commands=['setreminder'])
+@router.command('setreminder')
 def set_meal_reminder(message):
-    bot.reply_to(message, "Напоминания о приеме пищи установлены на 8:00, 12:00 и 18:00.")
-    schedule.every().day.at("08:00").do(lambda: bot.send_message(message.chat.id, "Время завтракать! 🍳"))
-    schedule.every().day.at("12:00").do(lambda: bot.send_message(message.chat.id, "Время обедать! 🍲"))
-    schedule.every().day.at("18:00").do(lambda: bot.send_message(message.chat.id, "Время ужинать! 🍽️"))
+    if message.text.split()[1:] == ['off']:
+        database.delete_reminders(message.chat.id)
+        bot.reply_to(message, messages.REMINDERS_OFF)
+        return
 
-def run_scheduler():
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    try:
+        times, tz_name = reminders.parse_reminder_args(message.text)
+    except ValueError as e:
+        bot.reply_to(message, str(e))
+        return
 
-threading.Thread(target=run_scheduler).start()
+    reminders.set_reminders(message.chat.id, times, tz_name)
+    database.unblock_chat(message.chat.id)
+    broadcaster.unblock(message.chat.id)
+    bot.reply_to(message, messages.reminders_set(times, tz_name))
 
-def main():
-    database.init_db()
-    test_image_urls()
+@router.throttled
+def throttled(message):
+    bot.send_message(message.chat.id, messages.FLOOD_WARNING)
+
+@router.throttled_callback
+def throttled_callback(call):
+    bot.answer_callback_query(call.id, messages.FLOOD_WARNING)
+
+# Single telebot handler; routing happens in O(1) inside the Router
+@bot.message_handler(content_types=['text'])
+def dispatch(message):
+    if message.from_user:
+        user_writer.writer.touch(message.from_user.id)
+    router.dispatch(message)
+
+@bot.callback_query_handler(func=lambda call: True)
+def dispatch_callback(call):
+    user_writer.writer.touch(call.from_user.id)
+    router.dispatch_callback(call)
+
+broadcaster = broadcast.Broadcaster(bot.send_message)
+
+def send_reminder(chat_id, meal):
+    broadcaster.submit(chat_id, reminders.REMINDER_MESSAGES[meal])
+
+def start_background(is_leader=None, shard=None):
+    """Start the reminder fan-out, the scheduler, the user writer and the
+    conversation store; importing main starts nothing.
+
+    is_leader is passed on to reminders.run_scheduler and shard to the
+    conversation store (supervisor workers).
+    """
+    broadcaster.start()
+    user_writer.writer.start()
+    conversation.sessions.start(shard)
+    threading.Thread(
+        target=reminders.run_scheduler, args=(send_reminder, is_leader), name='reminder-scheduler', daemon=True
+    ).start()
+
+def run_webhook():
+    # Handlers run on the webhook server's per-chat workers instead of
+    # telebot's own pool, which would not preserve per-chat ordering.
+    bot.threaded = False
+    server = webhook.WebhookServer(bot.process_new_updates).start()
+    metrics.register_collector('planeat_webhook', lambda: server.stats)
+    bot.set_webhook(
+        url=config.WEBHOOK_URL + config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET,
+        max_connections=config.WEBHOOK_WORKERS
+    )
+    server.serve_forever()
+
+def start_metrics(port=None):
+    metrics.instrument_bot_api()
+    metrics.register_collector('planeat_reference_cache', database.reference_cache_stats)
+    metrics.register_collector('planeat_render_cache', render_cache.cache.stats)
+    metrics.register_collector('planeat_image_cache', lambda: image_cache.get_cache().stats())
+    metrics.register_collector('planeat_broadcast', broadcaster.stats)
+    metrics.register_collector('planeat_user_writer', user_writer.writer.stats)
+    metrics.register_collector('planeat_conversations', conversation.sessions.stats)
+    if flood_control.limiter is not None:
+        metrics.register_collector('planeat_flood', flood_control.limiter.stats)
+    metrics.start_server(port=port)
+
+def run():
+    if config.RUNTIME == 'asyncio':
+        import async_main
+        async_main.broadcaster = broadcaster
+        async_main.run()
+        return
+    image_cache.start_prefetcher(database.get_recipe_image_urls)
     logging.info("Bot started")
-    bot.infinity_polling()
+    if config.UPDATE_MODE == 'webhook':
+        run_webhook()
+    else:
+        bot.remove_webhook()
+        bot.infinity_polling()
 
-def test_image_urls():
-    logging.info("Проверка доступности URL с изображениями...")
+def main():
+    if config.WORKER_PROCESSES > 1:
+        import supervisor
+        supervisor.run()
+        return
+    database.init_db()
+    start_metrics()
+    start_background()
+    # SIGTERM (service stop, deploys) unwinds like Ctrl+C, so the queued
+    # user writes and sessions below are committed before the process exits
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     try:
-        recipe = database.get_recipe("Завтрак")
-        if recipe and recipe['image_url']:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(recipe['image_url'], headers=headers, timeout=5)
-            if response.status_code == 200 and len(response.content) > 100:
-                logging.info("Тестовый URL с изображением доступен и корректен")
-            else:
-                logging.warning(f"Проблема с тестовым URL: статус {response.status_code}, размер: {len(response.content)} байт")
-    except Exception as e:
-        logging.error(f"Ошибка при проверке URL с изображением: {str(e)}")
+        run()
+    finally:
+        user_writer.writer.stop()
+        conversation.sessions.stop()
+        logging.info("Bot stopped")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+import numpy as np
+
+import config
+
+# Weekly meal plans for calorie/macro targets. Recipes and foods are packed
+# once into nutrient matrices (kcal, protein, fats, carbs per row), with each
+# meal slot's recipes sorted by calories; generating a plan then only scores
+# a window of recipes around each slot's share of the day, as whole array
+# operations.
+
+# (slot label, recipe meal types, share of the daily target)
+SLOTS = (
+    ('Завтрак', ('Завтрак',), 0.25),
+    ('Обед', ('Обед',), 0.35),
+    ('Ужин', ('Ужин',), 0.30),
+    ('Перекус', ('Десерт', 'Напиток'), 0.10),
+)
+
+DAYS = 7
+
+# Share of calories from protein/fats/carbs; fills in missing recipe macros
+# and macro targets given as calories only
+MACRO_SPLIT = (0.25, 0.30, 0.45)
+KCAL_PER_GRAM = (4.0, 9.0, 4.0)
+
+# Relative error weights: calories count most
+ERROR_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0])
+
+# The day's plan is picked at random among the best few candidates of every
+# slot, so that the days of a week differ
+TOP_CANDIDATES = 5
+# Only the recipes closest in calories to the slot's share of the day are
+# scored, so the cost of a plan does not grow with the recipe pool
+WINDOW = 512
+IMPROVE_PASSES = 2
+# A food portion tops up days that fall short of the calorie target
+EXTRA_GRAMS = (50, 300)
+
+# Accepted /targets values: daily calories, grams of a macro
+CALORIE_RANGE = (800, 6000)
+MAX_MACRO_GRAMS = 1000
+# Used by /myplan until the user sets targets
+DEFAULT_CALORIES = 2000
+
+def macros_from_calories(calories):
+    return tuple(calories * share / kcal for share, kcal in zip(MACRO_SPLIT, KCAL_PER_GRAM))
+
+def default_targets():
+    return (DEFAULT_CALORIES, *macros_from_calories(DEFAULT_CALORIES))
+
+def parse_targets(args):
+    """['2000'] or ['2000', '130', '70', '220'] -> (calories, protein, fats, carbs); None if invalid."""
+    try:
+        values = [float(arg.replace(',', '.')) for arg in args]
+    except ValueError:
+        return None
+    if len(values) == 1:
+        values.extend(macros_from_calories(values[0]))
+    if len(values) != 4 or not CALORIE_RANGE[0] <= values[0] <= CALORIE_RANGE[1]:
+        return None
+    if any(not 0 < value <= MAX_MACRO_GRAMS for value in values[1:]):
+        return None
+    return tuple(round(value, 1) for value in values)
+
+def _matrix(rows):
+    """(n, 4) float matrix of rows of (calories, protein, fats, carbs); None -> nan."""
+    return np.array(rows, dtype=float).reshape(-1, 4)
+
+class MealPlanner:
+    def __init__(self, recipes, foods):
+        """recipes: (id, meal_type, name, calories, protein, fats, carbs) rows,
+        foods: (id, name, calories, protein, fats, carbs) rows per 100 g."""
+        recipes = [row for row in recipes if row[3] and row[3] > 0]
+        self.recipe_ids = np.array([row[0] for row in recipes], dtype=np.int64)
+        self.recipe_names = [row[2] for row in recipes]
+        nutrients = _matrix([row[3:7] for row in recipes])
+        estimated = np.array(macros_from_calories(1.0)) * nutrients[:, :1]
+        nutrients[:, 1:] = np.where(np.isnan(nutrients[:, 1:]), estimated, nutrients[:, 1:])
+        self.nutrients = nutrients
+
+        meal_types = np.array([row[1] for row in recipes], dtype=object)
+        self.slots = []
+        for label, types, share in SLOTS:
+            pool = np.flatnonzero(np.isin(meal_types, types))
+            if len(pool):
+                pool = pool[np.argsort(nutrients[pool, 0], kind='stable')]
+                self.slots.append((label, share, pool, nutrients[pool, 0]))
+
+        foods = [row for row in foods if row[2] and row[2] > 0]
+        self.food_names = [row[1] for row in foods]
+        self.food_nutrients = np.nan_to_num(_matrix([row[2:6] for row in foods])) / 100.0
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def _candidates(self, pool, calories, ideal):
+        start = max(0, int(np.searchsorted(calories, ideal)) - WINDOW // 2)
+        stop = min(len(pool), start + WINDOW)
+        return pool[max(0, stop - WINDOW):stop]
+
+    def generate(self, targets, seed=0, days=DAYS):
+        """Plan for `days` days as a list of dicts with the chosen recipe rows
+        per slot, an optional food portion and the day's nutrient totals.
+
+        Within a slot's window the least used recipes are preferred, so a
+        recipe repeats only when the window has nothing new left.
+        """
+        if not self.slots:
+            return []
+        target = np.asarray(targets, dtype=float)
+        scale = ERROR_WEIGHTS / target
+        total_share = sum(share for _, share, _, _ in self.slots)
+        rng = np.random.default_rng(seed)
+        uses = np.zeros(len(self.recipe_ids), dtype=np.int32)
+        plan = []
+        for _ in range(days):
+            slot_candidates = []
+            chosen = []
+            total = np.zeros(4)
+            remaining = 1.0
+            for label, share, pool, calories in self.slots:
+                share /= total_share
+                remaining -= share
+                candidates = self._candidates(pool, calories, share * target[0])
+                candidates = candidates[uses[candidates] == uses[candidates].min()]
+                # Error of the day if the remaining slots hit their shares exactly
+                projected = total + self.nutrients[candidates] + remaining * target
+                error = np.abs(projected - target) @ scale
+                best = np.argpartition(error, min(TOP_CANDIDATES, len(error)) - 1)[:TOP_CANDIDATES]
+                pick = candidates[rng.choice(best)]
+                slot_candidates.append(candidates)
+                chosen.append(pick)
+                total += self.nutrients[pick]
+
+            # Local search: re-pick every slot given the others
+            for _ in range(IMPROVE_PASSES):
+                improved = False
+                for i, candidates in enumerate(slot_candidates):
+                    others = total - self.nutrients[chosen[i]]
+                    error = np.abs(others + self.nutrients[candidates] - target) @ scale
+                    best = candidates[np.argmin(error)]
+                    if best != chosen[i] and error.min() < np.abs(total - target) @ scale:
+                        chosen[i] = best
+                        total = others + self.nutrients[best]
+                        improved = True
+                if not improved:
+                    break
+
+            extra = None
+            if len(self.food_names) and target[0] - total[0] > config.PLAN_TOLERANCE * target[0]:
+                grams = np.clip((target[0] - total[0]) / self.food_nutrients[:, 0], *EXTRA_GRAMS)
+                projected = total + self.food_nutrients * grams[:, None]
+                error = np.abs(projected - target) @ scale
+                best = int(np.argmin(error))
+                if error[best] < np.abs(total - target) @ scale:
+                    extra = (self.food_names[best], float(grams[best]), float(self.food_nutrients[best, 0] * grams[best]))
+                    total = projected[best]
+
+            uses[chosen] += 1
+            plan.append({
+                'meals': [
+                    (label, int(self.recipe_ids[index]), self.recipe_names[index], float(self.nutrients[index, 0]))
+                    for (label, _, _, _), index in zip(self.slots, chosen)
+                ],
+                'extra': extra,
+                'totals': tuple(float(value) for value in total),
+                'within_tolerance': bool(abs(total[0] - target[0]) <= config.PLAN_TOLERANCE * target[0]),
+            })
+        return plan
@@ -0,0 +1,237 @@
+from telebot import types
+
+# Texts and keyboards shared by the threaded (main.py) and asyncio
+# (async_main.py) runtimes, so both answer exactly the same way.
+
+GOAL_BUTTONS = ['Похудение 🔽', 'Набор массы 🔼', 'Поддержание веса ⚖️']
+MEAL_TYPE_BUTTONS = ['Завтрак 🍳', 'Обед 🍲', 'Ужин 🍽️', 'Десерт 🍰', 'Напиток 🥤']
+
+TRACK_PROMPT = "Введи название блюда и его приблизительный состав или вес, чтобы я подсчитал калории:"
+
+REGISTERED = "Спасибо! Ты успешно зарегистрирован!\nТеперь ты можешь воспользоваться командами: \n• /plan - для создания плана питания\n• /recipe - для получения рецепта\n• /track - для отслеживания калорий\n• /help - для просмотра доступных команд"
+ALREADY_REGISTERED = "Ты уже зарегистрирован!"
+CHOOSE_GOAL = "Выбери свою цель, чтобы получить подходящий план питания на неделю:"
+PLAN_FOLLOWUP = "Хочешь получить детальные рецепты блюд из плана? Используй команду /recipe"
+CHOOSE_MEAL_TYPE = "Выбери тип блюда, для которого хочешь получить рецепт:"
+NO_RECIPE = "К сожалению, у меня нет рецептов для этого типа блюда."
+NO_HEALTH_TIPS = "Извините, в данный момент нет доступных советов по здоровью."
+REMINDERS_OFF = "Напоминания о приеме пищи отключены."
+SEARCH_PROMPT = "Введи ингредиенты или название блюда для поиска рецептов (можно добавить калорийность, например: курица рис до 500):"
+RECIPE_NOT_FOUND = "Рецепт не найден."
+FOOD_NOT_FOUND = "Продукт не найден."
+FLOOD_WARNING = "Слишком много запросов. Подожди немного и попробуй снова."
+TARGETS_USAGE = ("Укажи цель на день: /targets 2000 — только калории (БЖУ рассчитаю сам), "
+                 "или /targets 2000 130 70 220 — калории, белки, жиры и углеводы в граммах.")
+PLAN_UNAVAILABLE = "Пока недостаточно рецептов с указанной калорийностью, чтобы составить план."
+CATALOG_EMPTY = "Каталог пока пуст."
+CATALOG_TITLES = {
+    'foods': "🍎 *Продукты* — калорийность на 100 г. Выбери продукт:",
+    'recipes': "🍽️ *Рецепты* — калорийность на порцию. Выбери блюдо:",
+}
+
+def welcome(first_name):
+    welcome_message = f"👋 Привет, {first_name}!\n\n"
+    welcome_message += "Добро пожаловать в PlanEat – твой персональный помощник для отслеживания калорий и планирования питания! 🥗\n\n С моей помощью ты сможешь:\n• Записывать и отслеживать калории 📊\n• Контролировать свой рацион 🍎\n• Достигать своих целей по питанию 🎯\n\n Начни свой путь к здоровому питанию прямо сейчас!\n\nДля начала моей работы, необходимо пройти небольшую регистрацию, отправь мне команду /reg"
+    return welcome_message
+
+def welcome_back(first_name):
+    return f"С возвращением, {first_name}! 🎉\n\n Рад видеть тебя снова в PlanEat. Продолжим отслеживать твои калории и поддерживать здоровое питание! 💪"
+
+def goal_keyboard():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
+    markup.add(*[types.KeyboardButton(label) for label in GOAL_BUTTONS])
+    return markup
+
+def meal_type_keyboard():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    markup.add(*[types.KeyboardButton(label) for label in MEAL_TYPE_BUTTONS])
+    return markup
+
+def plan_text(goal, meal_plan):
+    if not meal_plan:
+        return "К сожалению, не удалось найти план питания для выбранной цели."
+
+    days = {}
+    for day, meal, dish, calories in meal_plan:
+        if day not in days:
+            days[day] = []
+        days[day].append((meal, dish, calories))
+
+    plan_text = f"📋 План питания на неделю для {goal.lower()}:\n\n"
+
+    for day in sorted(days.keys()):
+        plan_text += f"🔸 {day}:\n"
+        for meal, dish, calories in days[day]:
+            plan_text += f"  • {meal}: {dish} ({calories} ккал)\n"
+        plan_text += "\n"
+
+    plan_text += "Полный план на 7 дней под твои цели по калориям и БЖУ: /myplan"
+    return plan_text
+
+def targets_text(targets):
+    calories, protein, fats, carbs = targets
+    return (f"🎯 Цель на день: {calories:.0f} ккал, Б {protein:.0f} г, Ж {fats:.0f} г, У {carbs:.0f} г\n"
+            "План питания на неделю: /myplan")
+
+def weekly_plan_text(targets, plan, default=False):
+    if not plan:
+        return PLAN_UNAVAILABLE
+    calories, protein, fats, carbs = targets
+    response = f"📋 План питания на неделю: {calories:.0f} ккал, Б {protein:.0f} / Ж {fats:.0f} / У {carbs:.0f} г в день\n"
+    if default:
+        response += "Цель по умолчанию — задай свою командой /targets\n"
+    for weekday, day in zip(WEEKDAYS, plan):
+        day_calories, day_protein, day_fats, day_carbs = day['totals']
+        mark = "✅" if day['within_tolerance'] else "≈"
+        response += f"\n🔸 {weekday}: {day_calories:.0f} ккал {mark} (Б {day_protein:.0f} / Ж {day_fats:.0f} / У {day_carbs:.0f})\n"
+        for meal, _, dish, dish_calories in day['meals']:
+            response += f"  • {meal}: {dish} ({dish_calories:.0f} ккал)\n"
+        if day['extra']:
+            food, grams, food_calories = day['extra']
+            response += f"  • Дополнительно: {food}, {grams:.0f} г ({food_calories:.0f} ккал)\n"
+    response += "\nРецепты блюд: /search или /recipes"
+    return response
+
+def recipe_text(recipe, image_sent):
+    response = f"🍽️ *{recipe['name']}*\n\n"
+    if not image_sent:
+        response += "*Изображение блюда недоступно*\n\n"
+
+    response += "*Ингредиенты:*\n"
+    for ingredient in recipe['ingredients']:
+        response += f"• {ingredient}\n"
+    response += f"\n*Приготовление:*\n{recipe['instructions']}\n\n"
+    if recipe['calories'] is not None:
+        response += f"*Калорийность:* около {recipe['calories']:.0f} ккал"
+    if recipe.get('protein') is not None:
+        response += f"\n*БЖУ:* {recipe['protein']:.0f} / {recipe['fats']:.0f} / {recipe['carbs']:.0f} г"
+    return response
+
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+def calories_text(text, found_foods, logged=False):
+    if not found_foods:
+        return "Извини, я не смог распознать продукты в твоем сообщении. Попробуй указать более распространенные продукты, например: курица, рис, яйца, молоко и т.д."
+
+    calories = sum(food['calories'] for food in found_foods)
+    protein = sum(food['protein'] for food in found_foods)
+    fats = sum(food['fats'] for food in found_foods)
+    carbs = sum(food['carbs'] for food in found_foods)
+
+    response = f"📊 *Подсчет калорий для: {text}*\n\n"
+    response += "*Обнаруженные продукты:*\n"
+    for food in found_foods:
+        response += f"• {food['name']} — {food['grams']:.0f} г ({food['calories']:.0f} ккал)\n"
+    response += f"\n*Приблизительная пищевая ценность:*\n"
+    response += f"• Калории: {calories:.0f} ккал\n"
+    response += f"• Белки: {protein:.1f} г\n"
+    response += f"• Жиры: {fats:.1f} г\n"
+    response += f"• Углеводы: {carbs:.1f} г\n\n"
+    response += "⚠️ Это приблизительная оценка. Если вес продукта не указан, считается порция 100 г — укажи граммовку (например, 200г курицы или 2 яйца) для более точного подсчета."
+    if logged:
+        response += "\n\n✅ Записано в дневник. Итог дня: /today"
+    return response
+
+def today_text(day, totals):
+    if not totals:
+        return f"📅 {day.strftime('%d.%m.%Y')}: записей пока нет. Добавь прием пищи командой /track"
+    response = f"📅 *Итог за {day.strftime('%d.%m.%Y')}*\n\n"
+    response += f"• Калории: {totals['calories']:.0f} ккал\n"
+    response += f"• Белки: {totals['protein']:.1f} г\n"
+    response += f"• Жиры: {totals['fats']:.1f} г\n"
+    response += f"• Углеводы: {totals['carbs']:.1f} г\n"
+    response += f"• Записей: {totals['entries']}"
+    return response
+
+def week_text(week):
+    response = "📈 *Калории за неделю*\n\n"
+    total = 0
+    days = 0
+    for day, totals in week:
+        label = f"{WEEKDAYS[day.weekday()]} {day.strftime('%d.%m')}"
+        if totals:
+            response += f"• {label}: {totals['calories']:.0f} ккал\n"
+            total += totals['calories']
+            days += 1
+        else:
+            response += f"• {label}: —\n"
+    if days:
+        response += f"\nВ среднем: {total / days:.0f} ккал в день"
+    return response
+
+def stats_text(stats):
+    if not stats:
+        return "В дневнике пока нет записей. Добавь прием пищи командой /track"
+    response = "📊 *Статистика дневника*\n\n"
+    response += f"• Дней с записями: {stats['days']} (с {stats['first_date']})\n"
+    response += f"• Всего записей: {stats['entries']}\n"
+    response += f"• В среднем в день: {stats['avg_calories']:.0f} ккал, Б {stats['avg_protein']:.0f} г, Ж {stats['avg_fats']:.0f} г, У {stats['avg_carbs']:.0f} г\n"
+    response += f"• Максимум за день: {stats['max_calories']:.0f} ккал"
+    return response
+
+def help_text():
+    help_text = "🍽️ *PlanEat - Калорийный помощник*\n\n"
+    help_text += "*Доступные команды:*\n"
+    help_text += "• /start - Начать работу с ботом\n"
+    help_text += "• /reg - Зарегистрироваться в системе\n"
+    help_text += "• /plan - Создать план питания на основе твоей цели\n"
+    help_text += "• /recipe - Получить рецепты блюд\n"
+    help_text += "• /search - Найти рецепт по ингредиентам или названию\n"
+    help_text += "• /recipes - Каталог рецептов\n"
+    help_text += "• /targets - Цель по калориям и БЖУ на день\n"
+    help_text += "• /myplan - План питания на неделю под твои цели\n"
+    help_text += "• /foods - Каталог продуктов с пищевой ценностью\n"
+    help_text += "• /track - Отслеживать калории в блюдах\n"
+    help_text += "• /today - Итог дня по дневнику калорий\n"
+    help_text += "• /week - Калории за последние 7 дней\n"
+    help_text += "• /stats - Статистика дневника\n"
+    help_text += "• /healthtip - Получить ежедневный совет по здоровью\n"
+    help_text += "• /setreminder - Установить напоминания о приеме пищи\n"
+    help_text += "• /help - Показать это сообщение\n\n"
+    help_text += "Если у тебя есть вопросы или предложения, не стесняйся обращаться!"
+    return help_text
+
+def search_text(query, results):
+    if not results:
+        return f"По запросу «{query}» ничего не найдено. Попробуй другие ингредиенты или убери ограничение по калориям."
+    return f"🔎 Рецепты по запросу «{query}»: {len(results)}. Выбери блюдо:"
+
+def search_keyboard(results):
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    for recipe_id, name, meal_type, calories in results:
+        label = f"{name} · {calories:.0f} ккал" if calories is not None else name
+        markup.add(types.InlineKeyboardButton(label, callback_data=f"r:{recipe_id}"))
+    return markup
+
+def catalog_keyboard(rows, item_prefix, page_prefix, has_prev, has_next):
+    """One button per row plus ◀️ / ▶️; page buttons carry the id of the edge row."""
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    for item_id, name, calories in rows:
+        label = f"{name} · {calories:.0f} ккал" if calories is not None else name
+        markup.row(types.InlineKeyboardButton(label, callback_data=f"{item_prefix}:{item_id}"))
+    navigation = []
+    if has_prev:
+        navigation.append(types.InlineKeyboardButton("◀️", callback_data=f"{page_prefix}:<{rows[0][0]}"))
+    if has_next:
+        navigation.append(types.InlineKeyboardButton("▶️", callback_data=f"{page_prefix}:>{rows[-1][0]}"))
+    if navigation:
+        markup.row(*navigation)
+    return markup
+
+def food_text(food):
+    response = f"🍎 {food['name']}\n\n"
+    response += "Пищевая ценность на 100 г:\n"
+    response += f"• Калории: {food['calories']:.0f} ккал\n"
+    response += f"• Белки: {food['protein'] or 0:.1f} г\n"
+    response += f"• Жиры: {food['fats'] or 0:.1f} г\n"
+    response += f"• Углеводы: {food['carbs'] or 0:.1f} г"
+    return response
+
+def health_tip(tip):
+    return f"💡 Совет по здоровью: {tip}"
+
+def reminders_set(times, tz_name):
+    return (
+        f"Напоминания о приеме пищи установлены на {times['Завтрак']}, {times['Обед']} и {times['Ужин']} ({tz_name}).\n"
+        "Изменить время: /setreminder 07:30 13:00 19:00 Europe/Moscow\nОтключить: /setreminder off"
+    )
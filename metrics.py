@@ -0,0 +1,263 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# In-process counters and latency histograms, exported in the Prometheus text
+# format on METRICS_HOST:METRICS_PORT/metrics. With METRICS_ENABLED = False
+# the decorators return the original functions and timer() a shared no-op,
+# so instrumented code pays for one flag check at most.
+
+ENABLED = config.METRICS_ENABLED
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors = []
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative buckets are built at render time; observe() bumps one slot."""
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, seconds, *labels):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return series[2] if series else 0
+
+    def snapshot(self):
+        """{labels: (count, sum)} for every series."""
+        with self._lock:
+            return {labels: (count, total) for labels, (_, total, count) in self._values.items()}
+
+    def quantile(self, q, *labels):
+        """Estimate the q-quantile from the buckets (linear within a bucket)."""
+        with self._lock:
+            series = self._values.get(labels)
+            counts = list(series[0]) if series else None
+        if not counts or not sum(counts):
+            return 0.0
+        rank = q * sum(counts)
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items())
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+HANDLER_SECONDS = Histogram('planeat_handler_seconds', 'Time spent in a message handler.', ('handler',))
+HANDLER_ERRORS = Counter('planeat_handler_errors_total', 'Exceptions raised by message handlers.', ('handler',))
+DB_QUERY_SECONDS = Histogram('planeat_db_query_seconds', 'Time spent in a database.py query function.', ('query',))
+DB_ERRORS = Counter('planeat_db_errors_total', 'Exceptions raised by database.py query functions.', ('query',))
+BOT_API_SECONDS = Histogram('planeat_bot_api_seconds', 'Duration of outbound Telegram Bot API requests.', ('method',))
+BOT_API_ERRORS = Counter('planeat_bot_api_errors_total', 'Failed Telegram Bot API requests.', ('method', 'code'))
+IMAGE_FETCH_SECONDS = Histogram('planeat_image_fetch_seconds', 'Duration of recipe image downloads.')
+SCHEDULER_LAG_SECONDS = Histogram('planeat_reminder_scheduler_lag_seconds', 'Delay between a reminder minute and the scheduler tick that handled it.')
+REMINDERS_DUE = Counter('planeat_reminders_due_total', 'Reminders handed to the broadcaster.')
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'errors', 'started')
+
+    def __init__(self, histogram, labels, errors):
+        self.histogram = histogram
+        self.labels = labels
+        self.errors = errors
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.errors is not None:
+            self.errors.inc(*self.labels)
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+_noop = nullcontext()
+
+def timer(histogram, *labels, errors=None):
+    """Context manager that records its duration in histogram (and failures in errors)."""
+    if not ENABLED:
+        return _noop
+    return _Timer(histogram, labels, errors)
+
+def timed_query(func):
+    """Decorator for database.py functions; labelled with the function name."""
+    if not ENABLED:
+        return func
+    name = func.__name__.lstrip('_')
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _Timer(DB_QUERY_SECONDS, (name,), DB_ERRORS):
+            return func(*args, **kwargs)
+    return wrapper
+
+def _error_code(error):
+    return str(getattr(error, 'error_code', None) or type(error).__name__)
+
+def instrument_bot_api():
+    """Time every Bot API request made by TeleBot and AsyncTeleBot."""
+    if not ENABLED:
+        return
+    from telebot import apihelper
+    make_request = apihelper._make_request
+    if getattr(make_request, 'instrumented', False):
+        return
+
+    def _make_request(token, method_name, method='get', params=None, files=None):
+        started = time.perf_counter()
+        try:
+            return make_request(token, method_name, method, params, files)
+        except Exception as e:
+            BOT_API_ERRORS.inc(method_name, _error_code(e))
+            raise
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, method_name)
+
+    _make_request.instrumented = True
+    apihelper._make_request = _make_request
+
+    try:
+        from telebot import asyncio_helper
+    except ImportError:
+        return
+    process_request = asyncio_helper._process_request
+    if getattr(process_request, 'instrumented', False):
+        return
+
+    async def _process_request(token, url, method='get', params=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await process_request(token, url, method, params, files, **kwargs)
+        except Exception as e:
+            BOT_API_ERRORS.inc(url, _error_code(e))
+            raise
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, url)
+
+    _process_request.instrumented = True
+    asyncio_helper._process_request = _process_request
+
+def register_collector(prefix, collect):
+    """Export the numeric values of collect() (a stats dict) as gauges named prefix_key."""
+    _collectors.append((prefix, collect))
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for prefix, collect in _collectors:
+        try:
+            values = collect()
+        except Exception as e:
+            logging.error(f"Ошибка при сборе метрик {prefix}: {str(e)}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    return '\n'.join(lines) + '\n'
+
+def start_server(host=None, port=None):
+    """Serve /metrics from a daemon thread. Returns the server, or None when disabled."""
+    if not ENABLED:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or config.METRICS_HOST, port or config.METRICS_PORT), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logging.info(f"Metrics available on port {server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,259 @@
+"""Versioned schema migrations, tracked in PRAGMA user_version.
+
+    python migrations.py [--db users.db] [--check]
+
+init_db() creates the original tables (schema version 0) and then calls
+migrate(), which applies every migration newer than the stored version,
+each in its own transaction. --check prints EXPLAIN QUERY PLAN for the hot
+lookups and exits with status 1 if any of them scans a table instead of
+using an index.
+"""
+import argparse
+import logging
+import re
+import sys
+
+import config
+
+def _add_lookup_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_meal_plans_goal ON meal_plans (goal, day)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recipes_meal_type ON recipes (meal_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_recipe ON recipe_ingredients (recipe_id)")
+    # Natural keys for idempotent imports (importer.py upserts on name)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_recipes_name ON recipes (name)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_food_data_name ON food_data (name)")
+
+# Macros of the recipes seeded before nutrition columns existed
+_SEED_MACROS = {
+    'Омлет с овощами и сыром': (22, 26, 7),
+    'Греческий салат с курицей': (35, 24, 10),
+    'Запеченный лосось с овощами': (32, 22, 14),
+    'Протеиновые панкейки с ягодами': (24, 6, 28),
+    'Протеиновый смузи': (28, 5, 38),
+}
+
+def parse_calories(text):
+    """350, '350', 'Около 350 ккал' -> 350.0; None when there is no number."""
+    if text is None or isinstance(text, (int, float)):
+        return text
+    match = re.search(r'\d+(?:[.,]\d+)?', str(text))
+    return float(match.group().replace(',', '.')) if match else None
+
+def _numeric_recipe_nutrition(cursor):
+    # SQLite cannot change a column type in place: rebuild the table. Its
+    # triggers go with the old table and are recreated by init_db().
+    cursor.execute('''
+    CREATE TABLE recipes_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        meal_type TEXT NOT NULL,
+        name TEXT NOT NULL,
+        instructions TEXT,
+        calories REAL,
+        protein REAL,
+        fats REAL,
+        carbs REAL,
+        image_url TEXT
+    )
+    ''')
+    rows = cursor.execute("SELECT id, meal_type, name, instructions, calories, image_url FROM recipes").fetchall()
+    cursor.executemany(
+        "INSERT INTO recipes_new (id, meal_type, name, instructions, calories, protein, fats, carbs, image_url) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (recipe_id, meal_type, name, instructions, parse_calories(calories),
+             *_SEED_MACROS.get(name, (None, None, None)), image_url)
+            for recipe_id, meal_type, name, instructions, calories, image_url in rows
+        ]
+    )
+    cursor.execute("DROP TABLE recipes")
+    cursor.execute("ALTER TABLE recipes_new RENAME TO recipes")
+    cursor.execute("CREATE INDEX idx_recipes_meal_type ON recipes (meal_type)")
+    cursor.execute("CREATE UNIQUE INDEX idx_recipes_name ON recipes (name)")
+    cursor.execute("CREATE INDEX idx_recipes_calories ON recipes (calories)")
+
+def _recipe_search(cursor):
+    # One document per recipe (rowid = recipes.id). Kept in sync by triggers
+    # created in init_db(); queries are stemmed on the Python side (search.py)
+    # and run as prefix queries, which the prefix indexes answer without
+    # merging the doclists of every word form.
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5(
+        name, ingredients, instructions,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4 5 6 7'
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO recipe_search (rowid, name, ingredients, instructions)
+    SELECT recipes.id, recipes.name,
+        (SELECT group_concat(ingredient, ' ') FROM recipe_ingredients WHERE recipe_id = recipes.id),
+        recipes.instructions
+    FROM recipes
+    ''')
+
+def _user_targets(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_targets (
+        user_id INTEGER PRIMARY KEY,
+        calories REAL NOT NULL,
+        protein REAL NOT NULL,
+        fats REAL NOT NULL,
+        carbs REAL NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _ingredient_nutrition(cursor):
+    # Filled by recipe_nutrition.py; see the triggers in database.init_db()
+    cursor.execute("ALTER TABLE recipe_ingredients ADD COLUMN food_id INTEGER")
+    cursor.execute("ALTER TABLE recipe_ingredients ADD COLUMN grams REAL")
+    cursor.execute("CREATE INDEX idx_recipe_ingredients_food ON recipe_ingredients (food_id)")
+    cursor.execute('''
+    CREATE TABLE recipe_nutrition (
+        recipe_id INTEGER PRIMARY KEY,
+        calories REAL,
+        protein REAL,
+        fats REAL,
+        carbs REAL,
+        ingredients INTEGER,
+        matched INTEGER,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    # relink = 0: only the values of linked foods changed, sums need recomputing
+    cursor.execute("CREATE TABLE recipe_nutrition_dirty (recipe_id INTEGER PRIMARY KEY, relink INTEGER NOT NULL DEFAULT 1)")
+    cursor.execute("INSERT INTO recipe_nutrition_dirty (recipe_id) SELECT id FROM recipes")
+    # The search trigger fired on every column; init_db() recreates it for
+    # ingredient edits only, so linking ingredients does not rewrite the index
+    cursor.execute("DROP TRIGGER IF EXISTS recipe_ingredients_search_update")
+
+def _user_last_seen(cursor):
+    # Written in batches by user_writer.py
+    cursor.execute("ALTER TABLE users ADD COLUMN last_seen TIMESTAMP")
+
+def _leases(cursor):
+    # Leader election between the worker processes of supervisor.py
+    cursor.execute('''
+    CREATE TABLE leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''')
+
+def _conversations(cursor):
+    # Sessions of conversation.Conversations; data is JSON
+    cursor.execute('''
+    CREATE TABLE conversations (
+        chat_id INTEGER PRIMARY KEY,
+        state TEXT NOT NULL,
+        data TEXT,
+        expires_at REAL NOT NULL
+    )
+    ''')
+
+def _search_trigger_recipe_id(cursor):
+    # init_db() recreates it to also fire when a row moves to another recipe
+    cursor.execute("DROP TRIGGER IF EXISTS recipe_ingredients_search_update")
+
+def _deferred_indexes(cursor):
+    # Indexes importer.py dropped for a bulk load; a row left behind by a
+    # killed import is rebuilt by database.restore_deferred_indexes()
+    cursor.execute('''
+    CREATE TABLE deferred_indexes (
+        name TEXT PRIMARY KEY,
+        sql TEXT NOT NULL
+    )
+    ''')
+
+# (version, description, function(cursor)); append only, never renumber
+MIGRATIONS = [
+    (1, "indexes for plan, recipe, ingredient and food lookups", _add_lookup_indexes),
+    (2, "numeric recipe calories and macros", _numeric_recipe_nutrition),
+    (3, "full-text recipe search", _recipe_search),
+    (4, "daily calorie and macro targets", _user_targets),
+    (5, "ingredient links and computed recipe nutrition", _ingredient_nutrition),
+    (6, "last activity time of users", _user_last_seen),
+    (7, "leases for leader election between processes", _leases),
+    (8, "conversation state of chats", _conversations),
+    (9, "re-index both recipes when an ingredient moves", _search_trigger_recipe_id),
+    (10, "indexes dropped by an unfinished import", _deferred_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations; returns the list of versions applied."""
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            apply(conn.cursor())
+            # Cached reference data may no longer match the new schema
+            conn.execute("UPDATE reference_version SET version = version + 1 WHERE id = 1")
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logging.info(f"Database migrated to version {version}: {description}")
+        applied.append(version)
+    return applied
+
+def hot_queries():
+    """Capture the SQL of the hot lookups by running them with a trace callback."""
+    import database
+
+    statements = []
+    conn = database.get_connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        database._load_meal_plan('Похудение')
+        database._load_recipe('Завтрак')
+        database.get_recipe_by_id(1)
+    finally:
+        conn.set_trace_callback(None)
+    return [statement for statement in statements if statement.lstrip().upper().startswith('SELECT')]
+
+def check_query_plans():
+    """Print query plans of the hot lookups; returns False if one scans a table."""
+    import database
+
+    conn = database.get_connection()
+    ok = True
+    for statement in hot_queries():
+        print(statement)
+        for _, _, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {statement}"):
+            uses_index = 'USING' in detail and ('INDEX' in detail or 'PRIMARY KEY' in detail)
+            if detail.startswith(('SCAN', 'SEARCH')) and not uses_index:
+                ok = False
+                detail += "   <-- no index"
+            print(f"    {detail}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--check', action='store_true', help="verify that the hot lookups use indexes")
+    args = parser.parse_args()
+
+    import database
+
+    database.configure(args.db)
+    database.init_db()
+    print(f"schema version {schema_version(database.get_connection())}")
+    if args.check and not check_query_plans():
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
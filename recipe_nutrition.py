@@ -0,0 +1,156 @@
+"""Recipe calories and macros computed from their ingredients.
+
+    python recipe_nutrition.py [--db users.db] [--all | --relink]
+
+Every recipe_ingredients line is linked to a food_data row and a weight
+(food_id, grams) with the same matcher as /track, and recipe_nutrition
+holds the per-recipe sums. Triggers queue a recipe in recipe_nutrition_dirty
+whenever its ingredients or one of its linked foods change; a plain run
+only handles the queued recipes, and relinks lines only where ingredients
+changed or a linked food was renamed or deleted. --all recomputes every
+recipe from the existing links (a new nutrient table), --relink also
+parses every line again: a new food can match lines that did not match
+before, so use it after importing foods.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+import config
+import database
+
+BATCH = 20000
+
+def parse_ingredient(matcher, food_ids, text):
+    """'150г курицы' -> (food_id, grams); (None, None) when no food is recognised.
+
+    A line naming several foods is linked to the first one. Unlike /track,
+    a line without a quantity ("оливковое масло", "зелень") is not taken as
+    100 g: the food is linked but its weight stays unknown (None).
+    """
+    found = matcher.match(text or '')
+    if not found:
+        return None, None
+    has_quantity = any(char.isdigit() for char in text)
+    return food_ids[found[0]['name']], found[0]['grams'] if has_quantity else None
+
+def _food_table(conn):
+    """Sorted food ids and the matching (n, 4) matrix of values per gram."""
+    rows = conn.execute("SELECT id, calories, protein, fats, carbs FROM food_data ORDER BY id").fetchall()
+    table = np.array(rows, dtype=float).reshape(-1, 5)
+    return table[:, 0].astype(np.int64), np.nan_to_num(table[:, 1:]) / 100.0
+
+# Recipes of the current batch: a rowid range of the temp.nutrition_queue table
+_BATCH_IDS = "SELECT recipe_id FROM nutrition_queue WHERE rowid BETWEEN ? AND ?"
+_BATCH_RELINK_IDS = _BATCH_IDS + " AND relink"
+
+def link(conn, start, stop):
+    """Set food_id and grams on the ingredient lines of the batch's recipes queued for relinking."""
+    matcher = database.get_food_matcher()
+    food_ids = dict(conn.execute("SELECT name, id FROM food_data"))
+    parsed = {}
+    lines = conn.execute(
+        f"SELECT id, ingredient, food_id, grams FROM recipe_ingredients WHERE recipe_id IN ({_BATCH_RELINK_IDS})",
+        (start, stop)
+    ).fetchall()
+    updates = []
+    linked = 0
+    for line_id, text, food_id, grams in lines:
+        # Catalogs repeat lines like "соль по вкусу" a lot
+        if text not in parsed:
+            parsed[text] = parse_ingredient(matcher, food_ids, text)
+        link = parsed[text]
+        linked += link[0] is not None
+        if link != (food_id, grams):
+            updates.append((*link, line_id))
+    conn.executemany("UPDATE recipe_ingredients SET food_id = ?, grams = ? WHERE id = ?", updates)
+    return len(lines), linked
+
+def compute(conn, start, stop, foods):
+    """Replace the recipe_nutrition rows of a batch of queued recipes.
+
+    Sums grams * values per gram over the lines of each recipe linked to a
+    food with a known weight, with bincount; recipes without a single such
+    line get no row.
+    """
+    food_ids, per_gram = foods
+    rows = conn.execute(
+        f"SELECT recipe_id, food_id, grams FROM recipe_ingredients WHERE recipe_id IN ({_BATCH_IDS})", (start, stop)
+    ).fetchall()
+    conn.execute(f"DELETE FROM recipe_nutrition WHERE recipe_id IN ({_BATCH_IDS})", (start, stop))
+    if not rows:
+        return 0
+    lines = np.array(rows, dtype=float).reshape(-1, 3)
+    recipes, owner = np.unique(lines[:, 0].astype(np.int64), return_inverse=True)
+    food = np.nan_to_num(lines[:, 1]).astype(np.int64)  # unlinked lines -> 0, never a food id
+    position = np.searchsorted(food_ids, food)
+    matched = (position < len(food_ids)) & ~np.isnan(lines[:, 2])
+    matched[matched] = food_ids[position[matched]] == food[matched]
+    contributions = np.zeros((len(lines), 4))
+    contributions[matched] = per_gram[position[matched]] * lines[matched, 2][:, None]
+
+    totals = np.stack([np.bincount(owner, weights=contributions[:, i], minlength=len(recipes)) for i in range(4)], axis=1)
+    counts = np.bincount(owner, minlength=len(recipes))
+    matched_counts = np.bincount(owner, weights=matched, minlength=len(recipes)).astype(np.int64)
+    keep = matched_counts > 0
+    conn.executemany(
+        "INSERT INTO recipe_nutrition (recipe_id, calories, protein, fats, carbs, ingredients, matched) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        zip(recipes[keep].tolist(), *totals[keep].T.tolist(), counts[keep].tolist(), matched_counts[keep].tolist())
+    )
+    return int(keep.sum())
+
+def update(full=False, relink=False, batch=BATCH):
+    """Handle the queued recipes, or every recipe with full=True (relinking
+    all lines with relink=True).
+
+    Returns (recipes processed, ingredient lines parsed, of them linked to a food).
+    """
+    conn = database.get_connection()
+    conn.execute("DROP TABLE IF EXISTS temp.nutrition_queue")
+    if full:
+        source = f"SELECT id, {int(relink)} FROM recipes"
+    else:
+        source = "SELECT recipe_id, relink FROM recipe_nutrition_dirty"
+    with conn:
+        conn.execute("CREATE TEMP TABLE nutrition_queue (recipe_id INTEGER, relink INTEGER)")
+        conn.execute(f"INSERT INTO nutrition_queue (recipe_id, relink) {source}")
+    queued = conn.execute("SELECT COUNT(*) FROM nutrition_queue").fetchone()[0]
+    foods = _food_table(conn)
+    lines = linked = 0
+    for start in range(1, queued + 1, batch):
+        stop = start + batch - 1
+        with conn:
+            batch_lines, batch_linked = link(conn, start, stop)
+            compute(conn, start, stop, foods)
+            # Only what was queued when the run started; later changes stay queued
+            conn.execute(f"DELETE FROM recipe_nutrition_dirty WHERE recipe_id IN ({_BATCH_IDS})", (start, stop))
+        lines += batch_lines
+        linked += batch_linked
+    conn.execute("DROP TABLE temp.nutrition_queue")
+    if queued:
+        with conn:
+            # The meal planner reads recipe_nutrition through the reference cache
+            conn.execute("UPDATE reference_version SET version = version + 1 WHERE id = 1")
+        database.invalidate_reference_cache()
+    return queued, lines, linked
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=config.DB_PATH)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--all', action='store_true', help="recompute every recipe from the current links")
+    group.add_argument('--relink', action='store_true', help="parse every ingredient line again, then recompute")
+    args = parser.parse_args()
+
+    database.configure(args.db)
+    database.init_db()
+    started = time.perf_counter()
+    processed, lines, linked = update(full=args.all or args.relink, relink=args.relink)
+    logging.info(f"recipe nutrition: {processed} recipes, {linked} of {lines} ingredient lines linked to foods, "
+                 f"{time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
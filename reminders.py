@@ -0,0 +1,110 @@
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import config
+import database
+import metrics
+
+MEALS = ('Завтрак', 'Обед', 'Ужин')
+DEFAULT_TIMES = ('08:00', '12:00', '18:00')
+
+REMINDER_MESSAGES = {
+    'Завтрак': "Время завтракать! 🍳",
+    'Обед': "Время обедать! 🍲",
+    'Ужин': "Время ужинать! 🍽️"
+}
+
+_TIME_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+MINUTES_PER_DAY = 24 * 60
+
+def utc_minute(local_time, tz_name, now=None):
+    """Minute of the UTC day at which local_time in tz_name falls today."""
+    hours, minutes = map(int, local_time.split(':'))
+    now = now or datetime.now(timezone.utc)
+    local_now = now.astimezone(ZoneInfo(tz_name))
+    local = local_now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    moment = local.astimezone(timezone.utc)
+    return moment.hour * 60 + moment.minute
+
+def parse_reminder_args(text):
+    """Parse "/setreminder [HH:MM HH:MM HH:MM] [Area/City]".
+
+    Returns ({meal: 'HH:MM'}, tz_name); raises ValueError with a message for
+    the user when the arguments cannot be understood.
+    """
+    args = text.split()[1:]
+    tz_name = config.REMINDER_TIMEZONE
+    times = []
+    for arg in args:
+        match = _TIME_RE.match(arg)
+        if match:
+            times.append(f"{int(match.group(1)):02d}:{match.group(2)}")
+            continue
+        try:
+            ZoneInfo(arg)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Не понимаю «{arg}». Укажи время в формате ЧЧ:ММ и, при желании, часовой пояс, например Europe/Moscow.")
+        tz_name = arg
+
+    if not times:
+        times = list(DEFAULT_TIMES)
+    if len(times) != len(MEALS):
+        raise ValueError("Укажи три времени: для завтрака, обеда и ужина, например /setreminder 08:00 12:00 18:00")
+    return dict(zip(MEALS, times)), tz_name
+
+def set_reminders(chat_id, times, tz_name):
+    rows = [(meal, local_time, utc_minute(local_time, tz_name)) for meal, local_time in times.items()]
+    database.set_reminders(chat_id, rows, tz_name)
+
+def refresh_buckets():
+    """Recompute UTC buckets after daylight saving changes.
+
+    Works per distinct (timezone, local time) slot, so the cost does not
+    depend on the number of subscribed chats.
+    """
+    for tz_name, local_time, current in database.get_reminder_slots():
+        minute = utc_minute(local_time, tz_name)
+        if minute != current:
+            database.update_reminder_slot(tz_name, local_time, minute)
+
+def run_scheduler(send, is_leader=None):
+    """Call send(chat_id, meal) for every reminder as its minute comes due.
+
+    Reminders are bucketed by UTC minute of the day (indexed column), so a
+    tick reads only the bucket that is due instead of scanning every job.
+    With several processes (supervisor.py) only the one for which
+    is_leader() is true sends; the others keep up with the clock, so a new
+    leader does not resend minutes the previous one already handled.
+    """
+    last_minute = int(time.time() // 60)
+    last_refresh = None
+    while True:
+        time.sleep(60 - time.time() % 60 + 0.05)
+        now_minute = int(time.time() // 60)
+        first = max(last_minute + 1, now_minute - config.REMINDER_CATCHUP_MINUTES)
+        if is_leader is not None and not is_leader():
+            last_minute = now_minute
+            continue
+
+        try:
+            hour = now_minute // 60
+            if hour != last_refresh:
+                refresh_buckets()
+                last_refresh = hour
+
+            for minute in range(first, now_minute + 1):
+                due = database.get_due_reminders(minute % MINUTES_PER_DAY)
+                if metrics.ENABLED:
+                    metrics.SCHEDULER_LAG_SECONDS.observe(time.time() - minute * 60)
+                    metrics.REMINDERS_DUE.inc(value=len(due))
+                for chat_id, meal in due:
+                    try:
+                        send(chat_id, meal)
+                    except Exception as e:
+                        logging.error(f"Не удалось отправить напоминание в чат {chat_id}: {str(e)}")
+        except Exception as e:
+            logging.error(f"Ошибка планировщика напоминаний: {str(e)}")
+        last_minute = now_minute
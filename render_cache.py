@@ -0,0 +1,134 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+from telebot import types
+
+import config
+import database
+import messages
+import search
+
+class RenderCache:
+    """LRU cache of finished reply texts and serialized reply markups.
+
+    Keys combine the handler name, its arguments and the reference data
+    version, so any change to meal_plans/recipes makes old entries
+    unreachable; they are dropped as soon as a new version is seen.
+    Static replies (help text, keyboards) do not depend on the data and are
+    kept apart from the LRU.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._static = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, handler, args, build):
+        version = database.reference_version()
+        key = (handler, args, version)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = value
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def static(self, key, build):
+        value = self._static.get(key)
+        if value is None:
+            value = self._static.setdefault(key, build())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._static.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'version': self._version}
+
+cache = RenderCache(config.RENDER_CACHE_SIZE)
+
+# Reply markups are stored as JSON strings: telebot sends strings unchanged,
+# so they are serialized once instead of on every reply.
+
+def goal_keyboard():
+    return cache.static('goal_keyboard', lambda: messages.goal_keyboard().to_json())
+
+def meal_type_keyboard():
+    return cache.static('meal_type_keyboard', lambda: messages.meal_type_keyboard().to_json())
+
+def remove_keyboard():
+    return cache.static('remove_keyboard', lambda: types.ReplyKeyboardRemove().to_json())
+
+def track_prompt_markup():
+    return cache.static('track_prompt_markup', lambda: types.ForceReply(selective=True).to_json())
+
+def force_reply_markup():
+    return cache.static('force_reply_markup', lambda: types.ForceReply(selective=True).to_json())
+
+def help_text():
+    return cache.static('help_text', messages.help_text)
+
+def plan_text(goal):
+    return cache.render('plan', goal, lambda: messages.plan_text(goal, database.get_meal_plan(goal)))
+
+def recipe_text(recipe, image_sent):
+    return cache.render('recipe', (recipe['id'], image_sent), lambda: messages.recipe_text(recipe, image_sent))
+
+def search_reply(query):
+    """(text, reply_markup) for a /search query; results change with the reference data."""
+    def build():
+        results = search.search(query)
+        markup = messages.search_keyboard(results).to_json() if results else None
+        return messages.search_text(query, results), markup
+    return cache.render('search', query.strip(), build)
+
+_CATALOGS = {
+    'foods': (database.get_foods_page, 'f', 'fp'),
+    'recipes': (database.get_recipes_page, 'r', 'rp'),
+}
+
+def catalog_page(catalog, cursor=''):
+    """(text, reply_markup) of a catalog page; cursor is '', '>id' or '<id' from the page buttons."""
+    def build():
+        get_page, item_prefix, page_prefix = _CATALOGS[catalog]
+        backward = cursor.startswith('<')
+        cursor_id = int(cursor[1:]) if cursor[1:].isdigit() else None
+        rows, more = get_page(cursor_id, backward, config.CATALOG_PAGE_SIZE)
+        if not rows and cursor_id is not None:
+            # Stale button (its row or everything past it was deleted): start over
+            backward, cursor_id = False, None
+            rows, more = get_page(None, False, config.CATALOG_PAGE_SIZE)
+        if not rows:
+            return messages.CATALOG_EMPTY, None
+        has_prev = more if backward else cursor_id is not None
+        has_next = more if not backward else True
+        markup = messages.catalog_keyboard(rows, item_prefix, page_prefix, has_prev, has_next)
+        return messages.CATALOG_TITLES[catalog], markup.to_json()
+    return cache.render('catalog', (catalog, cursor), build)
+
+def weekly_plan(user_id, targets, week, default=False):
+    """/myplan text; the plan changes with the ISO week and is the same within it."""
+    def build():
+        seed = zlib.crc32(f"{user_id}:{week[0]}:{week[1]}".encode())
+        return messages.weekly_plan_text(targets, database.get_meal_planner().generate(targets, seed), default)
+    return cache.render('weekly_plan', (user_id, targets, week, default), build)
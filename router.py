@@ -0,0 +1,167 @@
+import flood_control
+import metrics
+
+class Router:
+    """Resolves a text message to its handler with dictionary lookups.
+
+    Commands, exact button labels and the prompts of ForceReply flows are
+    compiled into hash tables, so the cost of routing a message does not
+    grow with the number of registered handlers (telebot tests every
+    message_handler filter in turn). Callback queries are routed the same
+    way by the prefix of their data. The bot registers a single telebot
+    handler of each kind that calls dispatch() / dispatch_callback().
+
+    With a flood_control.FloodControl limiter, every update is checked
+    against its sender's budgets before the handler runs.
+
+    With a conversation.Conversations store, a message of a chat that is
+    in the middle of a conversation goes to the handler of its state
+    (after commands and buttons, before reply prompts); a command ends the
+    conversation.
+    """
+
+    def __init__(self, limiter=None, conversations=None):
+        self.commands = {}
+        self.texts = {}
+        self.states = {}
+        self.replies = {}
+        self.callbacks = {}
+        self._reply_lengths = []
+        self.fallback = None
+        self.limiter = limiter
+        self.conversations = conversations
+        self.throttled_handler = None
+        self.throttled_callback_handler = None
+
+    def command(self, *names):
+        def decorator(handler):
+            for name in names:
+                self.commands[name.lower()] = handler
+            return handler
+        return decorator
+
+    def text(self, *labels):
+        def decorator(handler):
+            for label in labels:
+                self.texts[label] = handler
+            return handler
+        return decorator
+
+    def state(self, *names):
+        """Handle the messages of chats whose conversation is in one of the states."""
+        def decorator(handler):
+            for name in names:
+                self.states[name] = handler
+            return handler
+        return decorator
+
+    def reply(self, prompt_prefix):
+        """Handle replies to a bot message whose text starts with prompt_prefix."""
+        def decorator(handler):
+            self.replies[prompt_prefix] = handler
+            self._reply_lengths = sorted({len(prefix) for prefix in self.replies}, reverse=True)
+            return handler
+        return decorator
+
+    def callback(self, *prefixes):
+        """Handle callback queries whose data is "<prefix>:<payload>"."""
+        def decorator(handler):
+            for prefix in prefixes:
+                self.callbacks[prefix] = handler
+            return handler
+        return decorator
+
+    def default(self, handler):
+        self.fallback = handler
+        return handler
+
+    def throttled(self, handler):
+        """Handle the first message of a user who went over a flood budget."""
+        self.throttled_handler = handler
+        return handler
+
+    def throttled_callback(self, handler):
+        self.throttled_callback_handler = handler
+        return handler
+
+    def _limit(self, user, handler, throttled_handler):
+        """The handler to run for an update of `user` after flood control (None to drop it)."""
+        if handler is None or self.limiter is None or user is None:
+            return handler
+        verdict = self.limiter.check(user.id, handler.__name__)
+        if verdict == flood_control.WARN:
+            return throttled_handler
+        if verdict == flood_control.DROP:
+            return None
+        flood_control.set_degraded(verdict == flood_control.DEGRADE)
+        return handler
+
+    def resolve(self, message):
+        text = message.text
+        if not text:
+            return None
+        if text[0] == '/':
+            name = text.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+            handler = self.commands.get(name)
+            if handler:
+                if self.conversations is not None:
+                    self.conversations.end(message.chat.id)
+                return handler
+        handler = self.texts.get(text)
+        if handler:
+            return handler
+        if self.conversations is not None:
+            state = self.conversations.state(message.chat.id)
+            if state is not None:
+                handler = self.states.get(state)
+                if handler:
+                    return handler
+        reply = message.reply_to_message
+        if reply is not None and reply.text:
+            for length in self._reply_lengths:
+                handler = self.replies.get(reply.text[:length])
+                if handler:
+                    return handler
+        return self.fallback
+
+    def resolve_callback(self, call):
+        if not call.data:
+            return None
+        return self.callbacks.get(call.data.split(':', 1)[0])
+
+    def dispatch(self, message):
+        handler = self._limit(message.from_user, self.resolve(message), self.throttled_handler)
+        if handler is None:
+            return None
+        if not metrics.ENABLED:
+            return handler(message)
+        with metrics.timer(metrics.HANDLER_SECONDS, handler.__name__, errors=metrics.HANDLER_ERRORS):
+            return handler(message)
+
+    async def dispatch_async(self, message):
+        """dispatch() for coroutine handlers (async_main.py)."""
+        handler = self._limit(message.from_user, self.resolve(message), self.throttled_handler)
+        if handler is None:
+            return None
+        if not metrics.ENABLED:
+            return await handler(message)
+        with metrics.timer(metrics.HANDLER_SECONDS, handler.__name__, errors=metrics.HANDLER_ERRORS):
+            return await handler(message)
+
+    def dispatch_callback(self, call):
+        handler = self._limit(call.from_user, self.resolve_callback(call), self.throttled_callback_handler)
+        if handler is None:
+            return None
+        if not metrics.ENABLED:
+            return handler(call)
+        with metrics.timer(metrics.HANDLER_SECONDS, handler.__name__, errors=metrics.HANDLER_ERRORS):
+            return handler(call)
+
+    async def dispatch_callback_async(self, call):
+        handler = self._limit(call.from_user, self.resolve_callback(call), self.throttled_callback_handler)
+        if handler is None:
+            return None
+        if not metrics.ENABLED:
+            return await handler(call)
+        with metrics.timer(metrics.HANDLER_SECONDS, handler.__name__, errors=metrics.HANDLER_ERRORS):
+            return await handler(call)
@@ -0,0 +1,101 @@
+import re
+
+import database
+import food_matcher
+
+# /search query parsing: free text becomes stemmed FTS5 prefix terms, and a
+# calorie range can be given as "300-500", "до 400" / "<400" or "от 300" / ">300".
+
+STOP_WORDS = {
+    'что', 'как', 'из', 'и', 'с', 'со', 'в', 'во', 'на', 'для', 'без', 'или', 'а', 'по', 'к',
+    'приготовить', 'сделать', 'рецепт', 'рецепты', 'блюдо', 'блюда', 'хочу', 'можно', 'ккал', 'калорий'
+}
+
+_RANGE_RE = re.compile(r'(\d+)\s*[-–]\s*(\d+)')
+_MAX_RE = re.compile(r'(?:до|<|<=|не более)\s*(\d+)')
+_MIN_RE = re.compile(r'(?:от|>|>=|не менее)\s*(\d+)')
+
+MAX_RESULTS = 8
+# Longest prefix indexed by recipe_search (see migrations._recipe_search)
+MAX_PREFIX = 7
+# A term found in more recipes than this is too broad for bm25() over all
+# of its matches; such queries rank this many candidates instead
+CANDIDATES = 64
+# Column weights of the candidate ranking, as in database.search_recipes
+NAME_WEIGHT = 10.0
+INGREDIENTS_WEIGHT = 5.0
+
+def parse_query(text):
+    """Return (stems, min_calories, max_calories) for a search text."""
+    text = text.lower()
+    min_calories = max_calories = None
+    match = _RANGE_RE.search(text)
+    if match:
+        min_calories, max_calories = sorted((int(match.group(1)), int(match.group(2))))
+        text = text[:match.start()] + ' ' + text[match.end():]
+    else:
+        match = _MAX_RE.search(text)
+        if match:
+            max_calories = int(match.group(1))
+            text = text[:match.start()] + ' ' + text[match.end():]
+        match = _MIN_RE.search(text)
+        if match:
+            min_calories = int(match.group(1))
+            text = text[:match.start()] + ' ' + text[match.end():]
+
+    stems = []
+    for token in food_matcher.tokenize(text):
+        if token[0] == 'word' and token[1] not in STOP_WORDS and len(token[1]) > 1 and token[2] not in stems:
+            stems.append(token[2])
+    return stems, min_calories, max_calories
+
+def match_expression(stems, any_term=False):
+    # Stems only contain letters, so quoting them is enough to be a valid
+    # FTS5 string; the trailing * matches every case ending. Longer stems are
+    # cut to MAX_PREFIX so every term is answered from a prefix index.
+    return (' OR ' if any_term else ' AND ').join(f'"{stem[:MAX_PREFIX]}"*' for stem in stems)
+
+def search(text, limit=MAX_RESULTS):
+    """Ranked (id, name, meal_type, calories) rows for a /search query.
+
+    All terms must match; if nothing does, recipes matching any term are
+    returned instead. A query with only a calorie range lists the recipes in
+    that range. When every term is found in at most CANDIDATES recipes, all
+    matches are ranked by bm25(); a broader query ranks a bounded set of
+    candidates, those with a term in the name first.
+    """
+    stems, min_calories, max_calories = parse_query(text)
+    if not stems:
+        if min_calories is None and max_calories is None:
+            return []
+        return database.get_recipes_by_calories(min_calories, max_calories, limit)
+    broad = any(database.count_matches(match_expression([stem]), CANDIDATES + 1) > CANDIDATES for stem in stems)
+    results = _ranked(stems, match_expression(stems), min_calories, max_calories, limit, broad)
+    if not results and len(stems) > 1:
+        results = _ranked(stems, match_expression(stems, any_term=True), min_calories, max_calories, limit, broad)
+    return results
+
+def _ranked(stems, match, min_calories, max_calories, limit, broad):
+    if not broad:
+        return database.search_recipes(match, min_calories, max_calories, limit)
+    # Recipes with a term in their name come first, the other matches fill
+    # up the candidates; both scans stop after CANDIDATES rows
+    name_match = f'({match}) AND {{name}}: ({match_expression(stems, any_term=True)})'
+    candidates = {}
+    for expression in (name_match, match):
+        for row in database.search_candidates(expression, min_calories, max_calories, CANDIDATES):
+            candidates.setdefault(row[0], row)
+        if len(candidates) >= CANDIDATES:
+            break
+    pattern = re.compile(r'\b(?:' + '|'.join(stem[:MAX_PREFIX] for stem in stems) + ')')
+    ranked = sorted(candidates.values(), key=lambda row: -_score(pattern, row[1], row[4]))
+    return [row[:4] for row in ranked[:limit]]
+
+def _score(pattern, name, ingredients):
+    # bm25-like: saturating term frequency, normalised by the column length
+    score = 0.0
+    for weight, text in ((NAME_WEIGHT, name), (INGREDIENTS_WEIGHT, ingredients or '')):
+        hits = len(pattern.findall(text.lower()))
+        if hits:
+            score += weight * hits / (hits + 1.2 * (0.25 + 0.75 * len(text.split()) / 8))
+    return score
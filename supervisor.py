@@ -0,0 +1,274 @@
+"""Run the bot as one supervisor process and N worker processes.
+
+    python supervisor.py [--processes N]
+
+The supervisor alone receives updates from Telegram (getUpdates or the
+webhook, per UPDATE_MODE) and forwards each one to the worker that owns its
+chat (chat_id % N), so a chat is always handled by the same process and in
+order. Workers run the main.py handlers on ChatWorkers threads and send
+their replies themselves; the reminder scheduler sends only in the worker
+holding the 'reminders' lease in the shared database. The supervisor owns
+the image cache directory: it runs the prefetcher, and workers read the
+cache and hand it the URLs they missed. Each worker serves its metrics on
+METRICS_PORT + 1 + index. main.py runs this when WORKER_PROCESSES > 1.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+from telebot import apihelper
+
+import config
+import database
+import image_cache
+import metrics
+import webhook
+
+class Lease:
+    """A named lease in the shared database, renewed by a background thread.
+
+    held() turns false a third of the ttl before the lease could expire
+    for the other processes, so two holders never overlap.
+    """
+
+    def __init__(self, name, ttl=None):
+        self.name = name
+        self.ttl = ttl or config.LEASE_TTL
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self._held_until = 0.0
+        self._running = False
+
+    def held(self):
+        return time.monotonic() < self._held_until
+
+    def _renew(self):
+        started = time.monotonic()
+        was_held = self.held()
+        try:
+            if database.acquire_lease(self.name, self.holder, self.ttl):
+                self._held_until = started + self.ttl * 2 / 3
+            else:
+                self._held_until = 0.0
+        except Exception as e:
+            logging.error(f"Не удалось продлить аренду {self.name}: {str(e)}")
+        if self.held() != was_held:
+            logging.info(f"Lease {self.name} {'acquired' if self.held() else 'lost'} by {self.holder}")
+
+    def _run(self):
+        while self._running:
+            self._renew()
+            time.sleep(self.ttl / 3)
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._run, name=f'lease-{self.name}', daemon=True).start()
+        return self
+
+    def release(self):
+        self._running = False
+        if self.held():
+            self._held_until = 0.0
+            database.release_lease(self.name, self.holder)
+
+def _forward_misses(misses):
+    def forward(urls):
+        for url in urls:
+            try:
+                misses.put_nowait(url)
+            except queue.Full:
+                # The next warm-up of the supervisor fetches it
+                pass
+    return forward
+
+def _worker(index, processes, updates, misses, db_path, api_url):
+    # Stopped by the supervisor through the queue; SIGTERM still drains
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if api_url:
+        apihelper.API_URL = api_url
+    # The global flood budget is shared by the workers; set before main
+    # (and flood_control) is imported
+    config.FLOOD_GLOBAL_RATE /= processes
+    config.FLOOD_GLOBAL_BURST = max(1, config.FLOOD_GLOBAL_BURST // processes)
+
+    import conversation
+    import main
+    import user_writer
+
+    database.configure(db_path)
+    image_cache.get_cache(forward=_forward_misses(misses))
+    main.start_metrics(port=config.METRICS_PORT + 1 + index)
+    # Handlers run on ChatWorkers threads, which keep per-chat order
+    main.bot.threaded = False
+    lease = Lease('reminders').start()
+    main.start_background(lease.held, (index, processes))
+    chats = webhook.ChatWorkers(main.bot.process_new_updates, spread=processes).start()
+    logging.info(f"Worker {index} started (pid {os.getpid()})")
+    try:
+        while True:
+            data = updates.get()
+            if data is None:
+                break
+            chats.submit(data, block=True)
+    finally:
+        chats.stop(wait=True)
+        lease.release()
+        user_writer.writer.stop()
+        conversation.sessions.stop()
+        logging.info(f"Worker {index} stopped")
+
+class _ForwardingServer(webhook.WebhookServer):
+    def __init__(self, supervisor):
+        super().__init__(None)
+        self.supervisor = supervisor
+
+    def enqueue(self, data):
+        # A full worker queue answers 503 and Telegram retries later
+        return self.supervisor.forward(data, block=False)
+
+class Supervisor:
+    """Worker processes fed with updates sharded by chat id."""
+
+    def __init__(self, processes=None, db_path=None, api_url=None, queue_size=None):
+        self.processes = processes or config.WORKER_PROCESSES
+        self.db_path = db_path or config.DB_PATH
+        self.api_url = api_url
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue(queue_size or config.WORKER_QUEUE_SIZE) for _ in range(self.processes)]
+        # Image URLs the workers did not find in the cache
+        self._misses = self._context.Queue(1000)
+        self._workers = [None] * self.processes
+        self._running = False
+        self.stats = {'forwarded': 0, 'dropped': 0, 'restarts': 0}
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_worker, name=f'worker-{index}',
+            args=(index, self.processes, self._queues[index], self._misses, self.db_path, self.api_url)
+        )
+        process.start()
+        self._workers[index] = process
+
+    def start(self):
+        self._running = True
+        for index in range(self.processes):
+            self._spawn(index)
+        threading.Thread(target=self._monitor, name='supervisor-monitor', daemon=True).start()
+        threading.Thread(target=self._fetch_misses, name='supervisor-image-misses', daemon=True).start()
+        return self
+
+    def _fetch_misses(self):
+        while True:
+            url = self._misses.get()
+            if url is None:
+                return
+            image_cache.get_cache().prefetch([url])
+
+    def _monitor(self):
+        while self._running:
+            time.sleep(1)
+            for index, process in enumerate(self._workers):
+                if self._running and not process.is_alive():
+                    logging.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self.stats['restarts'] += 1
+                    self._spawn(index)
+
+    def forward(self, data, block=True):
+        """Hand an update (a dict) to the worker owning its chat."""
+        index = webhook.update_chat_id(data) % self.processes
+        try:
+            self._queues[index].put(data, block=block)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['forwarded'] += 1
+        return True
+
+    def poll(self):
+        apihelper.delete_webhook(config.TOKEN)
+        offset = None
+        try:
+            while self._running:
+                try:
+                    updates = apihelper.get_updates(config.TOKEN, offset, 100, timeout=20, long_polling_timeout=25)
+                except Exception as e:
+                    logging.error(f"Ошибка getUpdates: {str(e)}")
+                    time.sleep(1)
+                    continue
+                for data in updates:
+                    self.forward(data)
+                    offset = data['update_id'] + 1
+        finally:
+            # Confirm what was forwarded, so a restart does not receive it again
+            if offset:
+                apihelper.get_updates(config.TOKEN, offset, 1, long_polling_timeout=5)
+
+    def serve_webhook(self):
+        server = _ForwardingServer(self)
+        apihelper.set_webhook(
+            config.TOKEN,
+            url=config.WEBHOOK_URL + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            max_connections=config.WEBHOOK_WORKERS
+        )
+        try:
+            server.serve_forever()
+        finally:
+            server.stop()
+
+    def stop(self, timeout=30):
+        """Let every worker drain its queue, then wait for it to exit."""
+        self._running = False
+        self._misses.put(None)
+        for updates in self._queues:
+            updates.put(None)
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self._workers):
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.error(f"Worker {index} did not stop in time, terminating")
+                process.terminate()
+                process.join()
+
+    def queued(self):
+        sizes = {}
+        for index, updates in enumerate(self._queues):
+            try:
+                sizes[f'queued_{index}'] = updates.qsize()
+            except NotImplementedError:  # macOS
+                pass
+        return sizes
+
+def run(processes=None):
+    database.init_db()
+    supervisor = Supervisor(processes).start()
+    image_cache.start_prefetcher(database.get_recipe_image_urls)
+    metrics.register_collector('planeat_supervisor', lambda: dict(supervisor.stats, **supervisor.queued()))
+    metrics.register_collector('planeat_image_cache', lambda: image_cache.get_cache().stats())
+    metrics.start_server()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info(f"Supervisor started with {supervisor.processes} workers")
+    try:
+        if config.UPDATE_MODE == 'webhook':
+            supervisor.serve_webhook()
+        else:
+            supervisor.poll()
+    finally:
+        supervisor.stop()
+        logging.info("Supervisor stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=max(2, config.WORKER_PROCESSES))
+    args = parser.parse_args()
+    run(args.processes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+
+import config
+import database
+
+def _timestamp(seconds):
+    # Same format as CURRENT_TIMESTAMP (UTC)
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+class UserWriter:
+    """Write-behind queue for user registrations and activity.
+
+    Handlers only record what to write; a background thread commits
+    everything queued in one transaction (database.save_user_activity)
+    every `interval` seconds, or as soon as `batch` writes are queued, so a
+    spike of /start costs one commit per batch instead of one per user.
+    Writes to the same user collapse into the latest one. stop() flushes
+    what is left.
+    """
+
+    def __init__(self, interval=None, batch=None):
+        self.interval = interval or config.USER_WRITE_INTERVAL
+        self.batch = batch or config.USER_WRITE_BATCH
+        self._users = {}
+        self._last_seen = {}
+        self._unblocked = set()
+        # Registrations being committed still count as registered
+        self._flushing = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.metrics = {'registered': 0, 'touched': 0, 'written': 0, 'batches': 0, 'errors': 0, 'flush_ms': 0.0}
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='user-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background thread and commit everything still queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def register(self, user_id, username, first_name, last_name, chat_id):
+        """Queue a registration (an upsert); returns True if the user is new."""
+        with self._cond:
+            known = user_id in self._users or user_id in self._flushing
+        # The read stays outside the lock; a concurrent register() of the same
+        # user is caught by the second check below
+        known = known or database.user_exists(user_id)
+        with self._cond:
+            new = not known and user_id not in self._users and user_id not in self._flushing
+            self._users[user_id] = (user_id, username, first_name, last_name, chat_id, _timestamp(time.time()))
+            self._last_seen.pop(user_id, None)
+            self.metrics['registered'] += new
+            self._queued()
+        return new
+
+    def touch(self, user_id):
+        """Record that the user was just active (users.last_seen)."""
+        with self._cond:
+            if user_id in self._users:
+                return
+            self._last_seen[user_id] = time.time()
+            self.metrics['touched'] += 1
+            self._queued()
+
+    def unblock(self, chat_id):
+        """Queue removing the chat from blocked_chats."""
+        with self._cond:
+            self._unblocked.add(chat_id)
+            self._queued()
+
+    def _size(self):
+        # Called with the lock held
+        return len(self._users) + len(self._last_seen) + len(self._unblocked)
+
+    def _queued(self):
+        if self._size() >= self.batch:
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return self._size()
+
+    def flush(self):
+        """Commit everything queued so far; returns the number of writes."""
+        with self._flush_lock:
+            with self._cond:
+                users, self._users = self._users, {}
+                last_seen, self._last_seen = self._last_seen, {}
+                unblocked, self._unblocked = self._unblocked, set()
+                self._flushing = users
+            count = len(users) + len(last_seen) + len(unblocked)
+            if not count:
+                return 0
+            started = time.perf_counter()
+            try:
+                database.save_user_activity(
+                    list(users.values()),
+                    [(_timestamp(seen), user_id) for user_id, seen in last_seen.items()],
+                    unblocked
+                )
+            except Exception as e:
+                logging.error(f"Не удалось записать активность пользователей ({count} записей): {str(e)}")
+                with self._cond:
+                    # Requeue for the next flush; newer writes win
+                    self._users = {**users, **self._users}
+                    self._last_seen = {**last_seen, **self._last_seen}
+                    self._unblocked |= unblocked
+                    self._flushing = {}
+                    self.metrics['errors'] += 1
+                return 0
+            with self._cond:
+                self._flushing = {}
+                self.metrics['written'] += count
+                self.metrics['batches'] += 1
+                self.metrics['flush_ms'] = (time.perf_counter() - started) * 1000
+            return count
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running or self._size() >= self.batch, self.interval)
+                if not self._running:
+                    return
+            self.flush()
+
+    def stats(self):
+        with self._cond:
+            return dict(self.metrics, queued=self._size())
+
+writer = UserWriter()
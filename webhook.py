@@ -0,0 +1,154 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+import config
+
+def update_chat_id(data):
+    """Chat id an update belongs to, used to keep per-chat ordering."""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in data:
+            return data[key]['chat']['id']
+    callback_query = data.get('callback_query')
+    if callback_query:
+        if callback_query.get('message'):
+            return callback_query['message']['chat']['id']
+        return callback_query['from']['id']
+    for key in ('inline_query', 'chosen_inline_result', 'pre_checkout_query', 'shipping_query', 'my_chat_member', 'chat_member'):
+        if key in data:
+            return data[key]['from']['id']
+    return data.get('update_id', 0)
+
+class ChatWorkers:
+    """Pool of threads that handles updates in order per chat.
+
+    Every update goes to one of `workers` queues chosen by chat id, so
+    updates of one chat are handled in order while different chats run in
+    parallel. `spread` is the number of processes the chats were already
+    sharded over (supervisor.py): that part of the chat id is skipped so the
+    chats of one process still use all of its threads.
+    """
+
+    def __init__(self, process_updates, workers=None, queue_size=None, spread=1, stats=None):
+        self.process_updates = process_updates
+        self.workers = workers or config.WEBHOOK_WORKERS
+        self.spread = spread
+        queue_size = queue_size or config.WEBHOOK_QUEUE_SIZE
+        self._queues = [queue.Queue(maxsize=max(1, queue_size // self.workers)) for _ in range(self.workers)]
+        self._threads = []
+        self.stats = stats if stats is not None else {'received': 0, 'dropped': 0, 'processed': 0, 'failed': 0}
+
+    def submit(self, data, block=False):
+        """Queue an update (a dict); False if its queue is full."""
+        shard = update_chat_id(data) // self.spread % self.workers
+        try:
+            self._queues[shard].put(data, block=block)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['received'] += 1
+        return True
+
+    def _worker(self, updates):
+        while True:
+            data = updates.get()
+            if data is None:
+                return
+            try:
+                self.process_updates([types.Update.de_json(data)])
+                self.stats['processed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                logging.error(f"Ошибка при обработке обновления {data.get('update_id')}: {str(e)}")
+
+    def start(self):
+        for i, updates in enumerate(self._queues):
+            thread = threading.Thread(target=self._worker, args=(updates,), name=f'chat-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, wait=False):
+        """Stop the threads once their queues are drained (waiting for it with wait=True)."""
+        for updates in self._queues:
+            updates.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+class WebhookServer:
+    """Embedded HTTP endpoint for Telegram webhook updates.
+
+    Every POST is checked against the secret token, acknowledged right away
+    and handed to ChatWorkers, which keeps per-chat ordering. When the
+    chat's queue is full the server answers 503 and Telegram retries later.
+    """
+
+    def __init__(self, process_updates, host=None, port=None, path=None, secret_token=None,
+                 workers=None, queue_size=None):
+        self.path = path or config.WEBHOOK_PATH
+        self.secret_token = secret_token if secret_token is not None else config.WEBHOOK_SECRET
+        self.stats = {'received': 0, 'rejected': 0, 'dropped': 0, 'processed': 0, 'failed': 0}
+        self.chats = ChatWorkers(process_updates, workers, queue_size, stats=self.stats)
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status):
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+                if server.secret_token and not hmac.compare_digest(token, server.secret_token):
+                    server.stats['rejected'] += 1
+                    self._reply(403)
+                    return
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    self._reply(400)
+                    return
+                self._reply(200 if server.enqueue(data) else 503)
+
+            def do_GET(self):
+                self._reply(200 if self.path == '/healthz' else 404)
+
+            def log_message(self, *args):
+                pass
+
+        self._http = ThreadingHTTPServer((host or config.WEBHOOK_HOST, port or config.WEBHOOK_PORT), Handler)
+        self._http.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._http.server_address[1]
+
+    def enqueue(self, data):
+        return self.chats.submit(data)
+
+    def start(self):
+        self.chats.start()
+        return self
+
+    def serve_forever(self):
+        logging.info(f"Webhook server listening on port {self.port}{self.path}")
+        self._http.serve_forever()
+
+    def stop(self):
+        self._http.shutdown()
+        self._http.server_close()
+        self.chats.stop()